@@ -1,12 +1,18 @@
+import hashlib
 import logging
 import json
 
+from datetime import timedelta
+
 from django.conf import settings
-from django.db.models import Q
-from django.views.decorators.http import require_http_methods
+from django.db.models import Q, Case, When, Value, IntegerField
+from django.utils.http import urlencode
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import require_http_methods, condition
 from django.contrib.auth.decorators import login_required
-from django.core.exceptions import PermissionDenied
+from django.core.exceptions import PermissionDenied, ObjectDoesNotExist
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
 from icommons_common.models import CourseInstance, School, Term, Department, CourseGroup, Person
 from icommons_common.view_utils import create_json_200_response, create_json_500_response
@@ -16,15 +22,18 @@ from icommons_common.auth.lti_decorators import has_account_permission
 from canvas_course_site_wizard.models import BulkCanvasCourseCreationJob, CanvasCourseGenerationJob
 
 from .models import (
+    get_bulk_job_query_set,
     get_course_instance_query_set,
-    get_course_instance_summary_data,
-    get_course_job_summary_data
+    get_cached_course_instance_summary_data,
+    get_course_job_summary_data,
+    get_course_job_version
 )
 from .utils import (
     get_school_data_for_user,
     get_term_data_for_school,
     get_department_data_for_school,
     get_course_group_data_for_school,
+    get_canvas_site_templates_for_school,
 )
 
 logger = logging.getLogger(__name__)
@@ -48,9 +57,225 @@ def _unpack_datatables_params(request):
 @login_required
 @has_account_permission(canvas_api_accounts.ACCOUNT_PERMISSION_MANAGE_COURSES)
 @require_http_methods(['GET'])
+def bulk_jobs(request):
+    """
+    Lists the bulk course creation jobs for the current LTI account using the DataTables GET parameters given.
+    The jobs can be filtered by term (term) and by one or more comma separated status values (status). Paging
+    forward from the previous page can be done by passing the cursor returned for that page as after, in which
+    case the page is found using the sort key rather than an offset (see _get_page()).
+
+    :param request:
+    :return: JSON response containing one page of bulk jobs
+    """
+    result = {}
+    try:
+        (draw, start, limit, sort_index, sort_dir, search) = _unpack_datatables_params(request)
+        sort_field = BULK_JOB_DATA_FIELDS[sort_index]
+        term_id = request.GET.get('term')
+        statuses = [s for s in request.GET.get('status', '').split(',') if s]
+        after_id = request.GET.get('after')
+
+        query_set_all = get_bulk_job_query_set(request.LTI['custom_canvas_account_sis_id'])
+        query_set = query_set_all
+        if term_id:
+            query_set = query_set.filter(sis_term_id=int(term_id))
+        if statuses:
+            query_set = query_set.filter(status__in=statuses)
+
+        result['recordsTotal'] = query_set_all.count()
+        result['recordsFiltered'] = query_set.count() if (term_id or statuses) else result['recordsTotal']
+        result['draw'] = draw
+
+        (jobs, result['cursor']) = _get_page(query_set, sort_field, sort_dir, start, limit, after_id)
+        result['data'] = _get_bulk_job_data(jobs)
+    except Exception:
+        logger.exception(
+            "Failed to get bulk jobs with LTI params %s and GET params %s",
+            json.dumps(request.LTI),
+            json.dumps(request.GET)
+        )
+        result['error'] = 'There was a problem searching for bulk jobs. Please try again.'
+        return create_json_500_response(result)
+
+    return create_json_200_response(result)
+
+
+def _get_page(query_set, sort_field, sort_dir, start, limit, after_id=None):
+    """
+    Returns one page of the given query set, ordered by (sort_field, pk) in sort_dir, along with the cursor for
+    the next page (the pk of the page's last row, or None if this is the last page). If after_id (a cursor
+    returned for the previous page) is given, the page is found by key rather than by offset, so deep pages
+    cost as much as the first; otherwise, or if the key cannot be used, the page starts at offset start.
+    Databases disagree on where NULLs sort, so rows with a null sort value are explicitly put last.
+    """
+    order_by_operator = '-' if sort_dir == 'desc' else ''
+    nullable = _is_nullable(query_set.model, sort_field)
+    ordering = [order_by_operator + sort_field, order_by_operator + 'pk']
+    if nullable:
+        query_set = query_set.annotate(sort_value_is_null=Case(
+            When(**{sort_field + '__isnull': True, 'then': Value(1)}),
+            default=Value(0),
+            output_field=IntegerField()
+        ))
+        ordering.insert(0, 'sort_value_is_null')
+    query_set = query_set.order_by(*ordering)
+    page_query_set = None
+    if after_id:
+        page_query_set = _filter_after(query_set, sort_field, sort_dir, int(after_id), nullable)
+    if page_query_set is None:
+        page_query_set = query_set[start:]
+
+    rows = list(page_query_set[:limit])
+    cursor = rows[-1].pk if len(rows) == limit else None
+    return (rows, cursor)
+
+
+def _is_nullable(model, field_path):
+    """
+    Returns True if the value of the given (possibly related, e.g. course__title) field can be null
+    """
+    names = field_path.split('__')
+    for name in names[:-1]:
+        field = model._meta.get_field(name)
+        if field.null:
+            # a null relation leaves the related field null as well
+            return True
+        model = field.related_model
+    return model._meta.get_field(names[-1]).null
+
+
+def _filter_after(query_set, sort_field, sort_dir, after_id, nullable=False):
+    """
+    Restricts the given query set, which must be ordered as by _get_page() (by sort_field and pk in sort_dir,
+    with rows whose sort_field is null last), to the rows that come after the row with the given pk. Returns
+    None if that row is no longer in the query set, in which case the caller should page by offset.
+    """
+    try:
+        after_value = query_set.values_list(sort_field, flat=True).get(pk=after_id)
+    except ObjectDoesNotExist:
+        return None
+
+    lookup = '__lt' if sort_dir == 'desc' else '__gt'
+    if after_value is None:
+        # only the rest of the null rows, ordered by pk, come after a null row
+        return query_set.filter(**{sort_field + '__isnull': True, 'pk' + lookup: after_id})
+
+    after = Q(**{sort_field + lookup: after_value}) | Q(**{sort_field: after_value, 'pk' + lookup: after_id})
+    if nullable:
+        after |= Q(**{sort_field + '__isnull': True})
+    return query_set.filter(after)
+
+
+def _get_bulk_job_data(jobs):
+    """
+    Builds the DataTables row data for the given bulk jobs. Related records and subjob counts are looked up
+    for all the jobs at once (one query per related table, plus a single grouped subjob count query), and the
+    Canvas site templates are resolved once per school rather than once per job.
+    """
+    creator_ids = set()
+    school_ids = set()
+    term_ids = set()
+    department_ids = set()
+    course_group_ids = set()
+    for bulk_job in jobs:
+        creator_ids.add(bulk_job.created_by_user_id)
+        school_ids.add(bulk_job.school_id)
+        term_ids.add(bulk_job.sis_term_id)
+        if bulk_job.sis_department_id:
+            department_ids.add(bulk_job.sis_department_id)
+        if bulk_job.sis_course_group_id:
+            course_group_ids.add(bulk_job.sis_course_group_id)
+
+    creators = {p.univ_id: p for p in Person.objects.filter(univ_id__in=creator_ids)}
+    schools = School.objects.in_bulk(school_ids)
+    terms = Term.objects.in_bulk(term_ids)
+    departments = {}
+    if department_ids:
+        departments = {
+            id: name for id, name in Department.objects.filter(
+                department_id__in=department_ids
+            ).values_list('department_id', 'name')
+        }
+    course_groups = {}
+    if course_group_ids:
+        course_groups = {
+            id: name for id, name in CourseGroup.objects.filter(
+                course_group_id__in=course_group_ids
+            ).values_list('course_group_id', 'name')
+        }
+    subjob_counts = CanvasCourseGenerationJob.objects.get_subjob_progress_counts([j.id for j in jobs]) if jobs else {}
+    templates = {}
+    for school_id in school_ids:
+        for template in get_canvas_site_templates_for_school(school_id):
+            templates[(school_id, template['canvas_course_id'])] = template
+
+    data = []
+    for bulk_job in jobs:
+        try:
+            creator = creators[bulk_job.created_by_user_id]
+            creator_name = "%s, %s" % (creator.name_last, creator.name_first)
+        except KeyError:
+            # Bulk job creator could not be found
+            logger.warning("Failed to find bulk canvas site job creator %s", bulk_job.created_by_user_id)
+            creator_name = ''
+
+        school = schools[bulk_job.school_id]
+        term = terms[bulk_job.sis_term_id]
+        department = ''
+        if bulk_job.sis_department_id:
+            department = departments[bulk_job.sis_department_id]
+        course_group = ''
+        if bulk_job.sis_course_group_id:
+            course_group = course_groups[bulk_job.sis_course_group_id]
+        counts = subjob_counts.get(bulk_job.id, {})
+
+        data.append({
+            'id': bulk_job.id,
+            'created_at': timezone.localtime(bulk_job.created_at).strftime('%b %d, %Y %H:%M:%S'),
+            'status': bulk_job.status_display_name,
+            'created_by': creator_name,
+            'term': term.display_name,
+            'school': school.title_short,
+            'subaccount': department if department else course_group,
+            'template_canvas_course': templates.get((bulk_job.school_id, bulk_job.template_canvas_course_id)),
+            'count_course_jobs': counts.get('intermediate', 0) + counts.get('terminal', 0)
+        })
+    return data
+
+
+def _get_etag(request, version):
+    """
+    Builds the ETag for a response from the version stamp of the data it shows and the request parameters,
+    leaving out the DataTables draw counter (which changes with every request, but not the response data).
+    """
+    params = sorted((key, value) for (key, values) in request.GET.lists() for value in values if key != 'draw')
+    return hashlib.md5(('%s|%s' % (version, urlencode(params))).encode('utf-8')).hexdigest()
+
+
+def _course_jobs_etag(request, bulk_job_id):
+    return _get_etag(request, get_course_job_version(bulk_job_id))
+
+
+def _course_job_changes_etag(request, bulk_job_id):
+    since = parse_datetime(request.GET.get('since', ''))
+    if since is None:
+        # the view reports the error
+        return None
+    return _get_etag(request, get_course_job_version(bulk_job_id, since))
+
+
+@login_required
+@has_account_permission(canvas_api_accounts.ACCOUNT_PERMISSION_MANAGE_COURSES)
+@require_http_methods(['GET'])
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_course_jobs_etag)
 def course_jobs(request, bulk_job_id):
     """
-    Searches for individual course creation jobs using the GET parameters given
+    Searches for individual course creation jobs using the GET parameters given. Paging forward from the previous
+    page can be done by passing the cursor returned for that page as after (see _get_page()). The watermark
+    returned can be passed to course_job_changes() to find the jobs that change after this response.
+    If none of the bulk job's course jobs have changed since the response with the ETag given in If-None-Match,
+    a 304 Not Modified response is returned instead (see get_course_job_version()).
 
     :param request:
     :return: JSON response containing the list of individual course creation jobs
@@ -58,22 +283,19 @@ def course_jobs(request, bulk_job_id):
     result = {}
     try:
         (draw, start, limit, sort_index, sort_dir, search) = _unpack_datatables_params(request)
+        after_id = request.GET.get('after')
 
-        order_by_operator = '-' if sort_dir == 'desc' else ''
-        query_set_all = CanvasCourseGenerationJob.objects.filter(bulk_job_id=bulk_job_id).order_by(
-            order_by_operator + COURSE_JOB_DATA_FIELDS[sort_index]
-        )
+        query_set_all = CanvasCourseGenerationJob.objects.filter(bulk_job_id=bulk_job_id)
 
+        result['watermark'] = _get_watermark()
         result.update(get_course_job_summary_data(bulk_job_id))
         result['draw'] = draw
 
-        jobs = []
-        creator_ids = []
-        course_instance_ids = []
-        for course_job in query_set_all[start:(start + limit)]:
-            jobs.append(course_job)
-            creator_ids.append(course_job.created_by_user_id)
-            course_instance_ids.append(course_job.sis_course_id)
+        (jobs, result['cursor']) = _get_page(
+            query_set_all, COURSE_JOB_DATA_FIELDS[sort_index], sort_dir, start, limit, after_id
+        )
+        creator_ids = [course_job.created_by_user_id for course_job in jobs]
+        course_instance_ids = [course_job.sis_course_id for course_job in jobs]
 
         creators = {p.univ_id: p for p in Person.objects.filter(univ_id__in=creator_ids)}
         course_instances = {
@@ -116,6 +338,69 @@ def course_jobs(request, bulk_job_id):
     return create_json_200_response(result)
 
 
+@login_required
+@has_account_permission(canvas_api_accounts.ACCOUNT_PERMISSION_MANAGE_COURSES)
+@require_http_methods(['GET'])
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_course_job_changes_etag)
+def course_job_changes(request, bulk_job_id):
+    """
+    Lists the course creation jobs of a bulk job whose status has changed since the watermark given (since), so
+    that a page showing the jobs can keep them up to date without reloading them. Only the fields that change as
+    a job progresses are returned for each job, and the job counts are only returned if any job has changed.
+    While nothing changes, the watermark returned is since itself, so the page keeps polling the same URL and
+    can be answered with 304 Not Modified (the ETag is only recomputed from get_course_job_version()).
+
+    :param request:
+    :param bulk_job_id: The bulk job to find changed course jobs for
+    :return: JSON response containing the changed course jobs and the watermark to pass as since next time
+    """
+    result = {}
+    try:
+        since = parse_datetime(request.GET.get('since', ''))
+        if since is None:
+            raise ValueError("since must be a watermark returned by the course_jobs or course_job_changes API")
+
+        watermark = _get_watermark()
+        changed_jobs = CanvasCourseGenerationJob.objects.filter(
+            bulk_job_id=bulk_job_id,
+            updated_at__gt=since
+        ).values_list('id', 'workflow_state', 'canvas_course_id')
+        result['data'] = [
+            {
+                'id': job_id,
+                'status': CanvasCourseGenerationJob.STATUS_DISPLAY_NAMES[workflow_state],
+                'canvas_course_id': canvas_course_id
+            } for (job_id, workflow_state, canvas_course_id) in changed_jobs
+        ]
+        if result['data']:
+            result['watermark'] = watermark
+            result.update(get_course_job_summary_data(bulk_job_id))
+        else:
+            result['watermark'] = request.GET['since']
+    except Exception:
+        logger.exception(
+            "Failed to get course job changes with LTI params %s and GET params %s",
+            json.dumps(request.LTI),
+            json.dumps(request.GET)
+        )
+        result['error'] = 'There was a problem checking for course job changes. Please try again.'
+        return create_json_500_response(result)
+
+    return create_json_200_response(result)
+
+
+def _get_watermark():
+    """
+    Returns the watermark for a response listing course jobs: the time from which the next request for changes
+    should look. It is set back by BULK_COURSE_CREATION['course_job_changes_overlap_secs'], since a job's
+    updated_at is set before the change is committed; jobs that change around the watermark are returned twice
+    rather than missed.
+    """
+    overlap_secs = settings.BULK_COURSE_CREATION.get('course_job_changes_overlap_secs', 10)
+    return (timezone.now() - timedelta(seconds=overlap_secs)).isoformat()
+
+
 @login_required
 @has_account_permission(canvas_api_accounts.ACCOUNT_PERMISSION_MANAGE_COURSES)
 @require_http_methods(['GET'])
@@ -200,7 +485,8 @@ def course_groups(request, sis_account_id):
 @require_http_methods(['GET'])
 def course_instances(request, sis_term_id, sis_account_id):
     """
-    Searches for course instances using the GET parameters given
+    Searches for course instances using the GET parameters given. Paging forward from the previous page can be
+    done by passing the cursor returned for that page as after (see _get_page()).
 
     :param request:
     :param sis_term_id: The SIS term to find course instances for
@@ -210,6 +496,7 @@ def course_instances(request, sis_term_id, sis_account_id):
     result = {}
     try:
         (draw, start, limit, sort_index, sort_dir, search) = _unpack_datatables_params(request)
+        after_id = request.GET.get('after')
 
         query_set = get_course_instance_query_set(sis_term_id, sis_account_id)
         query_set = query_set.select_related('course')
@@ -225,17 +512,23 @@ def course_instances(request, sis_term_id, sis_account_id):
                 Q(title__icontains=search)
             )
 
-        order_by_operator = '-' if sort_dir == 'desc' else ''
-        query_set = query_set.order_by(order_by_operator + COURSE_INSTANCE_DATA_FIELDS[sort_index])
-
         # fixes TLT-1570 where courses that already have a Canvas course were showing up
         # in the create list
         query_set = query_set.exclude(canvas_course_id__isnull=False)
 
-        result = get_course_instance_summary_data(query_set)
+        # copy the cached summary, since the page data is added to the result below
+        result = dict(get_cached_course_instance_summary_data(
+            query_set,
+            sis_term_id,
+            sis_account_id,
+            variant='without_canvas_site:%s' % (search or '')
+        ))
 
+        (course_instances, result['cursor']) = _get_page(
+            query_set, COURSE_INSTANCE_DATA_FIELDS[sort_index], sort_dir, start, limit, after_id
+        )
         data = []
-        for ci in query_set[start:(start + limit)]:
+        for ci in course_instances:
             # Get associated iSites keywords and external URL if present(TLT-1578)
             sites = [site.external_id for site in ci.sites.all() if site.site_type_id in ['isite', 'external']]
             official = [site_map.map_type_id for site_map in ci.sitemap_set.all()]
@@ -277,7 +570,7 @@ def course_instance_summary(request, sis_term_id, sis_account_id):
     result = {}
     try:
         query_set = get_course_instance_query_set(sis_term_id, sis_account_id)
-        result = get_course_instance_summary_data(query_set)
+        result = get_cached_course_instance_summary_data(query_set, sis_term_id, sis_account_id)
     except Exception:
         logger.exception(
             "Failed to get course_instance_summary with LTI params %s and GET params %s",
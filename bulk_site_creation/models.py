@@ -1,8 +1,15 @@
+import hashlib
+
 from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q, Count, Max, Case, When, IntegerField
 
 from icommons_common.models import CourseInstance
 
-from canvas_course_site_wizard.models import CanvasCourseGenerationJob
+from canvas_course_site_wizard.canvas_cache import get_term_course_data_version
+from canvas_course_site_wizard.models import BulkCanvasCourseCreationJob, CanvasCourseGenerationJob
+
+CACHE_KEY_COURSE_INSTANCE_SUMMARY = "course-instance-summary_%s_%s_%s_%s"
 
 
 def get_course_instance_query_set(sis_term_id, sis_account_id):
@@ -19,45 +26,110 @@ def get_course_instance_query_set(sis_term_id, sis_account_id):
     return CourseInstance.objects.filter(**filters)
 
 
+def get_bulk_job_query_set(sis_account_id):
+    filters = {}
+
+    (account_type, account_id) = sis_account_id.split(':')
+    if account_type == 'school':
+        filters['school_id'] = account_id
+    elif account_type == 'dept':
+        filters['sis_department_id'] = account_id
+    elif account_type == 'coursegroup':
+        filters['sis_course_group_id'] = account_id
+
+    return BulkCanvasCourseCreationJob.objects.filter(**filters)
+
+
+def _count_course_instances(condition):
+    """
+    Builds an aggregate counting the distinct course instances for which the (single-row) condition holds.
+    """
+    return Count(Case(When(condition, then='pk'), output_field=IntegerField()), distinct=True)
+
+
 def get_course_instance_summary_data(query_set):
-    total_count = query_set.count()
-
-    query_set_without_canvas_site = query_set.filter(canvas_course_id__isnull=True)
-    total_without_canvas_site_count = query_set_without_canvas_site.count()
-    total_without_canvas_site_with_isites_count = query_set_without_canvas_site.filter(
-        sitemap__course_site__site_type_id='isite'
-    ).count()
-    total_without_canvas_site_with_external_count = query_set_without_canvas_site.filter(
-        sitemap__course_site__site_type_id='external'
-    ).exclude(sitemap__course_site__external_id__icontains=settings.CANVAS_URL).count()
-
-    query_set_with_canvas_site = query_set.filter(canvas_course_id__isnull=False)
-    total_with_canvas_site_count = query_set_with_canvas_site.count()
-    total_with_canvas_site_with_isites_count = query_set_with_canvas_site.filter(
-        sitemap__course_site__site_type_id='isite'
-    ).count()
-    total_with_canvas_site_with_external_count = query_set_with_canvas_site.filter(
-        sitemap__course_site__site_type_id='external'
-    ).exclude(sitemap__course_site__external_id__icontains=settings.CANVAS_URL).count()
+    """
+    Counts the course instances in query_set, broken down by whether they already have a Canvas site and by the
+    type of any other site mapped to them. All figures are computed with a single conditional aggregation query.
+    """
+    without_canvas_site = Q(canvas_course_id__isnull=True)
+    with_canvas_site = Q(canvas_course_id__isnull=False)
+    isite = Q(sitemap__course_site__site_type_id='isite')
+    external = Q(sitemap__course_site__site_type_id='external')
+    # as with the .exclude() this replaced, a course instance mapped to any Canvas site is left out of the external
+    # site counts altogether, not just the rows of its Canvas sitemaps
+    not_mapped_to_canvas = ~Q(pk__in=CourseInstance.objects.filter(
+        sitemap__course_site__external_id__icontains=settings.CANVAS_URL).values('pk'))
+
+    counts = query_set.aggregate(
+        total=Count('pk', distinct=True),
+        without_canvas_site=_count_course_instances(without_canvas_site),
+        without_canvas_site_with_isites=_count_course_instances(without_canvas_site & isite),
+        without_canvas_site_with_external=_count_course_instances(
+            without_canvas_site & external & not_mapped_to_canvas),
+        with_canvas_site=_count_course_instances(with_canvas_site),
+        with_canvas_site_with_isites=_count_course_instances(with_canvas_site & isite),
+        with_canvas_site_with_external=_count_course_instances(
+            with_canvas_site & external & not_mapped_to_canvas),
+    )
 
     return {
-        'recordsTotal': total_count,
-        'recordsFiltered': total_count,
-        'recordsTotalWithoutCanvasSite': total_without_canvas_site_count,
-        'recordsTotalWithoutCanvasSiteWithISite': total_without_canvas_site_with_isites_count,
-        'recordsTotalWithoutCanvasSiteWithExternal': total_without_canvas_site_with_external_count,
-        'recordsTotalWithCanvasSite': total_with_canvas_site_count,
-        'recordsTotalWithCanvasSiteWithISite': total_with_canvas_site_with_isites_count,
-        'recordsTotalWithCanvasSiteWithExternal': total_with_canvas_site_with_external_count,
+        'recordsTotal': counts['total'],
+        'recordsFiltered': counts['total'],
+        'recordsTotalWithoutCanvasSite': counts['without_canvas_site'],
+        'recordsTotalWithoutCanvasSiteWithISite': counts['without_canvas_site_with_isites'],
+        'recordsTotalWithoutCanvasSiteWithExternal': counts['without_canvas_site_with_external'],
+        'recordsTotalWithCanvasSite': counts['with_canvas_site'],
+        'recordsTotalWithCanvasSiteWithISite': counts['with_canvas_site_with_isites'],
+        'recordsTotalWithCanvasSiteWithExternal': counts['with_canvas_site_with_external'],
     }
 
 
+def get_cached_course_instance_summary_data(query_set, sis_term_id, sis_account_id, variant=''):
+    """
+    Returns get_course_instance_summary_data(query_set), cached for a short time per term and account so that
+    paging, sorting and repeated summary requests do not re-run the aggregate query. Cached summaries are
+    dropped when the term's course data changes (see canvas_cache.invalidate_term_course_data()).
+
+    :param query_set: course instances for sis_term_id and sis_account_id, with any further filters applied
+    :param sis_term_id:
+    :param sis_account_id:
+    :param variant: string identifying any filters applied to query_set beyond term and account (e.g. a search)
+    :return: dict of course instance counts
+    """
+    cache_key = CACHE_KEY_COURSE_INSTANCE_SUMMARY % (
+        get_term_course_data_version(sis_term_id),
+        sis_term_id,
+        sis_account_id,
+        hashlib.md5(variant.encode('utf-8')).hexdigest()
+    )
+    summary = cache.get(cache_key)
+    if summary is None:
+        summary = get_course_instance_summary_data(query_set)
+        cache.set(cache_key, summary, settings.BULK_COURSE_CREATION.get('course_instance_summary_timeout_secs', 60))
+    return summary
+
+
 def get_course_job_summary_data(bulk_job_id):
     data = {}
-    total_count = CanvasCourseGenerationJob.objects.filter(bulk_job_id=bulk_job_id).count()
+    state_counts = CanvasCourseGenerationJob.objects.get_workflow_state_counts(bulk_job_id=bulk_job_id)
+    total_count = sum(state_counts.values())
     data['recordsTotal'] = total_count
     data['recordsFiltered'] = total_count
-    data['recordsComplete'] = CanvasCourseGenerationJob.objects.filter_complete(bulk_job_id=bulk_job_id).count()
-    data['recordsSuccessful'] = CanvasCourseGenerationJob.objects.filter_successful(bulk_job_id=bulk_job_id).count()
-    data['recordsFailed'] = CanvasCourseGenerationJob.objects.filter_failed(bulk_job_id=bulk_job_id).count()
+    data['recordsComplete'] = sum(state_counts[s] for s in CanvasCourseGenerationJob.TERMINAL_STATES)
+    data['recordsSuccessful'] = state_counts[CanvasCourseGenerationJob.STATUS_FINALIZED]
+    data['recordsFailed'] = sum(state_counts[s] for s in CanvasCourseGenerationJob.FAILED_STATES)
     return data
+
+
+def get_course_job_version(bulk_job_id, since=None):
+    """
+    Returns a version stamp for the course jobs of a bulk job (only those changed after since, if given), which
+    changes whenever one of them changes state. It is computed with a single aggregate query over the
+    (bulk_job_id, updated_at) index, so it is much cheaper than the job data it stands for.
+    """
+    query_set = CanvasCourseGenerationJob.objects.filter(bulk_job_id=bulk_job_id)
+    if since is not None:
+        query_set = query_set.filter(updated_at__gt=since)
+    stamp = query_set.aggregate(count=Count('id'), latest=Max('updated_at'))
+    return '%s:%s' % (stamp['count'], stamp['latest'].isoformat() if stamp['latest'] else '')
@@ -2,26 +2,73 @@
     /**
      * Angular controller for rendering the audit page.
      */
-    angular.module('app').controller('AuditController', ['$scope', 'djangoUrl', function($scope, djangoUrl) {
+    angular.module('app').controller('AuditController', ['$scope', 'djangoUrl', 'keysetPager', function($scope, djangoUrl, keysetPager) {
+        $scope.filters = {term: '', status: ''};
+        // Requests the next page by key (using the cursor returned for the last page) when paging forward
+        $scope.pager = keysetPager.create();
+
+        // DataTables inserts column data as HTML, so values from the API are escaped as the server-rendered
+        // template used to do
+        $scope.renderTextColumn = function(data, type, row, meta){
+            return _.escape(data);
+        };
+
+        $scope.renderStatusColumn = function(data, type, row, meta){
+            return '<a href="' + _.escape(djangoUrl.reverse('bulk_site_creation:bulk_job_detail', [row.id])) + '">' +
+                _.escape(data) + '</a>';
+        };
+
+        $scope.renderTemplateColumn = function(data, type, row, meta){
+            var column = '';
+            if (data) {
+                column = '<a href="' + _.escape(data.canvas_course_url) + '">' + _.escape(data.canvas_course_name) + '</a>';
+            }
+            return column;
+        };
+
+        $scope.handleFilterChange = function(){
+            $scope.dataTable.ajax.reload();
+        };
+
+        $scope.getRequestData = function(data){
+            data.term = $scope.filters.term;
+            data.status = $scope.filters.status;
+            $scope.pager.prepareRequest(data);
+        };
+
         angular.element(document).ready(function() {
             $scope.dataTable = $('#bulkJobDT').DataTable({
-                dom: '<lf<rt>ip>',
+                serverSide: true,
+                deferRender: true,
+                processing: true,
+                dom: '<l<rt>ip>',
                 language: {
                     lengthMenu: 'Show _MENU_ bulk jobs',
+                    processing: '<img src="' + window.globals.STATIC_URL + 'images/ajax-loader-small.gif" class="loading"/> Searching...',
                     search: 'Search',
                     info: 'Showing _START_ to _END_ of _TOTAL_ bulk jobs',
+                    infoFiltered: '(filtered from _MAX_ total bulk jobs)',
                     emptyTable: 'There are no bulk jobs to display.'
                 },
+                ajax: {
+                    url: djangoUrl.reverse('bulk_site_creation:api_bulk_jobs'),
+                    type: 'GET',
+                    data: $scope.getRequestData,
+                    dataSrc: function(json) {
+                        $scope.pager.handleResponse(json);
+                        return json.data;
+                    }
+                },
                 order: [[0, 'desc']],
                 columns: [
-                    {data: 'created_at'},
-                    {data: 'status'},
-                    {data: 'created_by'},
-                    {data: 'count_course_jobs', className: 'dt-body-right'},
-                    {data: 'school'},
-                    {data: 'term'},
-                    {data: 'subaccount'},
-                    {data: 'template_canvas_course'}
+                    {data: 'created_at', render: $scope.renderTextColumn},
+                    {data: 'status', render: $scope.renderStatusColumn},
+                    {data: 'created_by', orderable: false, render: $scope.renderTextColumn},
+                    {data: 'count_course_jobs', orderable: false, className: 'dt-body-right'},
+                    {data: 'school', orderable: false, render: $scope.renderTextColumn},
+                    {data: 'term', orderable: false, render: $scope.renderTextColumn},
+                    {data: 'subaccount', orderable: false, render: $scope.renderTextColumn},
+                    {data: 'template_canvas_course', orderable: false, render: $scope.renderTemplateColumn}
                 ]
             });
         });
@@ -2,11 +2,16 @@
     /**
      * Angular controller for rendering the course job DataTable and bulk job progress indicators.
      */
-    angular.module('app').controller('BulkJobDetailController', ['$scope', 'bulkJobDetailModel', '$interval', 'djangoUrl', function($scope, bulkJobDetailModel, $interval, djangoUrl) {
+    angular.module('app').controller('BulkJobDetailController', ['$scope', 'bulkJobDetailModel', '$interval', 'djangoUrl', 'keysetPager', function($scope, bulkJobDetailModel, $interval, djangoUrl, keysetPager) {
         $scope.bulkJobDetailModel = bulkJobDetailModel;
+        // Requests the next page by key (using the cursor returned for the last page) when paging forward
+        $scope.pager = keysetPager.create();
         $scope.AUTO_REFRESH_INTERVAL = 20000;  // For automatically refreshing the DataTable
+        $scope.STATUS_COLUMN = 1;
         $scope.bulkJobId = $('#courseJobDT').data('bulk_job_id');
         $scope.dataLoaded = false;
+        // The watermark returned with the jobs shown, used to ask the server only for the jobs changed since
+        $scope.watermark = null;
 
         $scope.renderTitleColumn = function(data, type, row, meta){
             var column = data;
@@ -24,11 +29,58 @@
             return {width: $scope.bulkJobDetailModel.percentageComplete + '%'};
         };
 
+        $scope.updateProgress = function(json){
+            $scope.bulkJobDetailModel.totalCourseJobs = json.recordsTotal;
+            $scope.bulkJobDetailModel.completeCourseJobs = json.recordsComplete;
+            $scope.bulkJobDetailModel.successfulCourseJobs = json.recordsSuccessful;
+            $scope.bulkJobDetailModel.failedCourseJobs = json.recordsFailed;
+            $scope.bulkJobDetailModel.percentageComplete = Math.round((json.recordsComplete/json.recordsTotal) * 100);
+            if ($scope.bulkJobDetailModel.percentageComplete == 100) {
+                // The bulk job is done, so stop auto refresh
+                $scope.stopAutoRefresh();
+            }
+        };
+
+        $scope.applyChanges = function(json){
+            $scope.watermark = json.watermark;
+            if (!json.data.length) {
+                return;
+            }
+            if (json.recordsTotal != $scope.bulkJobDetailModel.totalCourseJobs ||
+                    $scope.dataTable.order()[0][0] == $scope.STATUS_COLUMN) {
+                // the changes may move jobs between pages, so reload the page shown
+                $scope.dataTable.ajax.reload(null, false);
+                return;
+            }
+            var changes = _.indexBy(json.data, 'id');
+            $scope.dataTable.rows().every(function(){
+                var row = this.data();
+                if (changes[row.id]) {
+                    this.data(angular.extend({}, row, changes[row.id]));
+                }
+            });
+            $scope.updateProgress(json);
+        };
+
+        $scope.refresh = function(){
+            if (!$scope.watermark) {
+                $scope.dataTable.ajax.reload(null, false);
+                return;
+            }
+            $.ajax({
+                url: djangoUrl.reverse('bulk_site_creation:api_course_job_changes', [$scope.bulkJobId]),
+                type: 'GET',
+                data: {since: $scope.watermark}
+            }).done(function(json){
+                $scope.$apply(function(){
+                    $scope.applyChanges(json);
+                });
+            });
+        };
+
         var stop;
         $scope.startAutoRefresh = function(){
-            stop = $interval(function(){
-                $scope.dataTable.ajax.reload(null, false);
-            }, $scope.AUTO_REFRESH_INTERVAL);
+            stop = $interval($scope.refresh, $scope.AUTO_REFRESH_INTERVAL);
         };
 
         $scope.stopAutoRefresh = function(){
@@ -53,17 +105,19 @@
                 ajax: {
                     url: djangoUrl.reverse('bulk_site_creation:api_course_jobs', [$scope.bulkJobId]),
                     type: 'GET',
+                    data: function(data) {
+                        $scope.pager.prepareRequest(data);
+                        // Leave the draw counter out of the URL so that an unchanged page has the same URL, and
+                        // the browser can revalidate its cached response (the server answers 304 Not Modified)
+                        $scope.draw = data.draw;
+                        delete data.draw;
+                    },
                     dataSrc: function(json) {
+                        json.draw = $scope.draw;
+                        $scope.pager.handleResponse(json);
                         $scope.dataLoaded = true;
-                        $scope.bulkJobDetailModel.totalCourseJobs = json.recordsTotal;
-                        $scope.bulkJobDetailModel.completeCourseJobs = json.recordsComplete;
-                        $scope.bulkJobDetailModel.successfulCourseJobs = json.recordsSuccessful;
-                        $scope.bulkJobDetailModel.failedCourseJobs = json.recordsFailed;
-                        $scope.bulkJobDetailModel.percentageComplete = Math.round((json.recordsComplete/json.recordsTotal) * 100);
-                        if ($scope.bulkJobDetailModel.percentageComplete == 100) {
-                            // The bulk job is done, so stop auto refresh
-                            $scope.stopAutoRefresh();
-                        }
+                        $scope.watermark = json.watermark;
+                        $scope.updateProgress(json);
                         $scope.$apply();
                         return json.data;
                     }
@@ -2,9 +2,11 @@
     /**
      * Angular controller for rendering the course instance DataTable.
      */
-    angular.module('app').controller('CourseInstanceController', ['$scope', 'courseInstanceModel', 'courseInstanceFilterModel', 'djangoUrl', function($scope, courseInstanceModel, courseInstanceFilterModel, djangoUrl) {
+    angular.module('app').controller('CourseInstanceController', ['$scope', 'courseInstanceModel', 'courseInstanceFilterModel', 'djangoUrl', 'keysetPager', function($scope, courseInstanceModel, courseInstanceFilterModel, djangoUrl, keysetPager) {
         $scope.courseInstanceModel = courseInstanceModel;
         $scope.courseInstanceFilterModel = courseInstanceFilterModel;
+        // Requests the next page by key (using the cursor returned for the last page) when paging forward
+        $scope.pager = keysetPager.create();
         $scope.selectAll = false;
 
         $scope.renderSelectionColumn = function(data, type, row, meta){
@@ -67,8 +69,12 @@
                 ajax: {
                     url: djangoUrl.reverse('bulk_site_creation:api_course_instances', [$scope.courseInstanceFilterModel.filters.term, accountFilterId]),
                     type: 'GET',
-                    data: $scope.courseInstanceFilterModel.filters,
+                    data: function(data) {
+                        angular.extend(data, $scope.courseInstanceFilterModel.filters);
+                        $scope.pager.prepareRequest(data);
+                    },
                     dataSrc: function(json) {
+                        $scope.pager.handleResponse(json);
                         $scope.courseInstanceModel.dataLoaded = true;
                         $scope.courseInstanceModel.totalCourses = json.recordsTotal;
                         $scope.courseInstanceModel.totalCoursesWithCanvasSite = json.recordsTotalWithCanvasSite;
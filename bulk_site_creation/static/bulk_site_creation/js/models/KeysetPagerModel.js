@@ -0,0 +1,36 @@
+(function(){
+    /**
+     * Angular service for paging server side DataTables by key. The API endpoints return a cursor for each page
+     * (the id of its last row); when the next page of the same listing is requested, the cursor is sent as the
+     * after parameter so the server can find that page by key instead of scanning past start rows.
+     */
+    angular.module('app').factory('keysetPager', [function(){
+        // the request parameters that identify a listing, i.e. everything but the page position
+        var listingKey = function(data){
+            return JSON.stringify(_.omit(data, 'draw', 'start', 'after'));
+        };
+
+        return {
+            create: function(){
+                var lastPage = null;
+                return {
+                    // use as (or call from) the DataTables ajax.data function
+                    prepareRequest: function(data){
+                        var page = {start: data.start, length: data.length, listing: listingKey(data)};
+                        if (lastPage && lastPage.cursor && page.start == lastPage.start + lastPage.length &&
+                                page.length == lastPage.length && page.listing == lastPage.listing) {
+                            data.after = lastPage.cursor;
+                        }
+                        lastPage = page;
+                    },
+                    // call from the DataTables ajax.dataSrc function with the response
+                    handleResponse: function(json){
+                        if (lastPage) {
+                            lastPage.cursor = json.cursor;
+                        }
+                    }
+                };
+            }
+        };
+    }]);
+})();
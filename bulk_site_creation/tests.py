@@ -2,12 +2,23 @@ import json
 
 from os import path
 
-from django.test import TestCase
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.test import TestCase, RequestFactory
+from django.utils import timezone
 
-from mock import patch, Mock
+from mock import patch, Mock, MagicMock
 
-from canvas_course_site_wizard.models import CanvasSchoolTemplate
+from icommons_common.models import CourseInstance, CourseSite, SiteMap, SiteMapType
 
+from canvas_course_site_wizard.models import CanvasSchoolTemplate, CanvasCourseGenerationJob
+
+from bulk_site_creation.api import _get_bulk_job_data, _filter_after, _get_page, _get_etag
+from bulk_site_creation.models import (
+    get_course_instance_summary_data,
+    get_cached_course_instance_summary_data,
+    get_course_job_version
+)
 from bulk_site_creation.utils import (
     get_school_data_for_user,
     get_department_data_for_school,
@@ -112,7 +123,7 @@ class UtilsTest(TestCase):
 
         self.assertEqual(result['id'], self.course_group_sis_account_id)
 
-    @patch('bulk_site_creation.utils.get_all_list_data')
+    @patch('bulk_site_creation.utils.get_template_course')
     @patch('bulk_site_creation.utils.CanvasSchoolTemplate.objects.filter')
     def test_get_canvas_site_templates_for_school(self, mock_filter_canvas_school_template, mock_get_course):
         mock_filter_canvas_school_template.return_value = [self.colgsas_template_mock]
@@ -121,7 +132,7 @@ class UtilsTest(TestCase):
 
         self.assertEqual(result, self.colgsas_template_context_data)
 
-    @patch('bulk_site_creation.utils.get_all_list_data')
+    @patch('bulk_site_creation.utils.get_template_course')
     @patch('bulk_site_creation.utils.CanvasSchoolTemplate.objects.filter')
     def test_get_canvas_site_template(self, mock_filter_canvas_school_template, mock_get_course):
         mock_filter_canvas_school_template.return_value = [self.colgsas_template_mock]
@@ -129,3 +140,239 @@ class UtilsTest(TestCase):
         result = get_canvas_site_template('colgsas', self.colgsas_template_mock.template_id)
 
         self.assertEqual(result, self.colgsas_template_context_data[0])
+
+
+class ModelsTest(TestCase):
+    def test_get_course_instance_summary_data_single_query(self):
+        query_set = Mock()
+        query_set.aggregate.return_value = {
+            'total': 10,
+            'without_canvas_site': 7,
+            'without_canvas_site_with_isites': 2,
+            'without_canvas_site_with_external': 1,
+            'with_canvas_site': 3,
+            'with_canvas_site_with_isites': 1,
+            'with_canvas_site_with_external': 0,
+        }
+        result = get_course_instance_summary_data(query_set)
+
+        self.assertEqual(query_set.aggregate.call_count, 1)
+        self.assertFalse(query_set.count.called)
+        self.assertEqual(result['recordsTotal'], 10)
+        self.assertEqual(result['recordsFiltered'], 10)
+        self.assertEqual(result['recordsTotalWithoutCanvasSite'], 7)
+        self.assertEqual(result['recordsTotalWithoutCanvasSiteWithISite'], 2)
+        self.assertEqual(result['recordsTotalWithoutCanvasSiteWithExternal'], 1)
+        self.assertEqual(result['recordsTotalWithCanvasSite'], 3)
+        self.assertEqual(result['recordsTotalWithCanvasSiteWithISite'], 1)
+        self.assertEqual(result['recordsTotalWithCanvasSiteWithExternal'], 0)
+
+    def test_get_course_instance_summary_data_matches_separate_counts(self):
+        """
+        The single aggregate should give the counts of the separate queries it replaced, for course instances
+        mapped to several sites: an instance mapped to any Canvas site is left out of the external site counts
+        entirely, and an instance mapped to several sites of the same type is counted once
+        """
+        map_type = SiteMapType.objects.create(map_type_id='official')
+
+        def create_course_instance(course_instance_id, canvas_course_id, sites):
+            course_instance = CourseInstance.objects.create(course_instance_id=course_instance_id, course_id=1,
+                                                            term_id=4579, exclude_from_isites=0,
+                                                            canvas_course_id=canvas_course_id)
+            for (site_type_id, external_id) in sites:
+                course_site = CourseSite.objects.create(site_type_id=site_type_id, external_id=external_id)
+                SiteMap.objects.create(course_instance=course_instance, course_site=course_site, map_type=map_type)
+
+        canvas_url = settings.CANVAS_URL + '/courses/1'
+        create_course_instance(1, None, [('external', 'http://example.edu/1'), ('external', canvas_url)])
+        create_course_instance(2, None, [('external', 'http://example.edu/2a'), ('external', 'http://example.edu/2b'),
+                                         ('isite', 'k2')])
+        create_course_instance(3, 3, [('isite', 'k3a'), ('isite', 'k3b'), ('external', 'http://example.edu/3')])
+        create_course_instance(4, 4, [('external', canvas_url), ('external', 'http://example.edu/4')])
+        create_course_instance(5, None, [])
+        query_set = CourseInstance.objects.filter(term_id=4579)
+
+        # the separate queries get_course_instance_summary_data() used to run (made distinct, as they double
+        # counted instances with several matching sites)
+        without_canvas_site = query_set.filter(canvas_course_id__isnull=True)
+        with_canvas_site = query_set.filter(canvas_course_id__isnull=False)
+        expected = {
+            'recordsTotal': query_set.count(),
+            'recordsTotalWithoutCanvasSite': without_canvas_site.count(),
+            'recordsTotalWithoutCanvasSiteWithISite': without_canvas_site.filter(
+                sitemap__course_site__site_type_id='isite').distinct().count(),
+            'recordsTotalWithoutCanvasSiteWithExternal': without_canvas_site.filter(
+                sitemap__course_site__site_type_id='external'
+            ).exclude(sitemap__course_site__external_id__icontains=settings.CANVAS_URL).distinct().count(),
+            'recordsTotalWithCanvasSite': with_canvas_site.count(),
+            'recordsTotalWithCanvasSiteWithISite': with_canvas_site.filter(
+                sitemap__course_site__site_type_id='isite').distinct().count(),
+            'recordsTotalWithCanvasSiteWithExternal': with_canvas_site.filter(
+                sitemap__course_site__site_type_id='external'
+            ).exclude(sitemap__course_site__external_id__icontains=settings.CANVAS_URL).distinct().count(),
+        }
+        result = get_course_instance_summary_data(query_set)
+        for (key, count) in expected.items():
+            self.assertEqual(result[key], count, key)
+        self.assertEqual(result['recordsTotalWithoutCanvasSiteWithExternal'], 1)
+        self.assertEqual(result['recordsTotalWithCanvasSiteWithExternal'], 1)
+        self.assertEqual(result['recordsTotalWithCanvasSiteWithISite'], 1)
+
+    @patch('bulk_site_creation.models.get_course_instance_summary_data')
+    @patch('bulk_site_creation.models.get_term_course_data_version')
+    @patch('bulk_site_creation.models.cache')
+    def test_get_cached_course_instance_summary_data_hit(self, mock_cache, mock_version, mock_summary):
+        mock_version.return_value = '1'
+        mock_cache.get.return_value = {'recordsTotal': 10}
+        result = get_cached_course_instance_summary_data(Mock(), 4579, 'school:colgsas')
+
+        self.assertEqual(result, {'recordsTotal': 10})
+        self.assertFalse(mock_summary.called)
+
+    @patch('bulk_site_creation.models.get_course_instance_summary_data')
+    @patch('bulk_site_creation.models.get_term_course_data_version')
+    @patch('bulk_site_creation.models.cache')
+    def test_get_cached_course_instance_summary_data_keyed_on_term_version(self, mock_cache, mock_version,
+                                                                           mock_summary):
+        mock_cache.get.return_value = None
+        mock_summary.return_value = {'recordsTotal': 10}
+        mock_version.return_value = '1'
+        get_cached_course_instance_summary_data(Mock(), 4579, 'school:colgsas')
+        mock_version.return_value = '2'
+        get_cached_course_instance_summary_data(Mock(), 4579, 'school:colgsas')
+
+        (first_key, second_key) = [c[0][0] for c in mock_cache.set.call_args_list]
+        self.assertNotEqual(first_key, second_key)
+        mock_version.assert_called_with(4579)
+
+    def test_get_course_job_version_changes_with_job_state(self):
+        job = CanvasCourseGenerationJob.objects.create(sis_course_id='1', bulk_job_id=7, created_by_user_id='123')
+        CanvasCourseGenerationJob.objects.create(sis_course_id='2', bulk_job_id=8, created_by_user_id='123')
+        version = get_course_job_version(7)
+        self.assertEqual(get_course_job_version(7), version)
+
+        job.workflow_state = CanvasCourseGenerationJob.STATUS_QUEUED
+        job.save(update_fields=['workflow_state'])
+        self.assertNotEqual(get_course_job_version(7), version)
+
+    def test_get_course_job_version_since(self):
+        CanvasCourseGenerationJob.objects.create(sis_course_id='1', bulk_job_id=7, created_by_user_id='123')
+        self.assertEqual(get_course_job_version(7, since=timezone.now()), '0:')
+
+
+class ApiTest(TestCase):
+    @patch('bulk_site_creation.api.get_canvas_site_templates_for_school')
+    @patch('bulk_site_creation.api.CanvasCourseGenerationJob')
+    @patch('bulk_site_creation.api.Term')
+    @patch('bulk_site_creation.api.School')
+    @patch('bulk_site_creation.api.Person')
+    @patch('bulk_site_creation.api.timezone')
+    def test_get_bulk_job_data_batches_lookups(self, mock_timezone, mock_person, mock_school, mock_term,
+                                               mock_course_job, mock_get_templates):
+        jobs = [
+            Mock(id=job_id, created_by_user_id='12345678', school_id='colgsas', sis_term_id=4579,
+                 sis_department_id=None, sis_course_group_id=None, template_canvas_course_id=10)
+            for job_id in (1, 2, 3)
+        ]
+        mock_person.objects.filter.return_value = [Mock(univ_id='12345678', name_last='Last', name_first='First')]
+        mock_school.objects.in_bulk.return_value = {'colgsas': Mock(title_short='FAS')}
+        mock_term.objects.in_bulk.return_value = {4579: Mock(display_name='Fall 2015')}
+        mock_course_job.objects.get_subjob_progress_counts.return_value = {
+            1: {'intermediate': 2, 'terminal': 3},
+            2: {'intermediate': 0, 'terminal': 4}
+        }
+        template = {'canvas_course_id': 10, 'canvas_course_name': 'Template'}
+        mock_get_templates.return_value = [template]
+
+        data = _get_bulk_job_data(jobs)
+
+        mock_course_job.objects.get_subjob_progress_counts.assert_called_once_with([1, 2, 3])
+        mock_get_templates.assert_called_once_with('colgsas')
+        self.assertEqual([row['count_course_jobs'] for row in data], [5, 4, 0])
+        self.assertEqual([row['template_canvas_course'] for row in data], [template] * 3)
+        self.assertEqual(data[0]['created_by'], 'Last, First')
+
+    def test_filter_after_pages_from_sort_key_of_last_row(self):
+        query_set = Mock()
+        query_set.values_list.return_value.get.return_value = 'pending'
+        result = _filter_after(query_set, 'status', 'desc', 42)
+
+        query_set.values_list.assert_called_once_with('status', flat=True)
+        query_set.values_list.return_value.get.assert_called_once_with(pk=42)
+        self.assertEqual(query_set.filter.call_count, 1)
+        self.assertEqual(result, query_set.filter.return_value)
+
+    def test_filter_after_missing_row_falls_back_to_offset(self):
+        query_set = Mock()
+        query_set.values_list.return_value.get.side_effect = ObjectDoesNotExist
+        result = _filter_after(query_set, 'created_at', 'desc', 42)
+
+        self.assertFalse(query_set.filter.called)
+        self.assertIsNone(result)
+
+    def test_filter_after_null_sort_value_pages_through_null_rows(self):
+        query_set = Mock()
+        query_set.values_list.return_value.get.return_value = None
+        result = _filter_after(query_set, 'title', 'asc', 42, nullable=True)
+
+        query_set.filter.assert_called_once_with(title__isnull=True, pk__gt=42)
+        self.assertEqual(result, query_set.filter.return_value)
+
+    @patch('bulk_site_creation.api._filter_after')
+    def test_get_page_by_key(self, mock_filter_after):
+        query_set = MagicMock(model=CanvasCourseGenerationJob)
+        ordered_query_set = query_set.order_by.return_value
+        mock_filter_after.return_value.__getitem__.return_value = [Mock(pk=7), Mock(pk=9)]
+        (rows, cursor) = _get_page(query_set, 'created_at', 'desc', 50, 2, '5')
+
+        query_set.order_by.assert_called_once_with('-created_at', '-pk')
+        mock_filter_after.assert_called_once_with(ordered_query_set, 'created_at', 'desc', 5, False)
+        mock_filter_after.return_value.__getitem__.assert_called_once_with(slice(None, 2))
+        self.assertFalse(ordered_query_set.__getitem__.called)
+        self.assertEqual(cursor, 9)
+
+    @patch('bulk_site_creation.api._filter_after')
+    def test_get_page_by_offset(self, mock_filter_after):
+        query_set = MagicMock(model=CanvasCourseGenerationJob)
+        ordered_query_set = query_set.order_by.return_value
+        ordered_query_set.__getitem__.return_value.__getitem__.return_value = [Mock(pk=7)]
+        (rows, cursor) = _get_page(query_set, 'sis_course_id', 'asc', 50, 2)
+
+        query_set.order_by.assert_called_once_with('sis_course_id', 'pk')
+        self.assertFalse(mock_filter_after.called)
+        ordered_query_set.__getitem__.assert_called_once_with(slice(50, None))
+        self.assertEqual(len(rows), 1)
+        # a short page is the last page
+        self.assertIsNone(cursor)
+
+    def test_get_page_by_key_includes_null_sort_values(self):
+        """ paging by key through a nullable sort field should reach every row, with the null rows last """
+        canvas_course_ids = [3, None, 1, 3, None, 2, None]
+        jobs = [
+            CanvasCourseGenerationJob.objects.create(sis_course_id=str(i), canvas_course_id=canvas_course_id,
+                                                     bulk_job_id=7, created_by_user_id='123')
+            for (i, canvas_course_id) in enumerate(canvas_course_ids)
+        ]
+        query_set = CanvasCourseGenerationJob.objects.filter(bulk_job_id=7)
+        for sort_dir in ('asc', 'desc'):
+            with_ids = sorted([j for j in jobs if j.canvas_course_id is not None],
+                              key=lambda j: (j.canvas_course_id, j.pk), reverse=(sort_dir == 'desc'))
+            without_ids = sorted([j for j in jobs if j.canvas_course_id is None],
+                                 key=lambda j: j.pk, reverse=(sort_dir == 'desc'))
+            pages = []
+            (rows, cursor) = _get_page(query_set, 'canvas_course_id', sort_dir, 0, 2)
+            pages.extend(rows)
+            while cursor:
+                # start is deliberately left at 0, so the pages must be found by key
+                (rows, cursor) = _get_page(query_set, 'canvas_course_id', sort_dir, 0, 2, str(cursor))
+                pages.extend(rows)
+
+            self.assertEqual([j.pk for j in pages], [j.pk for j in with_ids + without_ids])
+
+    def test_get_etag_ignores_draw(self):
+        factory = RequestFactory()
+        etag = _get_etag(factory.get('/', {'draw': 1, 'start': 0, 'length': 10}), '1:')
+
+        self.assertEqual(_get_etag(factory.get('/', {'draw': 2, 'start': 0, 'length': 10}), '1:'), etag)
+        self.assertNotEqual(_get_etag(factory.get('/', {'draw': 2, 'start': 10, 'length': 10}), '1:'), etag)
+        self.assertNotEqual(_get_etag(factory.get('/', {'draw': 1, 'start': 0, 'length': 10}), '2:'), etag)
@@ -18,5 +18,7 @@ urlpatterns = [
     url(r'^api/schools/(?P<sis_account_id>[:\w]+)/course_groups$', api.course_groups, name='api_course_groups'),
     url(r'^api/terms/(?P<sis_term_id>[:\w]+)/accounts/(?P<sis_account_id>[:\w]+)/course_instances$', api.course_instances, name='api_course_instances'),
     url(r'^api/terms/(?P<sis_term_id>[:\w]+)/accounts/(?P<sis_account_id>[:\w]+)/course_instance_summary$', api.course_instance_summary, name='api_course_instance_summary'),
+    url(r'^api/bulk_jobs$', api.bulk_jobs, name='api_bulk_jobs'),
     url(r'^api/bulk_jobs/(?P<bulk_job_id>[\d]+)/course_jobs$', api.course_jobs, name='api_course_jobs'),
+    url(r'^api/bulk_jobs/(?P<bulk_job_id>[\d]+)/course_job_changes$', api.course_job_changes, name='api_course_job_changes'),
 ]
@@ -6,19 +6,15 @@ from datetime import datetime
 from django.conf import settings
 from django.core.cache import cache
 
-from canvas_sdk.utils import get_all_list_data
-from canvas_sdk.methods import courses as canvas_api_courses
-
-from icommons_common.canvas_utils import SessionInactivityExpirationRC
 from icommons_common.canvas_api.helpers import accounts as canvas_api_accounts_helper
 from icommons_common.models import Term
 
+from canvas_course_site_wizard.canvas_cache import get_template_course
 from canvas_course_site_wizard.models import CanvasSchoolTemplate
 
 
 logger = logging.getLogger(__name__)
 
-SDK_CONTEXT = SessionInactivityExpirationRC(**settings.CANVAS_SDK_SETTINGS)
 CACHE_KEY_CANVAS_SITE_TEMPLATES_BY_SCHOOL_ID = "canvas-site-templates-by-school-id_%s"
 
 
@@ -123,12 +119,7 @@ def get_canvas_site_templates_for_school(school_id):
         templates = []
         for t in CanvasSchoolTemplate.objects.filter(school_id=school_id):
             canvas_course_id = t.template_id
-            course = get_all_list_data(
-                SDK_CONTEXT,
-                canvas_api_courses.get_single_course_courses,
-                canvas_course_id,
-                None
-            )
+            course = get_template_course(canvas_course_id)
             templates.append({
                 'canvas_course_name': course['name'],
                 'canvas_course_id': canvas_course_id,
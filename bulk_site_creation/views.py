@@ -10,19 +10,19 @@ from django.contrib.auth.decorators import login_required
 from django.http import HttpResponse
 from django.conf import settings
 from django.core.exceptions import PermissionDenied
-from django.utils import timezone
 
 from ims_lti_py.tool_config import ToolConfig
 
-from icommons_common.models import School, Term, Department, CourseGroup, Person
+from icommons_common.models import School, Term, Department, CourseGroup
 from icommons_common.canvas_api.helpers import accounts as canvas_api_accounts
 from icommons_common.auth.lti_decorators import has_account_permission
 
-from canvas_course_site_wizard.models import BulkCanvasCourseCreationJob, CanvasCourseGenerationJob
+from canvas_course_site_wizard.models import BulkCanvasCourseCreationJob
 
 from .models import (
+    get_bulk_job_query_set,
     get_course_instance_query_set,
-    get_course_instance_summary_data,
+    get_cached_course_instance_summary_data,
     get_course_job_summary_data
 )
 from .utils import (
@@ -142,88 +142,23 @@ def index(request):
 @has_account_permission(canvas_api_accounts.ACCOUNT_PERMISSION_MANAGE_COURSES)
 @require_http_methods(['GET'])
 def audit(request):
-    canvas_user_id = request.LTI['custom_canvas_user_id']
-    sis_account_id = request.LTI['custom_canvas_account_sis_id']
-    (account_type, account_id) = canvas_api_accounts.parse_canvas_account_id(sis_account_id)
-
-    filter_kwargs = {}
-    if account_type == canvas_api_accounts.ACCOUNT_TYPE_SCHOOL:
-        filter_kwargs['school_id'] = account_id
-    elif account_type == canvas_api_accounts.ACCOUNT_TYPE_DEPARTMENT:
-        filter_kwargs['sis_department_id'] = account_id
-    elif account_type == canvas_api_accounts.ACCOUNT_TYPE_COURSE_GROUP:
-        filter_kwargs['sis_course_group_id'] = account_id
-
-    query_set = BulkCanvasCourseCreationJob.objects.filter(**filter_kwargs).order_by('-created_at')
-
-    jobs = []
-    creator_ids = set()
-    school_ids = set()
-    term_ids = set()
-    department_ids = set()
-    course_group_ids = set()
-    for bulk_job in query_set:
-        jobs.append(bulk_job)
-        creator_ids.add(bulk_job.created_by_user_id)
-        school_ids.add(bulk_job.school_id)
-        term_ids.add(bulk_job.sis_term_id)
-        if bulk_job.sis_department_id:
-            department_ids.add(bulk_job.sis_department_id)
-        if bulk_job.sis_course_group_id:
-            course_group_ids.add(bulk_job.sis_course_group_id)
-
-    creators = {p.univ_id: p for p in Person.objects.filter(univ_id__in=creator_ids)}
-    schools = School.objects.in_bulk(school_ids)
-    terms = Term.objects.in_bulk(term_ids)
-    departments = {}
-    if department_ids:
-        departments = {
-            id: name for id, name in Department.objects.filter(
-                department_id__in=department_ids
-            ).values_list('department_id', 'name')
-        }
-    course_groups = {}
-    if course_group_ids:
-        course_groups = {
-            id: name for id, name in CourseGroup.objects.filter(
-                course_group_id__in=course_group_ids
-            ).values_list('course_group_id', 'name')
-        }
-
-    bulk_job_data = []
-    for bulk_job in jobs:
-        try:
-            creator = creators[bulk_job.created_by_user_id]
-            creator_name = "%s, %s" % (creator.name_last, creator.name_first)
-        except KeyError:
-            # Bulk job creator could not be found
-            logger.warning("Failed to find bulk canvas site job creator %s", bulk_job.created_by_user_id)
-            creator_name = ''
-
-        school = schools[bulk_job.school_id]
-        term = terms[bulk_job.sis_term_id]
-        department = ''
-        if bulk_job.sis_department_id:
-            department = departments[bulk_job.sis_department_id]
-        course_group = ''
-        if bulk_job.sis_course_group_id:
-            course_group = course_groups[bulk_job.sis_course_group_id]
-        template_canvas_course = get_canvas_site_template(school.school_id, bulk_job.template_canvas_course_id)
-
-        bulk_job_data.append({
-            'id': bulk_job.id,
-            'created_at': timezone.localtime(bulk_job.created_at).strftime('%b %d, %Y %H:%M:%S'),
-            'status': bulk_job.status_display_name,
-            'created_by': creator_name,
-            'term': term.display_name,
-            'school': school.title_short,
-            'subaccount': department if department else course_group,
-            'template_canvas_course': template_canvas_course,
-            'count_course_jobs': CanvasCourseGenerationJob.objects.filter(bulk_job_id=bulk_job.id).count()
-        })
+    # Bulk job rows are loaded page by page from api.bulk_jobs, so only the filter options are needed here
+    query_set = get_bulk_job_query_set(request.LTI['custom_canvas_account_sis_id'])
+    terms = Term.objects.filter(
+        term_id__in=query_set.values('sis_term_id')
+    ).order_by('-academic_year', 'term_code__sort_order')
+
+    statuses = []
+    for (status, _) in BulkCanvasCourseCreationJob.STATUS_CHOICES:
+        display_name = BulkCanvasCourseCreationJob.STATUS_DISPLAY_NAMES[status]
+        if statuses and statuses[-1]['name'] == display_name:
+            statuses[-1]['value'] += ',' + status
+        else:
+            statuses.append({'name': display_name, 'value': status})
 
     return render(request, 'bulk_site_creation/audit.html', {
-        'bulk_job_data': bulk_job_data
+        'terms': [{'id': str(t.term_id), 'name': t.display_name} for t in terms],
+        'statuses': statuses
     })
 
 
@@ -254,7 +189,7 @@ def course_selection(request):
         account = course_group
 
     ci_query_set = get_course_instance_query_set(term['id'], account['id'])
-    course_instance_summary = get_course_instance_summary_data(ci_query_set)
+    course_instance_summary = get_cached_course_instance_summary_data(ci_query_set, term['id'], account['id'])
 
     return render(request, 'bulk_site_creation/course_selection.html', {
         'filters': ci_filters,
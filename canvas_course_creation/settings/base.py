@@ -207,6 +207,41 @@ CANVAS_SDK_SETTINGS = {
     'session_inactivity_expiration_time_secs': 50,
 }
 
+# Connection pool for the requests session shared by all Canvas SDK calls in a process (see
+# canvas_course_site_wizard.sdk_context). pool_maxsize is the most connections kept open to a single host
+# and should be at least the largest worker thread concurrency configured below; with pool_block, threads
+# wait for a free connection rather than opening extra ones.
+CANVAS_SDK_POOL = {
+    'pool_connections': 4,
+    'pool_maxsize': SECURE_SETTINGS.get('canvas_sdk_pool_maxsize', 10),
+    'pool_block': True,
+}
+
+# Pacing of Canvas API calls against the per-token rate limit (see canvas_course_site_wizard.rate_limit).
+# Canvas's budget refills at about 10 units per second; calls are slowed down and fewer are sent at once while
+# X-Rate-Limit-Remaining is under low_watermark, and more are allowed again while it is over high_watermark.
+CANVAS_API_RATE_LIMIT = {
+    'low_watermark': 200.0,
+    'high_watermark': 500.0,
+    'refill_per_sec': 10.0,
+    'max_in_flight': SECURE_SETTINGS.get('canvas_sdk_pool_maxsize', 10),
+    'max_wait_secs': 30.0,
+    'throttle_retries': 3,
+}
+
+CANVAS_API_CACHE = {
+    # template course settings are shared by every course created from the template
+    'template_course_timeout_secs': 60 * 60,
+    'template_course_local_timeout_secs': 5 * 60,
+    # school template rows are also invalidated whenever a CanvasSchoolTemplate is saved or deleted
+    'school_templates_timeout_secs': 60 * 60,
+    # Canvas user profiles are read to address notification emails, and are only refreshed when these
+    # timeouts expire; users Canvas does not have are remembered for user_profile_missing_timeout_secs
+    'user_profile_timeout_secs': 60 * 60,
+    'user_profile_local_timeout_secs': 5 * 60,
+    'user_profile_missing_timeout_secs': 5 * 60,
+}
+
 ICOMMONS_COMMON = {
     'ICOMMONS_API_HOST': SECURE_SETTINGS.get('icommons_api_host', None),
     'ICOMMONS_API_USER': SECURE_SETTINGS.get('icommons_api_user', None),
@@ -250,6 +285,48 @@ BULK_COURSE_CREATION = {
                                'course sites were created successfully.\n',
     'notification_email_body_failed_count': ' - {} course sites were not '
                                             'created.',
+    # number of worker threads used to set up (create in Canvas) bulk subjobs
+    'setup_concurrency': SECURE_SETTINGS.get('bulk_setup_concurrency', 8),
+    # course instance counts shown while selecting courses are cached for this long
+    'course_instance_summary_timeout_secs': 60,
+    # the watermark returned for polling course job changes is set back by this much, to allow for changes
+    # still being committed when the jobs are read
+    'course_job_changes_overlap_secs': 10,
+}
+
+
+PROCESS_ASYNC_JOBS = {
+    # number of content migration progress requests made to Canvas in parallel; keep this at or below the
+    # SDK session's connection pool size (CANVAS_SDK_POOL['pool_maxsize'])
+    'progress_poll_concurrency': SECURE_SETTINGS.get('progress_poll_concurrency', 10),
+    # bounds for the backoff between progress checks of a queued/running content migration; without a
+    # completion estimate from Canvas, the wait is poll_age_factor times the age of the job
+    'poll_min_interval_secs': 60,
+    'poll_max_interval_secs': 15 * 60,
+    'poll_age_factor': 0.25,
+}
+
+EMAIL_OUTBOX = {
+    # emails sent per run of send_queued_emails (over a single SMTP connection)
+    'batch_size': 100,
+    # transient failures are retried with a doubling delay between these bounds, up to max_attempts times
+    'max_attempts': 5,
+    'retry_min_interval_secs': 60,
+    'retry_max_interval_secs': 60 * 60,
+}
+
+FINALIZE_COURSE_JOBS = {
+    # number of jobs finalized in parallel; each one makes several Canvas API calls (syllabus, sections,
+    # enrollment sync, official flag), so keep this at or below CANVAS_SDK_POOL['pool_maxsize']
+    'finalize_concurrency': SECURE_SETTINGS.get('finalize_concurrency', 4),
+}
+
+JOB_STATUS_UPDATES = {
+    # how long a course creation status page's request waits for the job to move on before it is answered
+    # (and re-sent by the page); keep this below any proxy or load balancer idle timeout
+    'wait_timeout_secs': 25,
+    # how long a job's published workflow_state is kept in the shared cache for waiting requests to read
+    'status_timeout_secs': 5 * 60,
 }
 
 
@@ -257,6 +334,8 @@ BULK_COURSE_CREATION = {
 #   * If created in another directory, ensure the directory exists in runtime environment
 PROCESS_ASYNC_JOBS_PID_FILE = 'process_async_jobs.pid'
 FINALIZE_BULK_CREATE_JOBS_PID_FILE = 'finalize_bulk_create_jobs.pid'
+FINALIZE_COURSE_JOBS_PID_FILE = 'finalize_course_jobs.pid'
+SEND_QUEUED_EMAILS_PID_FILE = 'send_queued_emails.pid'
 
 _LOG_ROOT = SECURE_SETTINGS.get('log_root', '')  # Default to current directory
 
@@ -0,0 +1,172 @@
+"""
+Caches for data that is read far more often than it changes. Canvas API data (e.g. template course settings,
+which are read once for every course created from the template) is held in a small process-local cache in
+front of the shared (Redis) Django cache, so that repeated lookups within a command run do not even make a
+Redis round trip. Per-term version stamps let callers invalidate any cached data derived from a term's course
+instances without having to know every key that was built from it.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from canvas_sdk.methods.courses import get_single_course_courses
+
+from .sdk_context import get_sdk_context
+
+
+logger = logging.getLogger(__name__)
+
+SDK_CONTEXT = get_sdk_context()
+
+CACHE_KEY_TEMPLATE_COURSE = "canvas-template-course_%s"
+CACHE_KEY_TERM_COURSE_DATA_VERSION = "term-course-data-version_%s"
+CACHE_KEY_USER_PROFILE = "canvas-user-profile_%s"
+
+# cached in place of the profile of a user that Canvas does not know about
+USER_PROFILE_MISSING = 'missing'
+
+_local_cache = {}
+_local_cache_lock = threading.Lock()
+
+
+def _get_timeout(name, default):
+    return getattr(settings, 'CANVAS_API_CACHE', {}).get(name, default)
+
+
+def _get_local(key):
+    with _local_cache_lock:
+        entry = _local_cache.get(key)
+    if entry is not None:
+        (expires_at, value) = entry
+        if expires_at > time.time():
+            return value
+    return None
+
+
+def _set_local(key, value, timeout):
+    with _local_cache_lock:
+        _local_cache[key] = (time.time() + timeout, value)
+
+
+def _delete_local(key):
+    with _local_cache_lock:
+        _local_cache.pop(key, None)
+
+
+def get_template_course(template_id):
+    """
+    Returns the Canvas course data (as returned by the single course API with the all_courses include) for the
+    given template course, e.g. to read the visibility settings that new courses should copy. The local cache is
+    checked first, then the shared cache, and only then Canvas. CanvasAPIErrors raised by the SDK are not cached
+    and are passed on to the caller.
+    :param template_id: the Canvas course id of the template course
+    :return: dict of Canvas course data
+    """
+    cache_key = CACHE_KEY_TEMPLATE_COURSE % template_id
+    template_course = _get_local(cache_key)
+    if template_course is not None:
+        return template_course
+
+    template_course = cache.get(cache_key)
+    if template_course is None:
+        logger.debug("Fetching template course %s from Canvas", template_id)
+        template_course = get_single_course_courses(SDK_CONTEXT, template_id, 'all_courses').json()
+        cache.set(cache_key, template_course, _get_timeout('template_course_timeout_secs', 60 * 60))
+
+    _set_local(cache_key, template_course, _get_timeout('template_course_local_timeout_secs', 5 * 60))
+    return template_course
+
+
+def invalidate_template_course(template_id):
+    """
+    Removes the cached data for the given template course from both the local and the shared cache. This is done
+    whenever a CanvasSchoolTemplate for the course is saved or deleted (see models.py); changes made to the
+    template's settings in Canvas alone are picked up when the cached data expires
+    (CANVAS_API_CACHE['template_course_timeout_secs']). Other processes will drop their local copy when it
+    expires (see CANVAS_API_CACHE['template_course_local_timeout_secs']).
+    :param template_id: the Canvas course id of the template course
+    """
+    cache_key = CACHE_KEY_TEMPLATE_COURSE % template_id
+    _delete_local(cache_key)
+    cache.delete(cache_key)
+
+
+def get_cached_user_profile(sis_user_id):
+    """
+    Returns the Canvas user profile cached for the given user (see cache_user_profile()), checking the local
+    cache before the shared one. USER_PROFILE_MISSING is returned if Canvas is known not to have the user, and
+    None if nothing is cached.
+    :param sis_user_id: the SIS user id, without the sis_user_id: prefix
+    :return: dict of Canvas user profile data, USER_PROFILE_MISSING or None
+    """
+    cache_key = CACHE_KEY_USER_PROFILE % sis_user_id
+    profile = _get_local(cache_key)
+    if profile is None:
+        profile = cache.get(cache_key)
+        if profile is not None:
+            _set_local(cache_key, profile, _get_user_profile_local_timeout(profile))
+    return profile
+
+
+def cache_user_profile(sis_user_id, profile):
+    """
+    Caches the Canvas user profile of the given user, e.g. so that the notifications sent for a burst of jobs
+    created by the same user only fetch the profile once. Pass USER_PROFILE_MISSING to record that Canvas does
+    not have the user; that is cached for a shorter time (CANVAS_API_CACHE['user_profile_missing_timeout_secs']).
+    Profiles are changed in Canvas, where there is nothing to hook an invalidation into, so a cached profile is
+    only ever replaced once it expires.
+    Failures are logged rather than raised, since the profile has already been fetched.
+    :param sis_user_id: the SIS user id, without the sis_user_id: prefix
+    :param profile: dict of Canvas user profile data, or USER_PROFILE_MISSING
+    """
+    cache_key = CACHE_KEY_USER_PROFILE % sis_user_id
+    if profile == USER_PROFILE_MISSING:
+        timeout = _get_timeout('user_profile_missing_timeout_secs', 5 * 60)
+    else:
+        timeout = _get_timeout('user_profile_timeout_secs', 60 * 60)
+    _set_local(cache_key, profile, _get_user_profile_local_timeout(profile))
+    try:
+        cache.set(cache_key, profile, timeout)
+    except Exception:
+        logger.exception("Failed to cache the Canvas user profile for user %s", sis_user_id)
+
+
+def _get_user_profile_local_timeout(profile):
+    timeout = _get_timeout('user_profile_local_timeout_secs', 5 * 60)
+    if profile == USER_PROFILE_MISSING:
+        timeout = min(timeout, _get_timeout('user_profile_missing_timeout_secs', 5 * 60))
+    return timeout
+
+
+def get_term_course_data_version(sis_term_id):
+    """
+    Returns the current version stamp for the course instance data of the given term. Include it in the key of
+    anything cached from that data so that invalidate_term_course_data() makes those entries unreachable.
+    :param sis_term_id: the SIS term id
+    :return: version stamp (string)
+    """
+    cache_key = CACHE_KEY_TERM_COURSE_DATA_VERSION % sis_term_id
+    version = cache.get(cache_key)
+    if version is None:
+        version = repr(time.time())
+        # add() will not overwrite a version set concurrently by another process
+        if not cache.add(cache_key, version, None):
+            version = cache.get(cache_key, version)
+    return version
+
+
+def invalidate_term_course_data(sis_term_id):
+    """
+    Moves the given term's course instance data on to a new version, e.g. after a Canvas course id has been
+    saved to one of its course instances, so that data cached against the previous version is no longer used.
+    Failures are logged rather than raised, since callers invalidate after their own changes have been saved
+    (cached data then simply expires on its own timeout).
+    :param sis_term_id: the SIS term id
+    """
+    try:
+        cache.set(CACHE_KEY_TERM_COURSE_DATA_VERSION % sis_term_id, repr(time.time()), None)
+    except Exception:
+        logger.exception("Failed to invalidate cached course data for term %s", sis_term_id)
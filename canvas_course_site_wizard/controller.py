@@ -1,6 +1,6 @@
 import logging
 
-from canvas_sdk.methods.courses import create_new_course, get_single_course_courses, update_course
+from canvas_sdk.methods.courses import create_new_course, update_course
 from canvas_sdk.methods.sections import create_course_section
 from canvas_sdk.methods.enrollments import enroll_user_sections
 from canvas_sdk.methods.users import get_user_profile
@@ -8,10 +8,18 @@ from canvas_sdk.methods import content_migrations
 from canvas_sdk.exceptions import CanvasAPIError
 from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned
-from django.core.mail import send_mail
 
+from .canvas_cache import (
+    get_template_course,
+    invalidate_term_course_data,
+    get_cached_user_profile,
+    cache_user_profile,
+    USER_PROFILE_MISSING
+)
 from .models_api import (
     get_course_data,
+    set_sync_to_canvas_bulk,
+    set_official_course_site_urls_bulk,
     get_default_template_for_school,
     get_courses_for_term,
     get_bulk_job_records_for_term,
@@ -22,7 +30,8 @@ from .models import (
     CanvasCourseGenerationJob,
     SISCourseData,
     BulkCanvasCourseCreationJob,
-    CanvasSchoolTemplate
+    CanvasSchoolTemplate,
+    QueuedEmail
 )
 from icommons_common.models import (
     CourseStaff,
@@ -45,18 +54,20 @@ from .exceptions import (
     SaveCanvasCourseIdToCourseGenerationJobError,
     SaveCanvasCourseIdToCourseInstanceError,
 )
-from icommons_common.canvas_utils import SessionInactivityExpirationRC
+from .sdk_context import get_sdk_context
 
 
 # Set up the request context that will be used for canvas API calls
-SDK_CONTEXT = SessionInactivityExpirationRC(**settings.CANVAS_SDK_SETTINGS)
+SDK_CONTEXT = get_sdk_context()
 logger = logging.getLogger(__name__)
 
 
-def create_canvas_course(sis_course_id, sis_user_id, bulk_job=None):
+def create_canvas_course(sis_course_id, sis_user_id, bulk_job=None, course_data=None):
     """
     This method creates a canvas course for the sis_course_id provided, initiated by the sis_user_id. The bulk_job_id
-    would be passed in if it's invoked from a bulk feed process.
+    would be passed in if it's invoked from a bulk feed process. If the caller has already loaded the SISCourseData
+    for the course (e.g. for all the courses of a bulk job at once) it can be passed in as course_data, otherwise
+    it is fetched here.
     """
 
     # instantiate any variables required for method return or logger calls
@@ -103,7 +114,8 @@ def create_canvas_course(sis_course_id, sis_user_id, bulk_job=None):
 
     try:
         # 2. fetch the course instance info
-        course_data = get_course_data(sis_course_id)
+        if course_data is None:
+            course_data = get_course_data(sis_course_id)
         logger.info("\n obtained course info for ci=%s, acct_id=%s, course_name=%s, code=%s, term=%s, section_name=%s\n"
                     % (course_data, course_data.sis_account_id, course_data.course_name, course_data.course_code,
                        course_data.sis_term_id, course_data.primary_section_name()))
@@ -146,7 +158,7 @@ def create_canvas_course(sis_course_id, sis_user_id, bulk_job=None):
     # can be copied over to the new course
     if template_id:
         try:
-            template_course = get_single_course_courses(SDK_CONTEXT, template_id, 'all_courses').json()
+            template_course = get_template_course(template_id)
             is_public_to_auth_users = course_data.shopping_active or template_course['is_public_to_auth_users']
             # Update create course request parameters
             request_parameters.update({
@@ -230,6 +242,9 @@ def create_canvas_course(sis_course_id, sis_user_id, bulk_job=None):
                                         ex.display_text)
         raise ex
 
+    # the term's course instance summaries now have one more course with a Canvas site
+    invalidate_term_course_data(course_data.term_id)
+
     # 6. Create course section after course creation
     try:
         request_parameters = dict(request_ctx=SDK_CONTEXT,
@@ -372,6 +387,78 @@ def finalize_new_canvas_course(canvas_course_id, sis_course_id, user_id, bulk_jo
 
     return canvas_course_url
 
+def finalize_new_canvas_courses(jobs):
+    """
+    Performs the database tasks of finalize_new_canvas_course() for many bulk job courses at once: the SIS
+    enrollment sync flag is turned on for all the courses with a single UPDATE, and all the courses are marked
+    as official with bulk inserts. (Bulk job courses have no creator to enroll.) If a batched step fails, it is
+    retried course by course so that each failure is attributed to the course that caused it.
+
+        :param jobs: CanvasCourseGenerationJobs of newly created Canvas courses
+        :return: dict keyed by job pk, giving either the course's Canvas URL or the exception (CopySISEnrollmentsError
+        or MarkOfficialError) that stopped it from being finalized
+    """
+    results = {}
+    # a course can have more than one ready job (e.g. it was created again), so every job of a course gets a result
+    jobs_by_sis_course_id = {}
+    for job in jobs:
+        jobs_by_sis_course_id.setdefault(str(job.sis_course_id), []).append(job)
+
+    # Copy SIS enrollments to new Canvas courses
+    try:
+        synced_ids = set_sync_to_canvas_bulk(jobs_by_sis_course_id.keys(), SISCourseData.TURN_ON_SYNC_TO_CANVAS)
+    except Exception:
+        logger.exception('Error setting SIS enrollment data sync flag for %d new courses, retrying one at a time',
+                         len(jobs_by_sis_course_id))
+        synced_ids = set()
+        for sis_course_id in jobs_by_sis_course_id:
+            try:
+                get_course_data(sis_course_id).set_sync_to_canvas(SISCourseData.TURN_ON_SYNC_TO_CANVAS)
+                synced_ids.add(sis_course_id)
+            except Exception:
+                logger.exception('Error setting SIS enrollment data sync flag for sis_course_id %s' % sis_course_id)
+    for sis_course_id, course_jobs in jobs_by_sis_course_id.items():
+        if sis_course_id not in synced_ids:
+            for job in course_jobs:
+                results[job.pk] = CopySISEnrollmentsError(sis_course_id)
+    logger.info('Set SIS enrollment data sync flag for %d new courses' % len(synced_ids))
+
+    # Mark courses as official; a batch holds one url per course, so the urls of any other jobs for a course
+    # are marked one at a time after it
+    urls_by_job_pk = {}
+    urls_by_sis_course_id = {}
+    other_urls = set()
+    for sis_course_id in synced_ids:
+        for job in jobs_by_sis_course_id[sis_course_id]:
+            url = get_canvas_course_url(canvas_course_id=job.canvas_course_id)
+            urls_by_job_pk[job.pk] = url
+            if urls_by_sis_course_id.setdefault(sis_course_id, url) != url:
+                other_urls.add((sis_course_id, url))
+    marked_urls = set()
+    try:
+        set_official_course_site_urls_bulk(urls_by_sis_course_id)
+        marked_urls.update(urls_by_sis_course_id.items())
+    except Exception:
+        logger.exception('Error marking %d new courses as official, retrying one at a time',
+                         len(urls_by_sis_course_id))
+        other_urls.update(urls_by_sis_course_id.items())
+    for sis_course_id, url in other_urls:
+        try:
+            set_official_course_site_urls_bulk({sis_course_id: url})
+            marked_urls.add((sis_course_id, url))
+        except Exception:
+            logger.exception('Error marking new course with sis_course_id %s as official' % sis_course_id)
+    for sis_course_id in synced_ids:
+        for job in jobs_by_sis_course_id[sis_course_id]:
+            url = urls_by_job_pk[job.pk]
+            if (sis_course_id, url) in marked_urls:
+                results[job.pk] = url
+            else:
+                results[job.pk] = MarkOfficialError(sis_course_id)
+    logger.info('Marked %d new courses as official' % len(marked_urls))
+
+    return results
+
 def enroll_creator_in_new_course(sis_course_id, user_id):
     """
     Silently enroll instructor / creator to the new course so it can be accessed immediately
@@ -445,19 +532,34 @@ def enroll_creator_in_new_course(sis_course_id, user_id):
 
 def get_canvas_user_profile(sis_user_id):
     """
-    This method will fetch the canvas user profile , given the sis_user_id
+    This method will fetch the canvas user profile , given the sis_user_id. Profiles are cached (see
+    canvas_cache.cache_user_profile()), and so is the fact that Canvas has no such user: a CanvasAPIError with
+    status_code 404 is raised again for that user, without another request, until it expires.
     :param sis_user_id: The sis_user_id of the user, without the sis_user_id: prefix
     :type sis_user_id: string
     return: Returns json representing the canvas user profile fetched by the canvas_sdk
     """
-    response = get_user_profile(request_ctx=SDK_CONTEXT, user_id='sis_user_id:%s' % sis_user_id)
+    canvas_user_profile = get_cached_user_profile(sis_user_id)
+    if canvas_user_profile == USER_PROFILE_MISSING:
+        raise CanvasAPIError(status_code=404, msg='Canvas user sis_user_id:%s not found (cached)' % sis_user_id)
+    if canvas_user_profile is not None:
+        return canvas_user_profile
+
+    try:
+        response = get_user_profile(request_ctx=SDK_CONTEXT, user_id='sis_user_id:%s' % sis_user_id)
+    except CanvasAPIError as api_error:
+        if api_error.status_code == 404:
+            cache_user_profile(sis_user_id, USER_PROFILE_MISSING)
+        raise
     canvas_user_profile = response.json()
+    cache_user_profile(sis_user_id, canvas_user_profile)
     return canvas_user_profile
 
 def send_email_helper(subject, message, to_address):
     """
-    This is a helper method to send email using django's mail module. The mail
-     is sent to the specified receipients using the subject and body provided.
+    This is a helper method to send email. The mail is queued for the specified
+     receipients using the subject and body provided, and is sent (over a shared SMTP connection,
+     with retries) by the send_queued_emails command, so callers are not held up by the mail server.
      The 'from' address is obtained from the settings file.
     :param subject: The subject for the email, a String
     :param message: The body of the email, a String
@@ -466,9 +568,8 @@ def send_email_helper(subject, message, to_address):
     from_address = settings.CANVAS_EMAIL_NOTIFICATION['from_email_address']
     logger.info("==>Within send email: from_addr=%s, to_addr=%s, subject=%s, "
                 "message=%s" % (from_address, to_address, subject, message))
-    # If fail_silently is set to False, send_mail will raise exceptions. If
-    # True, all exceptions raised while sending the message will be quashed.
-    send_mail(subject, message, from_address, to_address, fail_silently=False)
+    # Exceptions raised while queueing the message (e.g. database errors) are passed on to the caller
+    QueuedEmail.objects.enqueue(subject, message, from_address, to_address)
 
 def send_failure_email(initiator_email, sis_course_id):
     """
@@ -0,0 +1,93 @@
+"""
+Tells the pages waiting on a single course creation job (see views.CanvasCourseSiteStatusUpdateView) about its
+workflow_state transitions. Whenever a job's workflow_state is saved, the new state is stored in the shared
+(Redis) Django cache and published on the job's Redis pub/sub channel. A waiting request subscribes to the
+channel and is woken by Redis when the job moves on, so the many pages left open while content migrations run
+do not each poll the database. Bulk job courses have no status page, so their transitions are not published.
+"""
+import logging
+import threading
+import time
+
+import redis
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY_JOB_STATUS = "course-job-status_%s"
+# pub/sub channels are not namespaced by the cache's KEY_PREFIX, so they carry the project name themselves
+CHANNEL_JOB_STATUS = "canvas_course_creation:course-job-status_%s"
+
+_redis_pool = None
+_redis_pool_lock = threading.Lock()
+
+
+def _get_setting(name, default):
+    return getattr(settings, 'JOB_STATUS_UPDATES', {}).get(name, default)
+
+
+def _get_redis():
+    global _redis_pool
+    if _redis_pool is None:
+        with _redis_pool_lock:
+            if _redis_pool is None:
+                _redis_pool = redis.ConnectionPool(host=settings.REDIS_HOST, port=settings.REDIS_PORT)
+    return redis.StrictRedis(connection_pool=_redis_pool)
+
+
+def cache_job_status(job_id, workflow_state):
+    cache.set(CACHE_KEY_JOB_STATUS % job_id, workflow_state, _get_setting('status_timeout_secs', 5 * 60))
+
+
+def publish_job_status(job_id, workflow_state):
+    """
+    Records a job's new workflow_state in the shared cache and publishes it to any requests waiting on the job.
+    Failures are logged rather than raised, since a job's progress must not depend on its status page; the
+    cached state expires after JOB_STATUS_UPDATES['status_timeout_secs'], after which it is read from the
+    database again.
+    """
+    try:
+        cache_job_status(job_id, workflow_state)
+        _get_redis().publish(CHANNEL_JOB_STATUS % job_id, workflow_state)
+    except Exception:
+        logger.exception("Failed to publish workflow_state %s of course generation job %s", workflow_state, job_id)
+
+
+def wait_for_job_status(job_id, known_status, load_status, timeout=None):
+    """
+    Waits for a job's workflow_state to move on from known_status (the state the caller last saw), for up to
+    timeout seconds (JOB_STATUS_UPDATES['wait_timeout_secs'] by default). The job's channel is subscribed to
+    before its current state is checked, so a transition that happens in between is not missed.
+    :param job_id: the CanvasCourseGenerationJob's pk
+    :param known_status: the workflow_state the caller last saw
+    :param load_status: function returning the job's workflow_state from the database, called only if the
+     state is not in the shared cache
+    :return: the job's workflow_state (still known_status if the wait timed out)
+    """
+    if timeout is None:
+        timeout = _get_setting('wait_timeout_secs', 25)
+
+    pubsub = _get_redis().pubsub(ignore_subscribe_messages=True)
+    try:
+        pubsub.subscribe(CHANNEL_JOB_STATUS % job_id)
+        status = cache.get(CACHE_KEY_JOB_STATUS % job_id)
+        if status is None:
+            status = load_status()
+            # add rather than set, so that a state published since it was loaded is not overwritten
+            cache.add(CACHE_KEY_JOB_STATUS % job_id, status, _get_setting('status_timeout_secs', 5 * 60))
+        if status != known_status:
+            return status
+
+        deadline = time.time() + timeout
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return status
+            message = pubsub.get_message(timeout=remaining)
+            if message is not None and message['type'] == 'message':
+                return message['data']
+    finally:
+        pubsub.close()
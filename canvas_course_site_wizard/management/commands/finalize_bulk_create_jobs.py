@@ -11,17 +11,19 @@ from canvas_course_site_wizard.controller import (get_canvas_user_profile,
                                                   create_canvas_course,
                                                   get_course_data,
                                                   start_course_template_copy)
+from canvas_course_site_wizard.models_api import get_course_data_bulk
 from canvas_course_site_wizard.models import (BulkCanvasCourseCreationJob as BulkJob,
                                               CanvasCourseGenerationJob)
+from canvas_course_site_wizard.worker_pool import map_concurrently
 from canvas_course_site_wizard.exceptions import (NoTemplateExistsForSchool,
                                                   CanvasCourseAlreadyExistsError,
                                                   CourseGenerationJobCreationError,
                                                   CanvasCourseCreateError,
                                                   CanvasSectionCreateError)
-from icommons_common.canvas_utils import SessionInactivityExpirationRC
+from canvas_course_site_wizard.sdk_context import get_sdk_context, log_connection_stats
 from icommons_common.models import Term, School
 
-SDK_CONTEXT = SessionInactivityExpirationRC(**settings.CANVAS_SDK_SETTINGS)
+SDK_CONTEXT = get_sdk_context()
 
 logger = logging.getLogger(__name__)
 tech_logger = logging.getLogger('tech_mail')
@@ -58,20 +60,16 @@ class Command(NoArgsCommand):
         # Process to finalize the bulk job
         ###
 
-        jobs = BulkJob.objects.get_jobs_by_status(BulkJob.STATUS_PENDING)
+        # pending bulk jobs whose subjobs are all in a terminal state
+        jobs = BulkJob.objects.get_jobs_ready_to_finalize()
 
         jobs_count = len(jobs)
         if not jobs_count:
-            logger.info('No pending bulk create jobs found.')
+            logger.info('No pending bulk create jobs ready to finalize.')
         else:
-            logger.info('Found %d pending bulk create jobs.', jobs_count)
+            logger.info('Found %d pending bulk create jobs ready to finalize.', jobs_count)
 
         for job in jobs:
-            logger.debug('Checking if all subjobs are finished for pending bulk create job %s ', job.id)
-            if not job.ready_to_finalize():
-                logger.debug('Job %s is not ready to be finalized, leaving pending.', job.id)
-                continue
-
             logger.info('Finalizing job %s...', job.id)
 
             if not job.update_status(BulkJob.STATUS_FINALIZING):
@@ -93,6 +91,7 @@ class Command(NoArgsCommand):
             logger.info('Job %s status updated to %s', job.id, job.status)
 
         _log_bulk_job_statistics()
+        log_connection_stats()
 
         logger.info('command took %s seconds to run', str(datetime.now() - start_time)[:-7])
 
@@ -107,89 +106,125 @@ def _init_courses_with_status_setup():
     """
     get all records in the canvas course generation job table that have the status 'setup'.
     These are courses that have not been created, they only have a CanvasCourseGenerationJob with a 'setup' status.
-    This method will create the course and update the status to QUEUED
+    This method will create the course and update the status to QUEUED.
+    Subjobs are processed by a pool of worker threads; the pool size is set by
+    BULK_COURSE_CREATION['setup_concurrency'] (8 in the shipped settings; 1 processes the subjobs serially).
     """
 
-    create_jobs = CanvasCourseGenerationJob.objects.filter_setup_for_bulkjobs()
+    create_jobs = list(CanvasCourseGenerationJob.objects.filter_setup_for_bulkjobs())
     # Get the bulk job parent for each course job and map by id for later use
     bulk_jobs = {b.id: b for b in BulkJob.objects.filter(id__in=[j.bulk_job_id for j in create_jobs])}
+    # Load the SIS course data for all the course jobs up front, rather than once (or more) per course
+    course_data = get_course_data_bulk([j.sis_course_id for j in create_jobs if j.sis_course_id])
+
+    concurrency = settings.BULK_COURSE_CREATION.get('setup_concurrency', 1)
+    if create_jobs:
+        logger.info('Setting up %d bulk subjobs with concurrency %d', len(create_jobs), concurrency)
+
+    map_concurrently(
+        lambda create_job: _init_course_with_status_setup(
+            create_job,
+            bulk_jobs.get(create_job.bulk_job_id),
+            course_data.get(str(create_job.sis_course_id))
+        ),
+        create_jobs,
+        concurrency=concurrency
+    )
 
-    # for each or the records above, create the course and update the status
-    for create_job in create_jobs:
-        # for each job we need to get the bulk_job_id, user, and course id, these are
-        # needed by the calls to create the course below. If any of these break, mark the course as failed
-        # and continue to the next course.
-        bulk_job = bulk_jobs.get(create_job.bulk_job_id)
-        if not bulk_job:
-            create_job.update_workflow_state(CanvasCourseGenerationJob.STATUS_SETUP_FAILED)
-            continue
-        bulk_job_id = bulk_job.id
-
-        sis_user_id = create_job.created_by_user_id
-        if not sis_user_id:
-            create_job.update_workflow_state(CanvasCourseGenerationJob.STATUS_SETUP_FAILED)
-            continue
-
-        sis_course_id = create_job.sis_course_id
-        if not sis_course_id:
-            create_job.update_workflow_state(CanvasCourseGenerationJob.STATUS_SETUP_FAILED)
-            continue
-
-        # try to create the canvas course - create_canvas_course has been modified so it will not
-        # try to create a new CanvasCourseGenerationJob record if a bulk_job is present
-        try:
-            logger.info(
-                'calling create_canvas_course(%s, %s, bulk_job_id=%s)',
-                sis_course_id, sis_user_id,
-                bulk_job_id
-            )
-            course = create_canvas_course(
-                sis_course_id,
-                sis_user_id,
-                bulk_job=bulk_job,
-            )
-        except (CanvasCourseAlreadyExistsError, CourseGenerationJobCreationError, CanvasCourseCreateError,
-                CanvasSectionCreateError):
-            message = 'content migration error for course with id %s' % sis_course_id
-            logger.exception(message)
-            create_job.update_workflow_state(CanvasCourseGenerationJob.STATUS_SETUP_FAILED)
-            continue
 
-        # get the course data - this is needed for the start_course_template_copy method
+def _init_course_with_status_setup(create_job, bulk_job, sis_course_data=None):
+    """
+    Creates the canvas course for a single 'setup' subjob and starts the template copy (or marks it ready
+    to finalize if the bulk job has no template). Any failure is recorded on the subjob as STATUS_SETUP_FAILED
+    and does not propagate, so that one subjob cannot stop the others from being processed.
+    :param create_job: a CanvasCourseGenerationJob in STATUS_SETUP
+    :param bulk_job: the BulkJob the subjob belongs to, or None if it could not be found
+    :param sis_course_data: the SISCourseData for the subjob's course, if already loaded
+    """
+    try:
+        _create_course_and_start_copy(create_job, bulk_job, sis_course_data)
+    except Exception:
+        logger.exception('unexpected error setting up course with id %s' % create_job.sis_course_id)
+        create_job.update_workflow_state(CanvasCourseGenerationJob.STATUS_SETUP_FAILED)
+
+
+def _create_course_and_start_copy(create_job, bulk_job, sis_course_data=None):
+    # for each job we need to get the bulk_job_id, user, and course id, these are
+    # needed by the calls to create the course below. If any of these break, mark the course as failed
+    # and continue to the next course.
+    if not bulk_job:
+        create_job.update_workflow_state(CanvasCourseGenerationJob.STATUS_SETUP_FAILED)
+        return
+    bulk_job_id = bulk_job.id
+
+    sis_user_id = create_job.created_by_user_id
+    if not sis_user_id:
+        create_job.update_workflow_state(CanvasCourseGenerationJob.STATUS_SETUP_FAILED)
+        return
+
+    sis_course_id = create_job.sis_course_id
+    if not sis_course_id:
+        create_job.update_workflow_state(CanvasCourseGenerationJob.STATUS_SETUP_FAILED)
+        return
+
+    # get the course data (unless it was loaded up front) - this is needed to create the course and for the
+    # start_course_template_copy method
+    if sis_course_data is None:
         try:
             sis_course_data = get_course_data(sis_course_id)
         except ObjectDoesNotExist as ex:
             message = 'Course id %s does not exist, skipping....' % sis_course_id
             logger.exception(message)
             create_job.update_workflow_state(CanvasCourseGenerationJob.STATUS_SETUP_FAILED)
-            continue
-
-        # Initiate the async job to copy the course template, if a template was selected for the bulk job
-        if bulk_job.template_canvas_course_id:
-            try:
-                start_course_template_copy(
-                    sis_course_data,
-                    course['id'],
-                    sis_user_id,
-                    course_job_id=create_job.pk,
-                    bulk_job_id=bulk_job_id,
-                    template_id=bulk_job.template_canvas_course_id
-                )
-            except:
-                logger.exception('template migration failed for course instance id %s' % sis_course_id)
-                create_job.update_workflow_state(CanvasCourseGenerationJob.STATUS_SETUP_FAILED)
-        else:
-            logger.info('no template selected for  %s' % sis_course_id)
-            # When there's no template, it doesn't need any migration and the job is ready to be finalized
-            create_job.update_workflow_state(CanvasCourseGenerationJob.STATUS_PENDING_FINALIZE)
+            return
+
+    # try to create the canvas course - create_canvas_course has been modified so it will not
+    # try to create a new CanvasCourseGenerationJob record if a bulk_job is present
+    try:
+        logger.info(
+            'calling create_canvas_course(%s, %s, bulk_job_id=%s)',
+            sis_course_id, sis_user_id,
+            bulk_job_id
+        )
+        course = create_canvas_course(
+            sis_course_id,
+            sis_user_id,
+            bulk_job=bulk_job,
+            course_data=sis_course_data,
+        )
+    except (CanvasCourseAlreadyExistsError, CourseGenerationJobCreationError, CanvasCourseCreateError,
+            CanvasSectionCreateError):
+        message = 'content migration error for course with id %s' % sis_course_id
+        logger.exception(message)
+        create_job.update_workflow_state(CanvasCourseGenerationJob.STATUS_SETUP_FAILED)
+        return
+
+    # Initiate the async job to copy the course template, if a template was selected for the bulk job
+    if bulk_job.template_canvas_course_id:
+        try:
+            start_course_template_copy(
+                sis_course_data,
+                course['id'],
+                sis_user_id,
+                course_job_id=create_job.pk,
+                bulk_job_id=bulk_job_id,
+                template_id=bulk_job.template_canvas_course_id
+            )
+        except:
+            logger.exception('template migration failed for course instance id %s' % sis_course_id)
+            create_job.update_workflow_state(CanvasCourseGenerationJob.STATUS_SETUP_FAILED)
+    else:
+        logger.info('no template selected for  %s' % sis_course_id)
+        # When there's no template, it doesn't need any migration and the job is ready to be finalized
+        create_job.update_workflow_state(CanvasCourseGenerationJob.STATUS_PENDING_FINALIZE)
 
 
 def _send_notification(job):
     """
     helper function to encapsulate the process of sending a report via email to the user who created the bulk job
     :param job: a BulkJob
-    :return: True if notification was successfully sent (passed to the Django framework, anyway);
-             False if no notification was sent
+    :return: True if notification was successfully queued for sending (see send_queued_emails);
+             False if no notification was queued
     """
     notification_to_address_list = []
     canvas_user_profile = None
@@ -210,8 +245,9 @@ def _send_notification(job):
 
     logger.debug("Building notification email...")
 
-    completed_subjobs = job.get_completed_subjobs_count()
-    failed_subjobs = job.get_failed_subjobs_count()
+    subjob_counts = job.get_subjob_state_counts()
+    completed_subjobs = subjob_counts[CanvasCourseGenerationJob.STATUS_FINALIZED]
+    failed_subjobs = sum(subjob_counts[state] for state in CanvasCourseGenerationJob.FAILED_STATES)
 
     try:
         term = Term.objects.get(term_id=int(job.sis_term_id))
@@ -238,7 +274,7 @@ def _send_notification(job):
         failed_subjobs
     )
 
-    logger.debug("Sending notification email to %s...", notification_to_address_list)
+    logger.debug("Queueing notification email to %s...", notification_to_address_list)
 
     try:
         send_email_helper(subject, body, notification_to_address_list)
@@ -248,7 +284,7 @@ def _send_notification(job):
         _log_notification_failure(job)
         return False
 
-    logger.debug("Notification email sent!")
+    logger.debug("Notification email queued!")
     return True
 
 
@@ -0,0 +1,219 @@
+"""
+Finalize the Canvas course generation jobs whose content migration has completed (or which did not need one).
+    To invoke this Command type "python manage.py finalize_course_jobs"
+"""
+from django.core.management.base import NoArgsCommand
+from django.conf import settings
+from django.db.models import Q
+from canvas_course_site_wizard.controller import (
+    get_canvas_user_profile,
+    send_email_helper,
+    send_failure_email,
+    finalize_new_canvas_course,
+    finalize_new_canvas_courses,
+    update_syllabus_body
+)
+from canvas_course_site_wizard.models import CanvasCourseGenerationJob
+from canvas_course_site_wizard.worker_pool import map_concurrently
+from canvas_course_site_wizard.sdk_context import log_connection_stats
+from icommons_ui.exceptions import RenderableException
+import logging
+import fcntl
+
+logger = logging.getLogger(__name__)
+tech_logger = logging.getLogger('tech_mail')
+
+READY_TO_FINALIZE_STATES = (
+    CanvasCourseGenerationJob.STATUS_COMPLETED,
+    CanvasCourseGenerationJob.STATUS_PENDING_FINALIZE,
+)
+
+
+class Command(NoArgsCommand):
+    """
+    Finalize the Canvas course generation jobs in the CanvasCourseGenerationJob table that are in the completed
+    or pending_finalize state. process_async_jobs moves jobs to completed once their content migration is done;
+    finalizing them is left to this command so that its cost does not hold up progress polling.
+    To invoke this Command type "python manage.py finalize_course_jobs"
+    """
+    help = "Finalize the Canvas course generation jobs in the CanvasCourseGenerationJob table"
+
+    def handle_noargs(self, **options):
+        """
+        select all the jobs ready to finalize in the CanvasCourseGenerationJob table and finalize them,
+        using a pool of FINALIZE_COURSE_JOBS['finalize_concurrency'] worker threads for the Canvas calls
+        """
+
+        # open and lock the file used for determining if another process is running
+        _pid_file = getattr(settings, 'FINALIZE_COURSE_JOBS_PID_FILE', 'finalize_course_jobs.pid')
+        _pid_file_handle = open(_pid_file, 'w')
+        try:
+            fcntl.lockf(_pid_file_handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError:
+            # another instance is running
+            logger.error("another instance of the command is already running")
+            return
+
+        jobs = list(CanvasCourseGenerationJob.objects.filter(
+            Q(workflow_state=CanvasCourseGenerationJob.STATUS_COMPLETED) |
+            Q(workflow_state=CanvasCourseGenerationJob.STATUS_PENDING_FINALIZE)))
+
+        concurrency = getattr(settings, 'FINALIZE_COURSE_JOBS', {}).get('finalize_concurrency', 1)
+        if jobs:
+            logger.info('Finalizing %d course jobs with concurrency %d', len(jobs), concurrency)
+        map_concurrently(_finalize_job, [job for job in jobs if not job.bulk_job_id], concurrency=concurrency)
+        _finalize_bulk_subjobs([job for job in jobs if job.bulk_job_id], concurrency)
+
+        log_connection_stats()
+
+        # unlock and close the file used for determining if another process is running
+        try:
+            fcntl.lockf(_pid_file_handle, fcntl.LOCK_UN)
+            _pid_file_handle.close()
+        except IOError:
+            logger.error("could not release lock on pid file or close pid file properly")
+
+
+def _finalize_job(job):
+    """
+    Finalizes a single job and notifies the initiator (bulk job courses are finalized together by
+    _finalize_bulk_subjobs() instead). Any failure is logged, the job is marked STATUS_FINALIZE_FAILED where
+    finalization itself failed, and nothing is raised, so that one job cannot stop the others from being finalized.
+    :param job: a CanvasCourseGenerationJob in STATUS_COMPLETED or STATUS_PENDING_FINALIZE
+    """
+    user_profile = None
+    try:
+        logger.info('\nFinalizing course with sis_course_id %s' % job.sis_course_id)
+        try:
+            update_syllabus_body(job)
+            canvas_course_url = finalize_new_canvas_course(
+                job.canvas_course_id,
+                job.sis_course_id,
+                'sis_user_id:%s' % job.created_by_user_id,
+                job.bulk_job_id
+            )
+        except Exception:
+            # Catch exceptions from finalize method to set the workflow_state to STATUS_FINALIZE_FAILED
+            # and then re raise it so that generic tasks like tech logger, email generation will continue
+            # to be handled in the larger try block
+
+            job.workflow_state = CanvasCourseGenerationJob.STATUS_FINALIZE_FAILED
+            job.save(update_fields=['workflow_state'])
+
+            raise
+
+        # Update the Job table with the STATUS_FINALIZED state if finalize is successful
+        job.workflow_state = CanvasCourseGenerationJob.STATUS_FINALIZED
+        job.save(update_fields=['workflow_state'])
+
+        # if this is not a bulk_job then proceed with email generation to user
+        if not job.bulk_job_id:
+            # Once finalized successfully, only the initiator needs to be emailed
+            user_profile = get_canvas_user_profile(job.created_by_user_id)
+            to_address = [user_profile['primary_email']]
+            success_msg = settings.CANVAS_EMAIL_NOTIFICATION['course_migration_success_body']
+            logger.debug("notifying success via email: to_addr=%s and adding course url =%s" % (to_address, canvas_course_url))
+
+            # add the course url to the  message
+            complete_msg = success_msg.format(canvas_course_url)
+            send_email_helper(settings.CANVAS_EMAIL_NOTIFICATION['course_migration_success_subject'], complete_msg, to_address)
+
+    except Exception as e:
+        error_text = "There was a problem in finalizing the job for canvas course sis_course_id %s (HUID:%s)" \
+                     % (job.sis_course_id, job.created_by_user_id)
+        # Note: equivalent to .error(error_text, exc_info=1) -- logs at ERROR level
+        logger.exception(error_text)
+
+        # Use the friendly display_text for the subject of the tech_logger email if it's available
+        if isinstance(e, RenderableException):
+            error_text = '%s (HUID:%s)' % (e.display_text, job.created_by_user_id)
+        tech_logger.exception(error_text)
+
+        # send email if it's not a bulk created course
+        if not job.bulk_job_id:
+            try:
+                # if failure happened before user profile was fetched, get the user profile
+                # to retrieve email, else reuse the user_profile info
+                if not user_profile:
+                    user_profile = get_canvas_user_profile(job.created_by_user_id)
+
+                send_failure_email(user_profile['primary_email'], job.sis_course_id)
+            except Exception:
+                # If exception occurs while sending failure email, log it
+                error_text = "There was a problem in sending the failure notification email to initiator " \
+                             "and support staff for sis_course_id %s (HUID:%s)" \
+                             % (job.sis_course_id, job.created_by_user_id)
+                logger.exception(error_text)
+                tech_logger.exception(error_text)
+
+
+def _finalize_bulk_subjobs(jobs, concurrency):
+    """
+    Finalizes the given bulk job courses together: their syllabus bodies are updated in Canvas job by job (using
+    up to concurrency worker threads), then the database side of finalizing is done for all of them at once
+    (see controller.finalize_new_canvas_courses()). Failures are recorded against the jobs they belong to.
+    :param jobs: CanvasCourseGenerationJobs that belong to a bulk job
+    """
+    if not jobs:
+        return
+    syllabus_updated = map_concurrently(_update_syllabus, jobs, concurrency=concurrency)
+    jobs = [job for (job, updated) in zip(jobs, syllabus_updated) if updated]
+    if not jobs:
+        return
+
+    try:
+        results = finalize_new_canvas_courses(jobs)
+    except Exception as e:
+        for job in jobs:
+            _record_bulk_subjob_failure(job, e)
+        return
+
+    # finalizing a course again is safe (see models_api.set_official_course_site_urls_bulk()), so if the jobs
+    # cannot be moved on here they are simply finalized again on the next run
+    finalized_ids = [job.pk for job in jobs if not isinstance(results[job.pk], Exception)]
+    try:
+        moved_ids = CanvasCourseGenerationJob.objects.transition_many(
+            finalized_ids, READY_TO_FINALIZE_STATES, CanvasCourseGenerationJob.STATUS_FINALIZED)
+    except Exception:
+        logger.exception('Could not mark %d finalized bulk job courses as finalized; they will be finalized '
+                         'again on the next run', len(finalized_ids))
+    else:
+        if len(moved_ids) < len(finalized_ids):
+            logger.warning('%d finalized bulk job courses had already been moved on by another process',
+                           len(finalized_ids) - len(moved_ids))
+
+    for job in jobs:
+        result = results[job.pk]
+        if isinstance(result, Exception):
+            _record_bulk_subjob_failure(job, result)
+
+
+def _update_syllabus(job):
+    """
+    Updates the syllabus body of a bulk job course, recording any failure against the job.
+    :return: True if the syllabus body was updated
+    """
+    try:
+        update_syllabus_body(job)
+    except Exception as e:
+        _record_bulk_subjob_failure(job, e)
+        return False
+    return True
+
+
+def _record_bulk_subjob_failure(job, e):
+    """
+    Marks a bulk job course as STATUS_FINALIZE_FAILED and logs the failure (bulk job courses get no failure email;
+    the bulk job's notification reports them)
+    """
+    job.workflow_state = CanvasCourseGenerationJob.STATUS_FINALIZE_FAILED
+    job.save(update_fields=['workflow_state'])
+
+    error_text = "There was a problem in finalizing the job for canvas course sis_course_id %s (HUID:%s): %r" \
+                 % (job.sis_course_id, job.created_by_user_id, e)
+    logger.error(error_text)
+
+    # Use the friendly display_text for the subject of the tech_logger email if it's available
+    if isinstance(e, RenderableException):
+        error_text = '%s (HUID:%s)' % (e.display_text, job.created_by_user_id)
+    tech_logger.error(error_text)
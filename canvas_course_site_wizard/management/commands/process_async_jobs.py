@@ -2,24 +2,25 @@
 Process the Content Migration jobs in the CanvasContentMigrationJob table.
     To invoke this Command type "python manage.py process_async_jobs"
 """
+from datetime import timedelta
+
 from django.core.management.base import NoArgsCommand
 from django.conf import settings
 from django.db.models import Q
+from django.utils import timezone
 from canvas_course_site_wizard.controller import (
     get_canvas_user_profile,
-    send_email_helper,
-    send_failure_email,
-    finalize_new_canvas_course,
-    update_syllabus_body
+    send_failure_email
 )
 from canvas_course_site_wizard.models import CanvasCourseGenerationJob
+from canvas_course_site_wizard.worker_pool import map_concurrently
 from canvas_sdk import client
-from icommons_common.canvas_utils import SessionInactivityExpirationRC
+from canvas_course_site_wizard.sdk_context import get_sdk_context, log_connection_stats
 from icommons_ui.exceptions import RenderableException
 import logging
 import fcntl
 
-SDK_CONTEXT = SessionInactivityExpirationRC(**settings.CANVAS_SDK_SETTINGS)
+SDK_CONTEXT = get_sdk_context()
 
 logger = logging.getLogger(__name__)
 tech_logger = logging.getLogger('tech_mail')
@@ -48,9 +49,21 @@ class Command(NoArgsCommand):
             logger.error("another instance of the command is already running")
             return
 
-        jobs = CanvasCourseGenerationJob.objects.filter(Q(workflow_state=CanvasCourseGenerationJob.STATUS_QUEUED) |
-                                                        Q(workflow_state=CanvasCourseGenerationJob.STATUS_RUNNING) |
-                                                        Q(workflow_state=CanvasCourseGenerationJob.STATUS_PENDING_FINALIZE))
+        # Queued/running jobs are only polled once they are due (see _get_next_poll_delay). Completed and
+        # pending_finalize jobs are left to the finalize_course_jobs command.
+        now = timezone.now()
+        jobs = list(CanvasCourseGenerationJob.objects.filter(
+            (Q(workflow_state=CanvasCourseGenerationJob.STATUS_QUEUED) |
+             Q(workflow_state=CanvasCourseGenerationJob.STATUS_RUNNING)) &
+            (Q(next_poll_at__isnull=True) | Q(next_poll_at__lte=now))))
+
+        # Poll Canvas for the migration progress of all queued/running jobs up front, in parallel, so that the
+        # (serial) processing loop below does not wait on one progress request at a time
+        concurrency = getattr(settings, 'PROCESS_ASYNC_JOBS', {}).get('progress_poll_concurrency', 1)
+        progress_responses = _fetch_progress_for_jobs(jobs, concurrency)
+
+        # jobs whose content migration has completed are moved to the completed state together, after the loop
+        completed_job_ids = []
 
         for job in jobs:
             try:
@@ -65,59 +78,15 @@ class Command(NoArgsCommand):
                 logger.info(job_start_message)
                 user_profile = None
 
-                # Check if the job is flagged for migration or is running the migration
-                workflow_state = job.workflow_state
-
-                if workflow_state in (CanvasCourseGenerationJob.STATUS_QUEUED,
-                                      CanvasCourseGenerationJob.STATUS_RUNNING):
-                    response = client.get(SDK_CONTEXT, job.status_url)
-                    progress_response = response.json()
-                    workflow_state = progress_response['workflow_state']
+                progress_response = progress_responses[job.pk]
+                if isinstance(progress_response, Exception):
+                    # polling failed for this job; handle it like any other processing error
+                    raise progress_response
+                workflow_state = progress_response['workflow_state']
 
-                    if workflow_state == CanvasCourseGenerationJob.STATUS_COMPLETED:
-                        logger.info('content migration complete for course with sis_course_id %s' % job.sis_course_id)
-                        # Update the Job table with the completed state immediately to indicate that the template
-                        # migration was successful
-                        job.workflow_state = CanvasCourseGenerationJob.STATUS_COMPLETED
-                        job.save(update_fields=['workflow_state'])
-
-                if workflow_state in (CanvasCourseGenerationJob.STATUS_COMPLETED,
-                                      CanvasCourseGenerationJob.STATUS_PENDING_FINALIZE):
-
-                    logger.debug('Workflow state updated, starting finalization process...')
-                    try:
-                        update_syllabus_body(job)
-                        canvas_course_url = finalize_new_canvas_course(
-                            job.canvas_course_id,
-                            job.sis_course_id,
-                            'sis_user_id:%s' % job.created_by_user_id,
-                            job.bulk_job_id
-                        )
-                    except Exception as e:
-                        # Catch exceptions from finalize method to set the workflow_state to STATUS_FINALIZE_FAILED
-                        # and then re raise it so that generic tasks like tech logger, email generation will continue
-                        # to be handled in the larger try block
-
-                        job.workflow_state = CanvasCourseGenerationJob.STATUS_FINALIZE_FAILED
-                        job.save(update_fields=['workflow_state'])
-
-                        raise
-
-                    # Update the Job table with the STATUS_FINALIZED state if finalize is successful
-                    job.workflow_state = CanvasCourseGenerationJob.STATUS_FINALIZED
-                    job.save(update_fields=['workflow_state'])
-
-                    # if this is not a bulk_job then proceed with email generation to user
-                    if not job.bulk_job_id:
-                        # Once finalized successfully, only the initiator needs to be emailed
-                        user_profile = get_canvas_user_profile(job.created_by_user_id)
-                        to_address = [user_profile['primary_email']]
-                        success_msg = settings.CANVAS_EMAIL_NOTIFICATION['course_migration_success_body']
-                        logger.debug("notifying success via email: to_addr=%s and adding course url =%s" % (to_address, canvas_course_url))
-
-                        # add the course url to the  message
-                        complete_msg = success_msg.format(canvas_course_url)
-                        send_email_helper(settings.CANVAS_EMAIL_NOTIFICATION['course_migration_success_subject'], complete_msg, to_address)
+                if workflow_state == CanvasCourseGenerationJob.STATUS_COMPLETED:
+                    logger.info('content migration complete for course with sis_course_id %s' % job.sis_course_id)
+                    completed_job_ids.append(job.pk)
 
                 elif workflow_state == CanvasCourseGenerationJob.STATUS_FAILED:
                     error_text = 'Content migration failed for course with sis_course_id %s (HUID:%s)' \
@@ -144,6 +113,12 @@ class Command(NoArgsCommand):
                     message = 'content migration state is %s for course with sis_course_id %s' % (workflow_state, job.sis_course_id)
                     logger.info(message)
 
+                    delay = _get_next_poll_delay(job, progress_response.get('completion'), now)
+                    job.next_poll_at = now + timedelta(seconds=delay)
+                    job.save(update_fields=['next_poll_at'])
+                    logger.debug('next progress check for course with sis_course_id %s in %d seconds',
+                                 job.sis_course_id, delay)
+
             except Exception as e:
                 error_text = "There was a problem in processing the job for canvas course sis_course_id %s (HUID:%s)" \
                              % (job.sis_course_id, job.created_by_user_id)
@@ -172,9 +147,79 @@ class Command(NoArgsCommand):
                         logger.exception(error_text)
                         tech_logger.exception(error_text)
 
+        # Update the Job table with the completed state to indicate that the template migrations were
+        # successful; the jobs will be picked up by the finalize_course_jobs command
+        if completed_job_ids:
+            try:
+                CanvasCourseGenerationJob.objects.transition_many(
+                    completed_job_ids,
+                    (CanvasCourseGenerationJob.STATUS_QUEUED, CanvasCourseGenerationJob.STATUS_RUNNING),
+                    CanvasCourseGenerationJob.STATUS_COMPLETED
+                )
+            except Exception:
+                # the jobs are still queued/running, so their progress will be checked again on the next run
+                logger.exception("There was a problem in saving the completed state of %d jobs",
+                                 len(completed_job_ids))
+
+        log_connection_stats()
+
         # unlock and close the file used for determining if another process is running
         try:
             fcntl.lockf(_pid_file_handle, fcntl.LOCK_UN)
             _pid_file_handle.close()
         except IOError:
             logger.error("could not release lock on pid file or close pid file properly")
+
+
+def _get_next_poll_delay(job, completion, now):
+    """
+    Returns how many seconds to wait before polling the progress of a content migration that is still queued or
+    running. If Canvas reports some progress, the wait is half the estimated time left (based on how long the job
+    has taken to reach its current completion); otherwise it grows with the age of the job. Either way it is kept
+    between PROCESS_ASYNC_JOBS['poll_min_interval_secs'] and ['poll_max_interval_secs'].
+    :param job: the CanvasCourseGenerationJob
+    :param completion: percent complete from the progress response (may be None)
+    :param now: the current (aware) datetime
+    :return: number of seconds
+    """
+    poll_settings = getattr(settings, 'PROCESS_ASYNC_JOBS', {})
+    min_interval = poll_settings.get('poll_min_interval_secs', 60)
+    max_interval = poll_settings.get('poll_max_interval_secs', 15 * 60)
+
+    age = max((now - job.created_at).total_seconds(), 0) if job.created_at else 0
+    try:
+        completion = float(completion)
+    except (TypeError, ValueError):
+        completion = 0
+    if 0 < completion < 100:
+        delay = age * (100 - completion) / completion / 2
+    else:
+        delay = age * poll_settings.get('poll_age_factor', 0.25)
+    return int(min(max(delay, min_interval), max_interval))
+
+
+def _fetch_progress(job):
+    """
+    Fetches the content migration progress for a job from Canvas. Returns the decoded progress response, or the
+    exception raised while fetching it so that the caller can handle it along with the rest of the job's processing.
+    """
+    try:
+        return client.get(SDK_CONTEXT, job.status_url).json()
+    except Exception as e:
+        return e
+
+
+def _fetch_progress_for_jobs(jobs, concurrency=1):
+    """
+    Fetches the content migration progress of every queued or running job in jobs, using up to concurrency
+    parallel requests over the shared SDK_CONTEXT session.
+    :param jobs: list of CanvasCourseGenerationJobs
+    :param concurrency: maximum number of progress requests in flight at once
+    :return: dict mapping job pk to the progress response (or the exception raised fetching it)
+    """
+    polled_jobs = [job for job in jobs if job.workflow_state in (CanvasCourseGenerationJob.STATUS_QUEUED,
+                                                                 CanvasCourseGenerationJob.STATUS_RUNNING)]
+    if polled_jobs:
+        logger.info('Polling progress for %d content migrations with concurrency %d', len(polled_jobs), concurrency)
+    responses = map_concurrently(_fetch_progress, polled_jobs, concurrency=concurrency)
+    return {job.pk: response for job, response in zip(polled_jobs, responses)}
@@ -0,0 +1,129 @@
+"""
+Send the notification emails queued in the QueuedEmail table.
+    To invoke this Command type "python manage.py send_queued_emails"
+"""
+import smtplib
+
+from django.core.mail import EmailMessage, get_connection
+from django.core.management.base import NoArgsCommand
+from django.conf import settings
+from canvas_course_site_wizard.models import QueuedEmail
+import logging
+import fcntl
+
+logger = logging.getLogger(__name__)
+tech_logger = logging.getLogger('tech_mail')
+
+
+class Command(NoArgsCommand):
+    """
+    Send the emails queued by controller.send_email_helper(). Up to EMAIL_OUTBOX['batch_size'] due emails are
+    sent per run over a single SMTP connection. Transient failures are retried with an increasing delay, up to
+    EMAIL_OUTBOX['max_attempts'] attempts; emails the mail server rejects outright are not retried.
+    To invoke this Command type "python manage.py send_queued_emails"
+    """
+    help = "Send the notification emails queued in the QueuedEmail table"
+
+    def handle_noargs(self, **options):
+        """
+        select the queued emails that are due in the QueuedEmail table and send them
+        """
+
+        # open and lock the file used for determining if another process is running
+        _pid_file = getattr(settings, 'SEND_QUEUED_EMAILS_PID_FILE', 'send_queued_emails.pid')
+        _pid_file_handle = open(_pid_file, 'w')
+        try:
+            fcntl.lockf(_pid_file_handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError:
+            # another instance is running
+            logger.error("another instance of the command is already running")
+            return
+
+        batch_size = _get_outbox_setting('batch_size', 100)
+        emails = list(QueuedEmail.objects.get_ready_to_send()[:batch_size])
+        if emails:
+            logger.info('Sending %d queued emails', len(emails))
+            _send_batch(emails)
+
+        # unlock and close the file used for determining if another process is running
+        try:
+            fcntl.lockf(_pid_file_handle, fcntl.LOCK_UN)
+            _pid_file_handle.close()
+        except IOError:
+            logger.error("could not release lock on pid file or close pid file properly")
+
+
+def _get_outbox_setting(name, default):
+    return getattr(settings, 'EMAIL_OUTBOX', {}).get(name, default)
+
+
+def _send_batch(emails):
+    """
+    Sends the given emails over one connection to the mail server. The connection is re-opened after a failed
+    send, since the server may have dropped it.
+    """
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as e:
+        logger.exception("Could not connect to the mail server to send %d queued emails", len(emails))
+        for email in emails:
+            _record_failure(email, e)
+        return
+
+    try:
+        for email in emails:
+            message = EmailMessage(email.subject, email.message, email.from_address,
+                                   email.get_to_address_list(), connection=connection)
+            try:
+                message.send()
+            except Exception as e:
+                logger.exception("Problem sending queued email %s", email.pk)
+                _record_failure(email, e)
+                _reopen(connection)
+                continue
+            email.mark_sent()
+    finally:
+        connection.close()
+
+
+def _reopen(connection):
+    try:
+        connection.close()
+        connection.open()
+    except Exception:
+        # the next send will open a new connection if it can
+        logger.exception("Could not re-open the connection to the mail server")
+
+
+def _is_permanent_failure(error):
+    """
+    Returns True if the mail server rejected the email in a way that retrying will not fix (e.g. every
+    recipient was refused, or a 5xx reply)
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return True
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 500 <= error.smtp_code < 600
+    return False
+
+
+def _get_retry_delay(attempts):
+    """
+    Returns the number of seconds to wait before the next attempt to send an email that has failed the given
+    number of times, or None if it should not be retried
+    """
+    if attempts >= _get_outbox_setting('max_attempts', 5):
+        return None
+    delay = _get_outbox_setting('retry_min_interval_secs', 60) * 2 ** (attempts - 1)
+    return min(delay, _get_outbox_setting('retry_max_interval_secs', 60 * 60))
+
+
+def _record_failure(email, error):
+    retry_delay = None
+    if not _is_permanent_failure(error):
+        retry_delay = _get_retry_delay(email.attempts + 1)
+    email.mark_attempt_failed(repr(error), retry_delay_secs=retry_delay)
+    if retry_delay is None:
+        tech_logger.error("Giving up on queued email %s (subject: %s, to: %s) after %d attempts: %r"
+                          % (email.pk, email.subject, email.to_address, email.attempts, error))
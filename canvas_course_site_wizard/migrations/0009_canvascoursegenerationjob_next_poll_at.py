@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('canvas_course_site_wizard', '0008_auto_20150702_1317'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='canvascoursegenerationjob',
+            name='next_poll_at',
+            field=models.DateTimeField(db_index=True, null=True, blank=True),
+        ),
+    ]
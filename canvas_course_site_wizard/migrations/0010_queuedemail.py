@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('canvas_course_site_wizard', '0009_canvascoursegenerationjob_next_poll_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueuedEmail',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('subject', models.CharField(max_length=255)),
+                ('message', models.TextField()),
+                ('from_address', models.CharField(max_length=254)),
+                ('to_address', models.TextField()),
+                ('workflow_state', models.CharField(default=b'queued', max_length=20, db_index=True, choices=[(b'queued', b'queued'), (b'sent', b'sent'), (b'failed', b'failed')])),
+                ('attempts', models.IntegerField(default=0)),
+                ('last_error', models.TextField(null=True, blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('send_after', models.DateTimeField(default=django.utils.timezone.now, db_index=True)),
+                ('sent_at', models.DateTimeField(null=True, blank=True)),
+            ],
+            options={
+                'db_table': 'canvas_course_queued_email',
+            },
+        ),
+    ]
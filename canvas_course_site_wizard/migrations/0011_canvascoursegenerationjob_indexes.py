@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('canvas_course_site_wizard', '0010_queuedemail'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='canvascoursegenerationjob',
+            name='workflow_state',
+            field=models.CharField(default=b'setup', max_length=20, db_index=True, choices=[(b'setup', b'setup'), (b'setup_failed', b'setup_failed'), (b'queued', b'queued'), (b'running', b'running'), (b'completed', b'completed'), (b'failed', b'failed'), (b'pending_finalize', b'pending_finalize'), (b'finalized', b'finalized'), (b'finalize_failed', b'finalize_failed')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='canvascoursegenerationjob',
+            index_together=set([('bulk_job_id', 'workflow_state'), ('bulk_job_id', 'created_at'), ('sis_course_id', 'bulk_job_id')]),
+        ),
+    ]
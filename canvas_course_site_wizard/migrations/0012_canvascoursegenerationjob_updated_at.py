@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('canvas_course_site_wizard', '0011_canvascoursegenerationjob_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='canvascoursegenerationjob',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AlterIndexTogether(
+            name='canvascoursegenerationjob',
+            index_together=set([('bulk_job_id', 'workflow_state'), ('bulk_job_id', 'created_at'), ('sis_course_id', 'bulk_job_id'), ('bulk_job_id', 'updated_at')]),
+        ),
+    ]
@@ -1,17 +1,16 @@
 from .models_api import get_course_data
-from icommons_common.canvas_utils import SessionInactivityExpirationRC
+from .sdk_context import get_sdk_context
 from canvas_sdk.methods import admins
 from django.core.exceptions import ObjectDoesNotExist, PermissionDenied
 from django.views.generic.detail import SingleObjectMixin
 from django.http import Http404
-from django.conf import settings
 
 from django.utils.translation import ugettext as _
 
 import logging
 
 # Set up the request context that will be used for canvas API calls
-SDK_CONTEXT = SessionInactivityExpirationRC(**settings.CANVAS_SDK_SETTINGS)
+SDK_CONTEXT = get_sdk_context()
 
 logger = logging.getLogger(__name__)
 
@@ -2,14 +2,23 @@ import logging
 import time
 
 from datetime import datetime, timedelta
-from django.db.models import Q
+from django.db.models import Q, Count, Sum, Case, When, Value, IntegerField
 from icommons_common.models import CourseInstance, CourseSite, SiteMap, SiteMapType
 from django.conf import settings
-from django.db import models
+from django.core.cache import cache
+from django.db import models, router, transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .canvas_cache import invalidate_template_course, invalidate_term_course_data
+from .job_status import publish_job_status
 
 
 logger = logging.getLogger(__name__)
 
+CACHE_KEY_SCHOOL_TEMPLATES = "canvas-school-templates_%s"
+
 
 class SISCourseDataMixin(object):
     """
@@ -126,6 +135,28 @@ class SISCourseDataMixin(object):
         SiteMap.objects.create(course_instance=self, course_site=site, map_type=sitemap_type)
         return site
 
+    def resolve_derived_fields(self):
+        """
+        Derives and stores sis_account_id, course_code, course_name and sis_term_id for this course in one go.
+        Course groups and departments are read with all() rather than count()/first(), so when the course's
+        course, term, course_groups and departments have been loaded up front (see models_api.get_course_data())
+        no further queries are made and later reads of the properties return the stored values.
+        :returns: self
+        """
+        course_groups = sorted(self.course.course_groups.all(), key=lambda g: g.pk)
+        departments = sorted(self.course.departments.all(), key=lambda d: d.pk)
+        if course_groups:
+            self._sis_account_id = 'coursegroup:%d' % course_groups[0].pk
+        elif departments:
+            self._sis_account_id = 'dept:%d' % departments[0].pk
+        else:
+            self._sis_account_id = 'school:%s' % self.course.school_id
+        # the remaining properties store their own values when first read
+        self.course_code
+        self.course_name
+        self.sis_term_id
+        return self
+
     def primary_section_name(self):
         """
         Derives the name of the primary (main) section for this course.
@@ -159,14 +190,7 @@ class CanvasCourseGenerationJobManager(models.Manager):
     Custom manager for CanvasCourseGenerationJob
     """
     def filter_complete(self, **kwargs):
-        kwargs.update({
-            'workflow_state__in': [
-                CanvasCourseGenerationJob.STATUS_FINALIZED,
-                CanvasCourseGenerationJob.STATUS_FINALIZE_FAILED,
-                CanvasCourseGenerationJob.STATUS_FAILED,
-                CanvasCourseGenerationJob.STATUS_SETUP_FAILED
-            ]
-        })
+        kwargs.update({'workflow_state__in': CanvasCourseGenerationJob.TERMINAL_STATES})
         return self.filter(**kwargs)
 
     def filter_successful(self, **kwargs):
@@ -174,15 +198,22 @@ class CanvasCourseGenerationJobManager(models.Manager):
         return self.filter(**kwargs)
 
     def filter_failed(self, **kwargs):
-        kwargs.update({
-            'workflow_state__in': [
-                CanvasCourseGenerationJob.STATUS_FINALIZE_FAILED,
-                CanvasCourseGenerationJob.STATUS_FAILED,
-                CanvasCourseGenerationJob.STATUS_SETUP_FAILED
-            ]
-        })
+        kwargs.update({'workflow_state__in': CanvasCourseGenerationJob.FAILED_STATES})
         return self.filter(**kwargs)
 
+    def get_workflow_state_counts(self, **kwargs):
+        """
+        Counts the jobs matching the given filter kwargs in each workflow state, using a single aggregate
+        (GROUP BY workflow_state) query, so that no job rows need to be loaded.
+        :return: dict keyed on workflow state, containing a count for every state in WORKFLOW_STATUS_CHOICES
+         (states without jobs have a count of 0)
+        """
+        counts = {state: 0 for (state, _) in CanvasCourseGenerationJob.WORKFLOW_STATUS_CHOICES}
+        rows = self.filter(**kwargs).order_by().values('workflow_state').annotate(total=Count('id'))
+        for row in rows:
+            counts[row['workflow_state']] = row['total']
+        return counts
+
     def filter_setup_for_bulkjobs(self, **kwargs):
         """
         filters CanvasCourseGenerationJobs with a workflow state of STATUS_SETUP
@@ -194,6 +225,60 @@ class CanvasCourseGenerationJobManager(models.Manager):
         })
         return self.filter(**kwargs)
 
+    def get_subjob_progress_counts(self, bulk_job_ids):
+        """
+        Counts the subjobs in intermediate and terminal workflow states for each of the given bulk jobs, using
+        a single aggregate (GROUP BY bulk_job_id) query.
+        :param bulk_job_ids: list of bulk job ids, or a values('id') queryset of bulk jobs (evaluated as a subquery)
+        :return: dict keyed on bulk_job_id, with values of the form {'intermediate': int, 'terminal': int};
+         bulk jobs without any subjobs are not included
+        """
+        rows = self.filter(bulk_job_id__in=bulk_job_ids).order_by().values('bulk_job_id').annotate(
+            intermediate=Sum(Case(
+                When(workflow_state__in=CanvasCourseGenerationJob.INTERMEDIATE_STATES, then=Value(1)),
+                default=Value(0),
+                output_field=IntegerField()
+            )),
+            terminal=Sum(Case(
+                When(workflow_state__in=CanvasCourseGenerationJob.TERMINAL_STATES, then=Value(1)),
+                default=Value(0),
+                output_field=IntegerField()
+            ))
+        )
+        return {
+            row['bulk_job_id']: {'intermediate': row['intermediate'], 'terminal': row['terminal']} for row in rows
+        }
+
+    def transition_many(self, ids, from_states, to_state, chunk_size=500):
+        """
+        Moves the jobs with the given ids that are in one of from_states to to_state, with a single conditional
+        UPDATE (... WHERE id IN (...) AND workflow_state IN (...)) per chunk of chunk_size ids. The matching rows
+        are locked (SELECT ... FOR UPDATE) within the same transaction first, so the rows reported as moved are
+        exactly the rows that were updated; jobs already moved on by another process are left alone.
+        :param ids: job ids
+        :param from_states: the workflow states the jobs may be moved from
+        :param to_state: the workflow state to move them to
+        :return: set of the ids of the jobs that were moved
+        """
+        ids = list(set(ids))
+        moved = set()
+        moved_single_jobs = []
+        with transaction.atomic(using=router.db_for_write(self.model)):
+            for i in range(0, len(ids), chunk_size):
+                chunk = list(self.select_for_update().filter(
+                    pk__in=ids[i:i + chunk_size],
+                    workflow_state__in=from_states
+                ).values_list('pk', 'bulk_job_id'))
+                if chunk:
+                    chunk_ids = [pk for (pk, _) in chunk]
+                    self.filter(pk__in=chunk_ids, workflow_state__in=from_states).update(
+                        workflow_state=to_state, updated_at=timezone.now())
+                    moved.update(chunk_ids)
+                    moved_single_jobs.extend(pk for (pk, bulk_job_id) in chunk if not bulk_job_id)
+        for pk in moved_single_jobs:
+            publish_job_status(pk, to_state)
+        return moved
+
 
 class CanvasCourseGenerationJob(models.Model):
     """
@@ -234,6 +319,26 @@ class CanvasCourseGenerationJob(models.Model):
         (STATUS_FINALIZE_FAILED, STATUS_FINALIZE_FAILED),
     )
 
+    # States a job will still move on from, and the states it ends up in
+    INTERMEDIATE_STATES = (
+        STATUS_SETUP,
+        STATUS_QUEUED,
+        STATUS_RUNNING,
+        STATUS_COMPLETED,
+        STATUS_PENDING_FINALIZE,
+    )
+    TERMINAL_STATES = (
+        STATUS_SETUP_FAILED,
+        STATUS_FAILED,
+        STATUS_FINALIZED,
+        STATUS_FINALIZE_FAILED,
+    )
+    FAILED_STATES = (
+        STATUS_SETUP_FAILED,
+        STATUS_FAILED,
+        STATUS_FINALIZE_FAILED,
+    )
+
     # User friendly identifiers for states
     STATUS_DISPLAY_NAMES = {
         STATUS_SETUP: 'Queued',
@@ -251,16 +356,34 @@ class CanvasCourseGenerationJob(models.Model):
     sis_course_id = models.CharField(max_length=20, db_index=True)
     content_migration_id = models.IntegerField(null=True, blank=True,)
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now_add=True)
+    # when the job's state (or another field in TRACKED_FIELDS) last changed; see save()
+    updated_at = models.DateTimeField(auto_now=True)
     status_url = models.CharField(null=True, blank=True, max_length=200)
-    workflow_state = models.CharField(max_length=20, choices=WORKFLOW_STATUS_CHOICES, default=STATUS_SETUP)
+    workflow_state = models.CharField(max_length=20, choices=WORKFLOW_STATUS_CHOICES, default=STATUS_SETUP,
+                                      db_index=True)
     created_by_user_id = models.CharField(max_length=20)
     bulk_job_id = models.IntegerField(null=True, blank=True)
+    # when process_async_jobs should next poll the content migration's progress (null means on its next run)
+    next_poll_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    # the fields shown to users watching a job's progress; saving any of them moves updated_at on
+    TRACKED_FIELDS = ('workflow_state', 'canvas_course_id')
 
     objects = CanvasCourseGenerationJobManager()
 
     class Meta:
         db_table = u'canvas_course_generation_job'
+        # indexes for the hot query shapes: a bulk job's subjobs by state (e.g. ready_to_finalize(),
+        # get_subjob_progress_counts()) or in creation order (bulk_site_creation.api.course_jobs), and a course's
+        # job within a bulk job (models_api.get_course_generation_data_for_sis_course_id()); jobs by state alone
+        # (e.g. process_async_jobs, filter_setup_for_bulkjobs()) use the workflow_state index, and a bulk job's
+        # recently changed subjobs (bulk_site_creation.api.course_job_changes) use the updated_at one
+        index_together = [
+            ('bulk_job_id', 'workflow_state'),
+            ('bulk_job_id', 'created_at'),
+            ('sis_course_id', 'bulk_job_id'),
+            ('bulk_job_id', 'updated_at'),
+        ]
 
     def __unicode__(self):
         #TODO: unit test for this method (skipped to support bug fix in QA testing)
@@ -271,6 +394,20 @@ class CanvasCourseGenerationJob(models.Model):
     def status_display_name(self):
         return CanvasCourseGenerationJob.STATUS_DISPLAY_NAMES[self.workflow_state]
 
+    def save(self, *args, **kwargs):
+        """
+        Saves the job, also saving updated_at (which auto_now sets) when only some fields are saved and they
+        include one of TRACKED_FIELDS, so that updated_at records every change to them. The workflow_state of
+        a single course job is published to its status page (see job_status.publish_job_status()).
+        """
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'updated_at' not in update_fields \
+                and set(update_fields) & set(self.TRACKED_FIELDS):
+            kwargs['update_fields'] = list(update_fields) + ['updated_at']
+        super(CanvasCourseGenerationJob, self).save(*args, **kwargs)
+        if not self.bulk_job_id and (update_fields is None or 'workflow_state' in update_fields):
+            publish_job_status(self.pk, self.workflow_state)
+
     def update_workflow_state(self, workflow_state, raise_exception=False):
         """
         Updates job workflow_state. Return True if update succeeded. If raise_exception param is not True, or not provided,
@@ -287,12 +424,36 @@ class CanvasCourseGenerationJob(models.Model):
         return True
 
 
+class CanvasSchoolTemplateManager(models.Manager):
+    """
+    Custom manager for the CanvasSchoolTemplate model
+    """
+    def get_templates_for_school(self, school_id):
+        """
+        Returns a list of the CanvasSchoolTemplates for the given school. The list is cached, since it is read
+        several times for every course created, and the cached list is invalidated whenever one of the school's
+        templates is saved or deleted.
+        """
+        cache_key = CACHE_KEY_SCHOOL_TEMPLATES % school_id
+        templates = cache.get(cache_key)
+        if templates is None:
+            templates = list(self.filter(school_id=school_id))
+            cache.set(
+                cache_key,
+                templates,
+                getattr(settings, 'CANVAS_API_CACHE', {}).get('school_templates_timeout_secs', 60 * 60)
+            )
+        return templates
+
+
 class CanvasSchoolTemplate(models.Model):
     template_id = models.IntegerField()
     school_id = models.CharField(max_length=10, db_index=True)
     is_default = models.BooleanField(default=False)
     include_course_info = models.BooleanField(default=False)
 
+    objects = CanvasSchoolTemplateManager()
+
     class Meta:
         db_table = u'canvas_school_template'
 
@@ -302,6 +463,42 @@ class CanvasSchoolTemplate(models.Model):
                                                                                self.template_id)
 
 
+def invalidate_school_templates(school_id):
+    """
+    Removes the cached list of CanvasSchoolTemplates for the given school (see
+    CanvasSchoolTemplateManager.get_templates_for_school()). Saving or deleting a template instance does this
+    through the receivers below, but bulk writes (e.g. queryset.update() or bulk_create()) send no signals, so
+    code making them must call this for every school whose templates it changed.
+    """
+    cache.delete(CACHE_KEY_SCHOOL_TEMPLATES % school_id)
+
+
+@receiver(pre_save, sender=CanvasSchoolTemplate)
+def _remember_previous_template(sender, instance, **kwargs):
+    # a template moved to another school (or pointed at another Canvas course) has to be dropped from the caches
+    # under its previous values as well
+    instance._previous_template = None
+    if instance.pk is not None:
+        instance._previous_template = sender.objects.filter(pk=instance.pk).values(
+            'school_id', 'template_id').first()
+
+
+@receiver(post_save, sender=CanvasSchoolTemplate)
+@receiver(post_delete, sender=CanvasSchoolTemplate)
+def _invalidate_school_templates_on_change(sender, instance, **kwargs):
+    invalidate_school_templates(instance.school_id)
+    # the template course's Canvas settings are usually set up just before the template is registered, so
+    # refresh them rather than let courses copy cached settings until they expire
+    invalidate_template_course(instance.template_id)
+    # set by _remember_previous_template() for this save only (deletes send no pre_save)
+    previous = instance.__dict__.pop('_previous_template', None)
+    if previous is not None:
+        if previous['school_id'] != instance.school_id:
+            invalidate_school_templates(previous['school_id'])
+        if previous['template_id'] != instance.template_id:
+            invalidate_template_course(previous['template_id'])
+
+
 class BulkCanvasCourseCreationJobManager(models.Manager):
     """
     Custom manager for BulkCanvasCourseCreationJob
@@ -355,6 +552,7 @@ class BulkCanvasCourseCreationJobManager(models.Manager):
         start = time.time()
         CanvasCourseGenerationJob.objects.bulk_create(course_jobs)
         logger.info("Created %d CanvasCourseGenerationJobs in %d", len(course_jobs), (time.time() - start) * 1000)
+        invalidate_term_course_data(sis_term_id)
 
         bulk_job.status = BulkCanvasCourseCreationJob.STATUS_PENDING
         bulk_job.save(update_fields=['status'])
@@ -392,6 +590,23 @@ class BulkCanvasCourseCreationJobManager(models.Manager):
         })
         return self.filter(**kwargs)
 
+    def get_jobs_ready_to_finalize(self):
+        """
+        Returns a list of the PENDING bulk jobs which have no subjobs left in an intermediate state (see
+        BulkCanvasCourseCreationJob.ready_to_finalize()). Subjob states for all pending bulk jobs are counted in
+        one aggregate query rather than one query per bulk job.
+        """
+        pending_jobs = list(self.get_jobs_by_status(BulkCanvasCourseCreationJob.STATUS_PENDING))
+        if not pending_jobs:
+            return []
+        progress_counts = CanvasCourseGenerationJob.objects.get_subjob_progress_counts(
+            self.get_jobs_by_status(BulkCanvasCourseCreationJob.STATUS_PENDING).values('id')
+        )
+        return [
+            job for job in pending_jobs
+            if not progress_counts.get(job.id, {}).get('intermediate')
+        ]
+
 
 
 class BulkCanvasCourseCreationJob(models.Model):
@@ -468,44 +683,120 @@ class BulkCanvasCourseCreationJob(models.Model):
         (i.e. all subjobs are in a terminal state)
         """
 
-        subjob_intermediate_states = [
-            CanvasCourseGenerationJob.STATUS_QUEUED,
-            CanvasCourseGenerationJob.STATUS_RUNNING,
-            CanvasCourseGenerationJob.STATUS_SETUP,
-            CanvasCourseGenerationJob.STATUS_COMPLETED,
-            CanvasCourseGenerationJob.STATUS_PENDING_FINALIZE
-        ]
         intermediate_subjob_count = CanvasCourseGenerationJob.objects.filter(
-            workflow_state__in= subjob_intermediate_states,
+            workflow_state__in=CanvasCourseGenerationJob.INTERMEDIATE_STATES,
             bulk_job_id=self.id).count()
 
         return self.status == BulkCanvasCourseCreationJob.STATUS_PENDING and intermediate_subjob_count == 0
 
     def get_failed_subjobs(self):
         """ Returns a list of subjobs in a known failed state """
-
-        subjob_failed_states = [
-            CanvasCourseGenerationJob.STATUS_SETUP_FAILED,
-            CanvasCourseGenerationJob.STATUS_FAILED,
-            CanvasCourseGenerationJob.STATUS_FINALIZE_FAILED
-        ]
-        subjobs = CanvasCourseGenerationJob.objects.filter(
-            workflow_state__in=subjob_failed_states,
-            bulk_job_id=self.id)
-
-        return list(subjobs)
+        return list(CanvasCourseGenerationJob.objects.filter_failed(bulk_job_id=self.id))
 
     def get_failed_subjobs_count(self):
-        return len(self.get_failed_subjobs())
+        return CanvasCourseGenerationJob.objects.filter_failed(bulk_job_id=self.id).count()
 
     def get_completed_subjobs(self):
         """ Returns a list of subjobs in a known finalized state """
-        subjobs = CanvasCourseGenerationJob.objects.filter(
-            workflow_state=CanvasCourseGenerationJob.STATUS_FINALIZED,
-            bulk_job_id=self.id
-        )
-        return list(subjobs)
+        return list(CanvasCourseGenerationJob.objects.filter_successful(bulk_job_id=self.id))
 
     def get_completed_subjobs_count(self):
-        return len(self.get_completed_subjobs())
+        return CanvasCourseGenerationJob.objects.filter_successful(bulk_job_id=self.id).count()
+
+    def get_subjob_state_counts(self):
+        """
+        Returns the number of subjobs in each workflow state, counted in the database with a single query
+        (see CanvasCourseGenerationJobManager.get_workflow_state_counts())
+        """
+        return CanvasCourseGenerationJob.objects.get_workflow_state_counts(bulk_job_id=self.id)
+
+
+class QueuedEmailManager(models.Manager):
+    """
+    Custom manager for QueuedEmail
+    """
+
+    def enqueue(self, subject, message, from_address, to_address):
+        """
+        Adds an email to the outbox, to be sent by the send_queued_emails command
+        :param subject: The subject for the email, a String
+        :param message: The body of the email, a String
+        :param from_address: The sender, a String
+        :param to_address: The list of recipients, a list of Strings
+        :return: the new QueuedEmail
+        """
+        return self.create(
+            subject=subject,
+            message=message,
+            from_address=from_address,
+            to_address=','.join(to_address)
+        )
+
+    def get_ready_to_send(self, now=None):
+        """
+        Returns the queued emails that are due to be sent (or retried), oldest first
+        """
+        return self.filter(
+            workflow_state=QueuedEmail.STATUS_QUEUED,
+            send_after__lte=now or timezone.now()
+        ).order_by('id')
 
+
+class QueuedEmail(models.Model):
+    """
+    Outbox for notification emails. Emails are queued by controller.send_email_helper() and sent in batches,
+    over a single SMTP connection, by the send_queued_emails command, which retries transient failures.
+    """
+    STATUS_QUEUED = 'queued'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+
+    WORKFLOW_STATUS_CHOICES = (
+        (STATUS_QUEUED, STATUS_QUEUED),
+        (STATUS_SENT, STATUS_SENT),
+        (STATUS_FAILED, STATUS_FAILED),
+    )
+
+    subject = models.CharField(max_length=255)
+    message = models.TextField()
+    from_address = models.CharField(max_length=254)
+    # comma-separated list of recipients
+    to_address = models.TextField()
+    workflow_state = models.CharField(max_length=20, choices=WORKFLOW_STATUS_CHOICES, default=STATUS_QUEUED,
+                                      db_index=True)
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # the email is not sent (or retried) before this time
+    send_after = models.DateTimeField(default=timezone.now, db_index=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    objects = QueuedEmailManager()
+
+    class Meta:
+        db_table = u'canvas_course_queued_email'
+
+    def __unicode__(self):
+        return "(QueuedEmail ID=%s: %s | %s)" % (self.pk, self.subject, self.workflow_state)
+
+    def get_to_address_list(self):
+        return [address for address in self.to_address.split(',') if address]
+
+    def mark_sent(self):
+        self.workflow_state = QueuedEmail.STATUS_SENT
+        self.attempts += 1
+        self.sent_at = timezone.now()
+        self.save(update_fields=['workflow_state', 'attempts', 'sent_at'])
+
+    def mark_attempt_failed(self, error, retry_delay_secs=None):
+        """
+        Records a failed attempt to send the email. If retry_delay_secs is given the email stays queued and is
+        retried after that delay, otherwise it is marked as failed and will not be retried.
+        """
+        self.attempts += 1
+        self.last_error = error
+        if retry_delay_secs is None:
+            self.workflow_state = QueuedEmail.STATUS_FAILED
+        else:
+            self.send_after = timezone.now() + timedelta(seconds=retry_delay_secs)
+        self.save(update_fields=['workflow_state', 'attempts', 'last_error', 'send_after'])
@@ -1,5 +1,7 @@
 import logging
 
+from django.db import router, transaction
+
 from .models import (
     SISCourseData,
     CanvasCourseGenerationJob,
@@ -12,20 +14,114 @@ from .exceptions import (
     MultipleDefaultTemplatesExistForSchool
 )
 
-from icommons_common.models import CourseInstance
+from icommons_common.models import CourseInstance, CourseSite, SiteMap, SiteMapType
 
 
 logger = logging.getLogger(__name__)
 
 
+def _get_course_data_query_set():
+    return SISCourseData.objects.select_related('course', 'term').prefetch_related(
+        'course__course_groups',
+        'course__departments'
+    )
+
+
 def get_course_data(course_sis_id):
     """
     Returns an instance of the SISCourseData class for the given
     course sis id.  Will raise either an ObjectDoesNotExist exception
     if the id does not map to an instance or a MultipleObjectsReturned
     exception if multiple instances match the input id.
+    The course's derived fields (sis_account_id, course_code, etc.) are
+    resolved up front from prefetched relations.
+    """
+    return _get_course_data_query_set().get(pk=course_sis_id).resolve_derived_fields()
+
+
+def get_course_data_bulk(course_sis_ids, chunk_size=500):
+    """
+    Returns a dict of SISCourseData instances for the given course sis ids,
+    keyed by course sis id (as a string). The ids are looked up in chunks of
+    chunk_size (to stay under the database's IN list limit); for each chunk
+    the courses, terms, course groups and departments are fetched in a
+    constant number of queries, and each instance's derived fields are
+    resolved from them. Ids that do not map to an instance are left out of
+    the result.
+    """
+    course_sis_ids = list(set(course_sis_ids))
+    course_data = {}
+    for i in range(0, len(course_sis_ids), chunk_size):
+        chunk = course_sis_ids[i:i + chunk_size]
+        for sis_course_data in _get_course_data_query_set().filter(pk__in=chunk):
+            course_data[str(sis_course_data.pk)] = sis_course_data.resolve_derived_fields()
+    return course_data
+
+
+def set_sync_to_canvas_bulk(course_sis_ids, sync_to_canvas_flag, chunk_size=500):
+    """
+    Updates the sync_to_canvas column of the course instance records for the given
+    course sis ids with a single UPDATE per chunk of chunk_size ids (the bulk
+    equivalent of SISCourseDataMixin.set_sync_to_canvas()). Returns the set of
+    course sis ids (as strings) that were updated; ids that do not map to an
+    instance are left out.
+    """
+    course_sis_ids = list(set(course_sis_ids))
+    updated = set()
+    for i in range(0, len(course_sis_ids), chunk_size):
+        chunk = course_sis_ids[i:i + chunk_size]
+        existing_ids = list(SISCourseData.objects.filter(pk__in=chunk).values_list('pk', flat=True))
+        if existing_ids:
+            SISCourseData.objects.filter(pk__in=existing_ids).update(sync_to_canvas=sync_to_canvas_flag)
+        updated.update(str(pk) for pk in existing_ids)
+    return updated
+
+
+def set_official_course_site_urls_bulk(urls_by_course_sis_id, chunk_size=500):
+    """
+    Creates the records necessary to make each given url the official course
+    site for its course (the bulk equivalent of
+    SISCourseDataMixin.set_official_course_site_url()). The CourseSites and the
+    SiteMaps are each created with bulk inserts, in a single transaction, and
+    the official SiteMapType is looked up once. Courses whose url is already
+    their official site are skipped, so that finalizing a course again (e.g.
+    after its job could not be moved on) does not give it a second official site.
+    :param urls_by_course_sis_id: dict of course site url keyed by course sis id
     """
-    return SISCourseData.objects.select_related('course').get(pk=course_sis_id)
+    if not urls_by_course_sis_id:
+        return
+    sitemap_type = SiteMapType.objects.get(map_type_id='official')
+    with transaction.atomic(using=router.db_for_write(SiteMap)):
+        course_sis_ids = list(urls_by_course_sis_id)
+        already_official = set()
+        for i in range(0, len(course_sis_ids), chunk_size):
+            already_official.update(
+                (str(course_instance_id), url) for (course_instance_id, url) in SiteMap.objects.filter(
+                    course_instance_id__in=course_sis_ids[i:i + chunk_size],
+                    map_type=sitemap_type
+                ).values_list('course_instance_id', 'course_site__external_id')
+            )
+        urls_by_course_sis_id = dict(
+            (str(course_sis_id), url) for (course_sis_id, url) in urls_by_course_sis_id.items()
+            if (str(course_sis_id), url) not in already_official
+        )
+        if not urls_by_course_sis_id:
+            return
+        urls = list(set(urls_by_course_sis_id.values()))
+        CourseSite.objects.bulk_create([CourseSite(site_type_id='external', external_id=url) for url in urls])
+        # bulk_create does not give back the new primary keys, so read them back: the new sites are the
+        # latest ones for their url that are not mapped to a course yet
+        sites_by_url = {}
+        for i in range(0, len(urls), chunk_size):
+            new_sites = CourseSite.objects.filter(site_type_id='external', external_id__in=urls[i:i + chunk_size],
+                                                  sitemap__isnull=True)
+            for site in new_sites:
+                if site.external_id not in sites_by_url or site.pk > sites_by_url[site.external_id].pk:
+                    sites_by_url[site.external_id] = site
+        SiteMap.objects.bulk_create([
+            SiteMap(course_instance_id=course_sis_id, course_site=sites_by_url[url], map_type=sitemap_type)
+            for course_sis_id, url in urls_by_course_sis_id.items()
+        ])
 
 
 def get_course_generation_data_for_canvas_course_id(canvas_course_id):
@@ -81,9 +177,10 @@ def get_default_template_for_school(school_code):
     NoTemplateExistsForSchool exception will be raised if the school does not have a template.
     If there are multiple default templates for the school, a MultipleDefaultTemplatesExistForSchool exception
     will be thrown.
+    The school's templates are read from a cache that is invalidated whenever a template is saved or deleted.
     """
     logger.debug("Fetching template for school_code=%s...", school_code)
-    query_set = CanvasSchoolTemplate.objects.filter(school_id=school_code)
+    query_set = CanvasSchoolTemplate.objects.get_templates_for_school(school_code)
     # Collect the templates flagged as default
     default_templates = [t for t in query_set if t.is_default]
     if default_templates:
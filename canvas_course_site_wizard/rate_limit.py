@@ -0,0 +1,121 @@
+"""
+Paces Canvas API calls to stay under Canvas's per-token rate limit. Canvas reports what is left of a token's
+request budget in the X-Rate-Limit-Remaining header of every response; the budget refills at a steady rate
+and requests are refused (403 "Rate Limit Exceeded") once it runs out. RateLimitGovernor keeps an estimate of
+the remaining budget and adapts the number of requests it lets through at once: it backs off as the budget
+runs low (and halves on a throttled response) and opens up again while the budget is healthy.
+"""
+import logging
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_REMAINING_HEADER = 'X-Rate-Limit-Remaining'
+
+
+def get_rate_limit_remaining(response):
+    """
+    Returns the remaining rate limit budget reported by the given Canvas API response, or None if it is not given.
+    """
+    if response is None:
+        return None
+    try:
+        return float(response.headers[RATE_LIMIT_REMAINING_HEADER])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def is_throttled(response):
+    """
+    Returns True if the given Canvas API response refused the request because the rate limit was exceeded.
+    """
+    return response is not None and response.status_code == 403 and 'Rate Limit Exceeded' in response.text
+
+
+class RateLimitGovernor(object):
+    """
+    Thread-safe governor for Canvas API requests. Call acquire() before sending a request and release() with its
+    response once it returns.
+    """
+    def __init__(self, low_watermark=200.0, high_watermark=500.0, refill_per_sec=10.0, max_in_flight=10,
+                 min_in_flight=1, max_wait_secs=30.0):
+        self.low_watermark = low_watermark
+        self.high_watermark = high_watermark
+        self.refill_per_sec = refill_per_sec
+        self.max_in_flight = max_in_flight
+        self.min_in_flight = min_in_flight
+        self.max_wait_secs = max_wait_secs
+
+        self._condition = threading.Condition()
+        self._limit = max_in_flight
+        self._in_flight = 0
+        self._remaining = None
+        self._remaining_at = None
+        self._stats = {'requests': 0, 'throttled': 0, 'delayed': 0, 'delay_secs': 0.0}
+
+    def _estimate_remaining(self, now):
+        # the budget refills steadily between responses
+        if self._remaining is None:
+            return None
+        return self._remaining + (now - self._remaining_at) * self.refill_per_sec
+
+    def _get_delay(self, now):
+        remaining = self._estimate_remaining(now)
+        if remaining is None or remaining >= self.low_watermark:
+            return 0
+        return min((self.low_watermark - remaining) / self.refill_per_sec, self.max_wait_secs)
+
+    def acquire(self):
+        """
+        Blocks until a request may be sent: waits for one of the in-flight slots, and then for the budget to
+        refill above the low watermark (up to max_wait_secs) if it is running low.
+        """
+        with self._condition:
+            while self._in_flight >= self._limit:
+                self._condition.wait()
+            self._in_flight += 1
+            self._stats['requests'] += 1
+            delay = self._get_delay(time.time())
+            if delay:
+                self._stats['delayed'] += 1
+                self._stats['delay_secs'] += delay
+        if delay:
+            logger.debug('Canvas API rate limit budget is low, waiting %.2f seconds', delay)
+            time.sleep(delay)
+
+    def release(self, response=None):
+        """
+        Frees the in-flight slot taken by acquire() and adapts to the budget reported by the request's response.
+        :param response: the requests response, or None if the request failed without one
+        """
+        with self._condition:
+            self._in_flight -= 1
+            now = time.time()
+            if is_throttled(response):
+                self._stats['throttled'] += 1
+                self._remaining = 0.0
+                self._remaining_at = now
+                self._limit = max(self._limit // 2, self.min_in_flight)
+            else:
+                remaining = get_rate_limit_remaining(response)
+                if remaining is not None:
+                    self._remaining = remaining
+                    self._remaining_at = now
+                    if remaining < self.low_watermark:
+                        self._limit = max(self._limit - 1, self.min_in_flight)
+                    elif remaining >= self.high_watermark:
+                        self._limit = min(self._limit + 1, self.max_in_flight)
+            self._condition.notify_all()
+
+    def get_stats(self):
+        """
+        Returns counts of the requests governed, how many were delayed (and for how long in total) and how many
+        were throttled by Canvas, along with the current in-flight limit.
+        :return: dict
+        """
+        with self._condition:
+            stats = dict(self._stats)
+            stats['in_flight_limit'] = self._limit
+        return stats
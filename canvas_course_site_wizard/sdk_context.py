@@ -0,0 +1,157 @@
+"""
+Provides the Canvas SDK request context shared by every module (and every worker thread) in a process. All
+Canvas API calls go through one keep-alive requests session whose connection pool is sized by CANVAS_SDK_POOL,
+so long bulk runs reuse their TLS connections instead of re-establishing them for each burst of calls. The
+session also paces its requests with a RateLimitGovernor (configured by CANVAS_API_RATE_LIMIT) and retries
+requests that Canvas throttles.
+"""
+import logging
+import threading
+
+import requests
+
+from requests.adapters import HTTPAdapter
+
+from django.conf import settings
+
+from canvas_sdk import RequestContext
+
+from .rate_limit import RateLimitGovernor, is_throttled
+
+
+logger = logging.getLogger(__name__)
+
+# SessionInactivityExpirationRC settings that do not apply to the pooled context (idle connections are
+# checked, and replaced if dropped, by the connection pool itself)
+_UNUSED_SDK_SETTINGS = ('session_inactivity_expiration_time_secs',)
+
+
+class GovernedSession(requests.Session):
+    """
+    Requests session that sends each request through a RateLimitGovernor. A request that Canvas throttles is
+    sent again (after the governor has backed off) up to throttle_retries times before the throttled response
+    is returned to the caller.
+    """
+    def __init__(self, governor, throttle_retries=3):
+        super(GovernedSession, self).__init__()
+        self.governor = governor
+        self.throttle_retries = throttle_retries
+
+    def request(self, method, url, *args, **kwargs):
+        attempt = 0
+        while True:
+            self.governor.acquire()
+            response = None
+            try:
+                response = super(GovernedSession, self).request(method, url, *args, **kwargs)
+            finally:
+                self.governor.release(response)
+            if not is_throttled(response) or attempt >= self.throttle_retries:
+                return response
+            attempt += 1
+            logger.warning('Canvas API request %s %s was throttled, retrying (%d of %d)',
+                           method, url, attempt, self.throttle_retries)
+
+
+class PooledRequestContext(RequestContext):
+    """
+    Canvas SDK request context whose requests session is created once, on first use, with a connection pool
+    of a fixed size per host. The session is shared by all the threads using the context.
+    """
+    def __init__(self, pool_connections=10, pool_maxsize=10, pool_block=True, governor=None, throttle_retries=3,
+                 **kwargs):
+        for name in _UNUSED_SDK_SETTINGS:
+            kwargs.pop(name, None)
+        super(PooledRequestContext, self).__init__(**kwargs)
+        self._pool_connections = pool_connections
+        self._pool_maxsize = pool_maxsize
+        self._pool_block = pool_block
+        self.governor = governor or RateLimitGovernor()
+        self._throttle_retries = throttle_retries
+        self._adapter = None
+        self._pooled_session = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def session(self):
+        if self._pooled_session is None:
+            with self._session_lock:
+                if self._pooled_session is None:
+                    self._adapter = HTTPAdapter(
+                        pool_connections=self._pool_connections,
+                        pool_maxsize=self._pool_maxsize,
+                        pool_block=self._pool_block
+                    )
+                    session = GovernedSession(self.governor, throttle_retries=self._throttle_retries)
+                    session.headers.update({'Authorization': 'Bearer %s' % self.auth_token})
+                    session.mount('https://', self._adapter)
+                    session.mount('http://', self._adapter)
+                    self._pooled_session = session
+        return self._pooled_session
+
+    @session.setter
+    def session(self, value):
+        # the base class may assign a session of its own; the pooled session is always used instead
+        pass
+
+    def get_connection_stats(self):
+        """
+        Returns counts of the requests sent and the connections opened by this context's connection pools,
+        e.g. to tune CANVAS_SDK_POOL. connections_reused is the number of requests that did not need a new
+        connection.
+        :return: dict
+        """
+        stats = {'hosts': 0, 'requests': 0, 'connections_opened': 0, 'connections_reused': 0}
+        if self._adapter is None:
+            return stats
+        pools = self._adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            stats['hosts'] += 1
+            stats['requests'] += pool.num_requests
+            stats['connections_opened'] += pool.num_connections
+        stats['connections_reused'] = max(stats['requests'] - stats['connections_opened'], 0)
+        return stats
+
+
+_sdk_context = None
+_sdk_context_lock = threading.Lock()
+
+
+def get_sdk_context():
+    """
+    Returns the request context shared by all Canvas SDK calls in this process, creating it from
+    CANVAS_SDK_SETTINGS and CANVAS_SDK_POOL the first time it is needed.
+    :return: PooledRequestContext
+    """
+    global _sdk_context
+    if _sdk_context is None:
+        with _sdk_context_lock:
+            if _sdk_context is None:
+                kwargs = dict(settings.CANVAS_SDK_SETTINGS)
+                kwargs.update(getattr(settings, 'CANVAS_SDK_POOL', {}))
+                rate_limit_settings = dict(getattr(settings, 'CANVAS_API_RATE_LIMIT', {}))
+                kwargs['throttle_retries'] = rate_limit_settings.pop('throttle_retries', 3)
+                kwargs['governor'] = RateLimitGovernor(**rate_limit_settings)
+                _sdk_context = PooledRequestContext(**kwargs)
+    return _sdk_context
+
+
+def log_connection_stats():
+    """
+    Logs the shared context's connection reuse counts (see PooledRequestContext.get_connection_stats()) and
+    rate limiting counts (see RateLimitGovernor.get_stats()).
+    """
+    context = get_sdk_context()
+    stats = context.get_connection_stats()
+    logger.info(
+        'Canvas API connections: %d requests to %d hosts over %d connections (%d requests reused a connection)',
+        stats['requests'], stats['hosts'], stats['connections_opened'], stats['connections_reused']
+    )
+    stats = context.governor.get_stats()
+    logger.info(
+        'Canvas API rate limit: %d requests, %d delayed (%.1f seconds in total), %d throttled, in-flight limit %d',
+        stats['requests'], stats['delayed'], stats['delay_secs'], stats['throttled'], stats['in_flight_limit']
+    )
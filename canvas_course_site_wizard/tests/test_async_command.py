@@ -2,9 +2,9 @@ from django.test import TestCase
 from mock import patch, ANY, DEFAULT, Mock, MagicMock
 from canvas_course_site_wizard.models import CanvasCourseGenerationJob
 from canvas_course_site_wizard.management.commands import process_async_jobs
-from canvas_course_site_wizard.exceptions import (CanvasCourseAlreadyExistsError, CopySISEnrollmentsError,
-                                                  MarkOfficialError)
 from django.test.utils import override_settings
+from django.utils import timezone
+from datetime import timedelta
 
 
 def start_job_with_noargs():
@@ -30,9 +30,6 @@ def mock_user_profile(profile_mock, return_value='a@a.com'):
     'canvas_course_site_wizard.management.commands.process_async_jobs',
     send_failure_email=DEFAULT,
     logger=DEFAULT,
-    update_syllabus_body=DEFAULT,
-    finalize_new_canvas_course=DEFAULT,
-    send_email_helper=DEFAULT,
     get_canvas_user_profile=DEFAULT,
     client=DEFAULT,
     tech_logger=DEFAULT
@@ -94,25 +91,11 @@ class CommandsTestCase(TestCase):
         start_job_with_noargs()
         client.get.assert_called_with(ANY, self.status_url)
 
-    def test_process_async_jobs_invokes_correct_methods_on_completed_status(self, client, get_canvas_user_profile,
-            send_email_helper, **kwargs):
-        """
-        test that the send_email_helper and get_canvas_user_profile helper method are called
-        with the right params when the workflow_state of the job changes to 'completed'
-        """
-
-        mock_client_json(client, 'completed')
-        mock_user_profile(get_canvas_user_profile)
-
-        start_job_with_noargs()
-        get_canvas_user_profile.assert_called_with(self.created_by_user_id)
-        send_email_helper.assert_called_once_with(ANY, ANY, ANY)
-
     @patch('canvas_course_site_wizard.management.commands.process_async_jobs.CanvasCourseGenerationJob.objects.filter')
     def test_process_async_jobs_doesnt_send_email_for_bulk_created_course(self, filter_mock, client,
-                                                                          send_email_helper, **kwargs):
+                                                                          send_failure_email, **kwargs):
         """
-        test that the send_email_helper is not called for a bulk created course,
+        test that the send_failure_email is not called for a bulk created course,
         irrespective of the workflow_state
         """
         mock_client_json(client, 'this can be anything')
@@ -121,13 +104,13 @@ class CommandsTestCase(TestCase):
         iterable_ccmjob_mock.__iter__ = Mock(return_value=iter([self.m_canvas_content_migration_job_with_bulk_id]))
 
         start_job_with_noargs()
-        self.assertFalse(send_email_helper.called)
+        self.assertFalse(send_failure_email.called)
 
     @patch('canvas_course_site_wizard.management.commands.process_async_jobs.logger.info')
     @patch('canvas_course_site_wizard.management.commands.process_async_jobs.CanvasCourseGenerationJob.objects.filter')
     def test_process_async_jobs_on_failure_for_bulk_course_calls_tech_logger(self, mock_logger, filter_mock, client,
-                                                                             get_canvas_user_profile, send_email_helper,
-                                                                             tech_logger, **kwargs):
+                                                                             get_canvas_user_profile, tech_logger,
+                                                                             **kwargs):
         """
         test that the tech_logger is called even for bulk jobs when there is a failure.
         """
@@ -154,45 +137,8 @@ class CommandsTestCase(TestCase):
         send_failure_email.assert_called_with(ANY, ANY)
         self.assertEqual(tech_logger.error.call_count, 1)
 
-    def test_process_async_jobs_sends_failure_email_when_error_in_finalize_method(self, client,
-            get_canvas_user_profile, finalize_new_canvas_course, send_failure_email, **kwargs):
-        """
-        test that the sync jobs send a failure email notification on any exception raised by finalize_new_canvas_course
-        for a non-bulk created course
-        """
-
-        mock_client_json(client, 'completed')
-        mock_user_profile(get_canvas_user_profile)
-
-        finalize_new_canvas_course.side_effect = Exception
-        start_job_with_noargs()
-        send_failure_email.assert_called_with(ANY, ANY)
-
-    def test_tech_logger_on_error(self, client, get_canvas_user_profile, finalize_new_canvas_course,
-            send_failure_email, tech_logger, **kwargs):
-        """ test that tech_logger is called on general error in process (e.g. in finalize method) """
-
-        mock_client_json(client, 'completed')
-        mock_user_profile(get_canvas_user_profile)
-
-        finalize_new_canvas_course.side_effect = Exception
-        start_job_with_noargs()
-        self.assertEqual(tech_logger.exception.call_count, 1)
-
-    def test_tech_logger_on_renderableexception(self, client, get_canvas_user_profile, finalize_new_canvas_course,
-            send_failure_email, tech_logger, **kwargs):
-        """ test that tech_logger uses the display_text of a RenderableException when available """
-
-        mock_client_json(client, 'completed')
-        mock_user_profile(get_canvas_user_profile)
-
-        e = CanvasCourseAlreadyExistsError(self.sis_course_id)
-        finalize_new_canvas_course.side_effect = e
-        start_job_with_noargs()
-        tech_logger.exception.assert_called_with('%s (HUID:%s)' % (e.display_text, self.created_by_user_id))
-
     def test_process_async_jobs_sends_failure_email_when_any_exception_occurs(self, client, get_canvas_user_profile,
-            send_email_helper, finalize_new_canvas_course, logger, send_failure_email, **kwargs):
+            logger, send_failure_email, **kwargs):
         """ test that the sync jobs send a failure email notification on an exception during job processing """
 
         client.get.side_effect = Exception
@@ -201,107 +147,78 @@ class CommandsTestCase(TestCase):
         start_job_with_noargs()
         send_failure_email.assert_called_with(ANY, ANY)
 
-    def test_process_async_jobs_logs_exception_thrown_by_send_email_helper(self, client, get_canvas_user_profile,
-            send_email_helper, finalize_new_canvas_course, logger, **kwargs):
-        """ Test that an exception is raised when send_email_helper method throws an exception """
-
-        mock_client_json(client, 'completed')
-        mock_user_profile(get_canvas_user_profile)
-        send_email_helper.side_effect = Exception
-
-        start_job_with_noargs()
-        self.assertTrue(logger.exception.called)
-
-    def test_tech_logger_on_exception_thrown_by_send_email_helper(self, client, get_canvas_user_profile,
-              send_email_helper, finalize_new_canvas_course, logger, tech_logger, **kwargs):
-        """ Test that tech_logger is called when send_email_helper method throws an exception """
-
-        mock_client_json(client, 'completed')
-        mock_user_profile(get_canvas_user_profile)
-        send_email_helper.side_effect = Exception
-
-        start_job_with_noargs()
-        self.assertEqual(tech_logger.exception.call_count, 1)
-
-    def test_process_async_jobs_logs_exception(self, client, get_canvas_user_profile, logger, **kwargs):
-        """ Test that an exception is properly logged by the async job """
-        mock_client_json(client, 'completed')
-        get_canvas_user_profile.side_effect = Exception
-
-        start_job_with_noargs()
-        self.assertTrue(logger.exception.called)
-
-    def test_no_user_profile_when_handling_exception(self, client, get_canvas_user_profile, finalize_new_canvas_course,
-            logger, **kwargs):
-        """ When handling an exception, if there is not yet a canvas user profile then we should attempt to fetch it """
-        mock_client_json(client, 'completed')
-        finalize_new_canvas_course.side_effect = Exception
-
-        start_job_with_noargs()
-        self.assertEqual(get_canvas_user_profile.call_count, 1)
-
-    def test_job_workflow_state_saved_when_status_complete_and_finalize_throws_exception(self, client,
-            get_canvas_user_profile, send_email_helper, finalize_new_canvas_course, **kwargs):
-        """
-        Test that the  CanvasCourseGenerationJob's  workflow state is updated to STATUS_FINALIZE_FAILED
-        when there is an exception in finalizing
-        """
-        mock_client_json(client, CanvasCourseGenerationJob.STATUS_COMPLETED)
-        finalize_new_canvas_course.side_effect = Exception
-
-        start_job_with_noargs()
-        cm = CanvasCourseGenerationJob.objects.get(pk=self.migration.pk)
-        self.assertEqual(cm.workflow_state, CanvasCourseGenerationJob.STATUS_FINALIZE_FAILED)
-
-    def test_job_workflow_state_saved_when_status_failed_and_finalize_throws_exception(self, client,
-            get_canvas_user_profile, send_email_helper, finalize_new_canvas_course, **kwargs):
+    def test_job_workflow_state_saved_when_status_failed(self, client, get_canvas_user_profile, **kwargs):
         """
         Test that the CanvasCourseGenerationJob's  workflow state is updated to failure
-        regardless of whether finalizing throws an exception
+        when the content migration fails
         """
         mock_client_json(client, 'failed')
-        finalize_new_canvas_course.side_effect = Exception
 
         start_job_with_noargs()
         cm = CanvasCourseGenerationJob.objects.get(pk=self.migration.pk)
         self.assertEqual(cm.workflow_state, CanvasCourseGenerationJob.STATUS_FAILED)
 
-    def test_job_workflow_state_saved_after_finalize_success(self, client,
-            get_canvas_user_profile, send_email_helper, finalize_new_canvas_course, **kwargs):
+    def test_job_workflow_state_saved_when_status_complete(self, client, get_canvas_user_profile, **kwargs):
         """
-        Test that the  CanvasCourseGenerationJob's  state is updated from 'complete' to
-         CanvasCourseGenerationJob.STATUS_FINALIZED after finalize is  successful
+        Test that a job whose content migration has completed is saved as STATUS_COMPLETED (to be finalized by
+        the finalize_course_jobs command) and that no emails are sent yet
         """
         mock_client_json(client, CanvasCourseGenerationJob.STATUS_COMPLETED)
 
         start_job_with_noargs()
         cm = CanvasCourseGenerationJob.objects.get(pk=self.migration.pk)
-        self.assertEqual(cm.workflow_state, CanvasCourseGenerationJob.STATUS_FINALIZED)
+        self.assertEqual(cm.workflow_state, CanvasCourseGenerationJob.STATUS_COMPLETED)
+        self.assertFalse(get_canvas_user_profile.called)
 
+    @override_settings(PROCESS_ASYNC_JOBS={'progress_poll_concurrency': 4})
+    def test_progress_polled_once_per_job_with_concurrency(self, client, get_canvas_user_profile, **kwargs):
+        """ Each queued/running job's progress should be requested exactly once when polling in parallel """
+        mock_client_json(client, 'running')
+        other_migration = self.create_migration_job_from_setup()
+        other_migration.workflow_state = CanvasCourseGenerationJob.STATUS_RUNNING
+        other_migration.save()
 
-    def test_job_workflow_state_saved_when_finalize_fails_during_sync_to_canvas(self, client,
-            get_canvas_user_profile, send_email_helper, finalize_new_canvas_course, **kwargs):
-        """
-        Test that the  CanvasCourseGenerationJob's workflow state is updated from
-        CanvasCourseGenerationJob.STATUS_COMPLETED to CanvasCourseGenerationJob.STATUS_FINALIZE_FAILED
-        when finalize fails due to CopySISEnrollmentsError Exception(set_sync_to_canvas fails)
-        """
-        mock_client_json(client, CanvasCourseGenerationJob.STATUS_COMPLETED)
-        finalize_new_canvas_course.side_effect = CopySISEnrollmentsError
         start_job_with_noargs()
-        cm = CanvasCourseGenerationJob.objects.get(pk=self.migration.pk)
-        self.assertEqual(cm.workflow_state, CanvasCourseGenerationJob.STATUS_FINALIZE_FAILED)
+        self.assertEqual(client.get.call_count, 2)
+        cm = CanvasCourseGenerationJob.objects.get(pk=other_migration.pk)
+        self.assertEqual(cm.workflow_state, CanvasCourseGenerationJob.STATUS_RUNNING)
 
-    def test_job_workflow_state_saved_when_finalize_fails_due_to_mark_official(self, client,
-            get_canvas_user_profile, send_email_helper, finalize_new_canvas_course, **kwargs):
-        """
-        Test that the  CanvasCourseGenerationJob's workflow state is updated from CanvasCourseGenerationJob.STATUS_COMPLETED to
-         CanvasCourseGenerationJob.STATUS_FINALIZE_FAILED when finalize fails due to
-         MarkOfficialError Exception (mark official failure)
-        """
-        mock_client_json(client, CanvasCourseGenerationJob.STATUS_COMPLETED)
-        finalize_new_canvas_course.side_effect = MarkOfficialError
+    def test_running_job_scheduled_for_later_poll(self, client, **kwargs):
+        """ A job that is still running should not be due for another progress check straight away """
+        mock_client_json(client, CanvasCourseGenerationJob.STATUS_RUNNING)
         start_job_with_noargs()
         cm = CanvasCourseGenerationJob.objects.get(pk=self.migration.pk)
-        self.assertEqual(cm.workflow_state, CanvasCourseGenerationJob.STATUS_FINALIZE_FAILED)
+        self.assertGreater(cm.next_poll_at, timezone.now())
+
+    def test_job_not_polled_before_next_poll_at(self, client, **kwargs):
+        """ Jobs whose next_poll_at is in the future should be skipped """
+        self.migration.next_poll_at = timezone.now() + timedelta(minutes=5)
+        self.migration.save()
+        start_job_with_noargs()
+        self.assertFalse(client.get.called)
+
 
+class NextPollDelayTestCase(TestCase):
+    """
+    tests for the backoff between content migration progress checks
+    """
+    def setUp(self):
+        self.now = timezone.now()
+
+    @override_settings(PROCESS_ASYNC_JOBS={'poll_min_interval_secs': 60, 'poll_max_interval_secs': 900})
+    def test_delay_is_half_the_estimated_time_left(self):
+        job = Mock(created_at=self.now - timedelta(seconds=600))
+        # 25% done after 10 minutes: about 30 minutes left, so check again in 15
+        self.assertEqual(process_async_jobs._get_next_poll_delay(job, 25, self.now), 900)
+        # 75% done after 10 minutes: about 200 seconds left
+        self.assertEqual(process_async_jobs._get_next_poll_delay(job, 75, self.now), 100)
+
+    @override_settings(PROCESS_ASYNC_JOBS={'poll_min_interval_secs': 60, 'poll_max_interval_secs': 900,
+                                           'poll_age_factor': 0.25})
+    def test_delay_grows_with_age_without_completion(self):
+        self.assertEqual(
+            process_async_jobs._get_next_poll_delay(Mock(created_at=self.now), None, self.now), 60)
+        self.assertEqual(process_async_jobs._get_next_poll_delay(
+            Mock(created_at=self.now - timedelta(seconds=1200)), 0, self.now), 300)
+        self.assertEqual(process_async_jobs._get_next_poll_delay(
+            Mock(created_at=self.now - timedelta(days=1)), None, self.now), 900)
@@ -0,0 +1,121 @@
+from unittest import TestCase
+from mock import patch, Mock, ANY
+from canvas_course_site_wizard.canvas_cache import (
+    get_template_course,
+    invalidate_template_course,
+    get_term_course_data_version,
+    invalidate_term_course_data,
+    get_cached_user_profile,
+    cache_user_profile,
+    USER_PROFILE_MISSING
+)
+
+
+@patch('canvas_course_site_wizard.canvas_cache.cache')
+@patch('canvas_course_site_wizard.canvas_cache.get_single_course_courses')
+class TemplateCourseCacheTests(TestCase):
+    def setUp(self):
+        self.template_id = 6066
+        self.template_course = {'is_public': True, 'public_syllabus': False, 'is_public_to_auth_users': True}
+        invalidate_template_course(self.template_id)
+
+    def tearDown(self):
+        invalidate_template_course(self.template_id)
+
+    def test_fetches_from_canvas_on_miss(self, m_get_course, m_cache):
+        """ a template course not in either cache should be fetched from Canvas and stored in the shared cache """
+        m_cache.get.return_value = None
+        m_get_course.return_value = Mock(json=Mock(return_value=self.template_course))
+        self.assertEqual(get_template_course(self.template_id), self.template_course)
+        self.assertEqual(m_get_course.call_count, 1)
+        m_cache.set.assert_called_once_with('canvas-template-course_6066', self.template_course, 3600)
+
+    def test_repeat_lookups_use_local_cache(self, m_get_course, m_cache):
+        """ repeated lookups for the same template should not go back to Canvas or the shared cache """
+        m_cache.get.return_value = None
+        m_get_course.return_value = Mock(json=Mock(return_value=self.template_course))
+        for _ in range(5):
+            get_template_course(self.template_id)
+        self.assertEqual(m_get_course.call_count, 1)
+        self.assertEqual(m_cache.get.call_count, 1)
+
+    def test_shared_cache_hit_skips_canvas(self, m_get_course, m_cache):
+        """ a template course found in the shared cache should not be fetched from Canvas """
+        m_cache.get.return_value = self.template_course
+        self.assertEqual(get_template_course(self.template_id), self.template_course)
+        self.assertFalse(m_get_course.called)
+
+    def test_invalidate_forces_refetch(self, m_get_course, m_cache):
+        """ after invalidation the template course should be fetched again """
+        m_cache.get.return_value = None
+        m_get_course.return_value = Mock(json=Mock(return_value=self.template_course))
+        get_template_course(self.template_id)
+        invalidate_template_course(self.template_id)
+        get_template_course(self.template_id)
+        self.assertEqual(m_get_course.call_count, 2)
+        m_cache.delete.assert_called_with('canvas-template-course_6066')
+
+
+@patch('canvas_course_site_wizard.canvas_cache.cache')
+class TermCourseDataVersionTests(TestCase):
+    def test_existing_version_returned(self, m_cache):
+        """ the version stored in the shared cache should be returned as is """
+        m_cache.get.return_value = '1234.5'
+        self.assertEqual(get_term_course_data_version(4579), '1234.5')
+        self.assertFalse(m_cache.add.called)
+
+    def test_new_version_added_when_missing(self, m_cache):
+        """ a term without a version should get one, without overwriting a concurrently added version """
+        m_cache.get.return_value = None
+        m_cache.add.return_value = True
+        version = get_term_course_data_version(4579)
+        m_cache.add.assert_called_once_with('term-course-data-version_4579', version, None)
+
+    def test_invalidate_sets_new_version(self, m_cache):
+        """ invalidating a term should store a new version for it """
+        invalidate_term_course_data(4579)
+        m_cache.set.assert_called_once_with('term-course-data-version_4579', ANY, None)
+
+    def test_invalidate_failure_not_raised(self, m_cache):
+        """ a cache failure while invalidating should be logged rather than raised """
+        m_cache.set.side_effect = Exception('redis unavailable')
+        invalidate_term_course_data(4579)
+
+
+@patch.dict('canvas_course_site_wizard.canvas_cache._local_cache', clear=True)
+@patch('canvas_course_site_wizard.canvas_cache.cache')
+class UserProfileCacheTests(TestCase):
+    def setUp(self):
+        self.sis_user_id = '12345678'
+        self.profile = {'primary_email': 'a@a.com'}
+
+    def test_miss_returns_none(self, m_cache):
+        """ a user with nothing cached in either cache should give None """
+        m_cache.get.return_value = None
+        self.assertIsNone(get_cached_user_profile(self.sis_user_id))
+
+    def test_cached_profile_read_locally(self, m_cache):
+        """ a profile just cached should be read back without a shared cache round trip """
+        cache_user_profile(self.sis_user_id, self.profile)
+        self.assertEqual(get_cached_user_profile(self.sis_user_id), self.profile)
+        self.assertFalse(m_cache.get.called)
+        m_cache.set.assert_called_once_with('canvas-user-profile_12345678', self.profile, 3600)
+
+    def test_missing_user_cached_for_shorter_time(self, m_cache):
+        """ a user Canvas does not have should be cached with the shorter, negative timeout """
+        with self.settings(CANVAS_API_CACHE={'user_profile_timeout_secs': 3600,
+                                             'user_profile_missing_timeout_secs': 60}):
+            cache_user_profile(self.sis_user_id, USER_PROFILE_MISSING)
+        m_cache.set.assert_called_once_with('canvas-user-profile_12345678', USER_PROFILE_MISSING, 60)
+        self.assertEqual(get_cached_user_profile(self.sis_user_id), USER_PROFILE_MISSING)
+
+    def test_shared_cache_hit(self, m_cache):
+        """ a profile cached by another process should be found in the shared cache """
+        m_cache.get.return_value = self.profile
+        self.assertEqual(get_cached_user_profile(self.sis_user_id), self.profile)
+        m_cache.get.assert_called_once_with('canvas-user-profile_12345678')
+
+    def test_cache_failure_not_raised(self, m_cache):
+        """ a shared cache failure while caching a profile should be logged rather than raised """
+        m_cache.set.side_effect = Exception('redis unavailable')
+        cache_user_profile(self.sis_user_id, self.profile)
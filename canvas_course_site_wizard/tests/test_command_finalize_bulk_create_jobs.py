@@ -3,7 +3,7 @@ from mock import patch, ANY, Mock
 from canvas_course_site_wizard.management.commands.finalize_bulk_create_jobs import (
     _send_notification,
 )
-from canvas_course_site_wizard.models import BulkCanvasCourseCreationJob as BulkJob
+from canvas_course_site_wizard.models import BulkCanvasCourseCreationJob as BulkJob, CanvasCourseGenerationJob
 from canvas_course_site_wizard.management.commands import finalize_bulk_create_jobs
 from django.test.utils import override_settings
 
@@ -13,6 +13,13 @@ def start_job_with_noargs():
     cmd.handle_noargs()
 
 
+def get_mock_subjob_state_counts(completed=0, failed=0):
+    counts = {state: 0 for (state, _) in CanvasCourseGenerationJob.WORKFLOW_STATUS_CHOICES}
+    counts[CanvasCourseGenerationJob.STATUS_FINALIZED] = completed
+    counts[CanvasCourseGenerationJob.STATUS_FAILED] = failed
+    return counts
+
+
 def get_mock_bulk_job():
     return Mock(
         spec=BulkJob,
@@ -22,7 +29,8 @@ def get_mock_bulk_job():
         created_by_user_id='12345678',
         status=BulkJob.STATUS_PENDING,
         update_status=Mock(return_value=True),
-        ready_to_finalize=Mock(return_value=True)
+        ready_to_finalize=Mock(return_value=True),
+        get_subjob_state_counts=Mock(return_value=get_mock_subjob_state_counts())
     )
 
 
@@ -37,28 +45,35 @@ class FinalizeBulkCanvasCourseCreationJobsCommandTests(TestCase):
     """
 
     @patch('canvas_course_site_wizard.management.commands.finalize_bulk_create_jobs.logger')
-    @patch('canvas_course_site_wizard.management.commands.finalize_bulk_create_jobs.BulkJob.objects.get_jobs_by_status')
+    @patch('canvas_course_site_wizard.management.commands.finalize_bulk_create_jobs.BulkJob.objects.get_jobs_ready_to_finalize')
     def test_finalize_bulk_create_jobs_no_pending_jobs(self, m_queryset, m_logger, **kwargs):
         """ exit gracefully if there are no jobs in the table that require checking pending subjobs """
-        m_queryset.return_value = BulkJob.objects.none()
+        m_queryset.return_value = []
         start_job_with_noargs()
         self.assertEqual(m_logger.debug.call_count, 0)
         self.assertEqual(m_logger.error.call_count, 0)
         self.assertEqual(m_logger.exception.call_count, 0)
 
     @patch('canvas_course_site_wizard.management.commands.finalize_bulk_create_jobs.logger')
-    @patch('canvas_course_site_wizard.management.commands.finalize_bulk_create_jobs.BulkJob.objects.get_jobs_by_status')
-    def test_finalize_bulk_create_jobs_pending_jobs_leave_pending(self, m_queryset, m_logger, **kwargs):
+    @patch('canvas_course_site_wizard.management.commands.finalize_bulk_create_jobs._send_notification')
+    def test_finalize_bulk_create_jobs_pending_jobs_leave_pending(self, m_send, m_logger, **kwargs):
         """ exit gracefully if the pending jobs still have pending subjobs (so bulk jobs should not be finalized) """
-        m_bulk_job = get_mock_bulk_job()
-        m_bulk_job.ready_to_finalize.return_value = False
-        m_queryset.return_value = [m_bulk_job]
+        bulk_job = BulkJob.objects.create(school_id='colgsas', sis_term_id=1, status=BulkJob.STATUS_PENDING,
+                                          created_by_user_id='12345678')
+        CanvasCourseGenerationJob.objects.create(sis_course_id='1', bulk_job_id=bulk_job.id,
+                                                 workflow_state=CanvasCourseGenerationJob.STATUS_RUNNING,
+                                                 created_by_user_id='12345678')
+        CanvasCourseGenerationJob.objects.create(sis_course_id='2', bulk_job_id=bulk_job.id,
+                                                 workflow_state=CanvasCourseGenerationJob.STATUS_FINALIZED,
+                                                 created_by_user_id='12345678')
         start_job_with_noargs()
+        self.assertFalse(m_send.called)
+        self.assertEqual(BulkJob.objects.get(pk=bulk_job.pk).status, BulkJob.STATUS_PENDING)
         self.assertEqual(m_logger.error.call_count, 0)
         self.assertEqual(m_logger.exception.call_count, 0)
 
     @patch('canvas_course_site_wizard.management.commands.finalize_bulk_create_jobs._send_notification')
-    @patch('canvas_course_site_wizard.management.commands.finalize_bulk_create_jobs.BulkJob.objects.get_jobs_by_status')
+    @patch('canvas_course_site_wizard.management.commands.finalize_bulk_create_jobs.BulkJob.objects.get_jobs_ready_to_finalize')
     def test_finalize_bulk_create_jobs_finalize_pending_jobs(self, m_queryset, m_send, **kwargs):
         """ if the pending jobs have no pending subjobs (ie they are all in terminal state) then finalize bulk jobs """
         m_bulk_job = get_mock_bulk_job()
@@ -71,7 +86,7 @@ class FinalizeBulkCanvasCourseCreationJobsCommandTests(TestCase):
 
     @patch('canvas_course_site_wizard.management.commands.finalize_bulk_create_jobs.logger.exception')
     @patch('canvas_course_site_wizard.management.commands.finalize_bulk_create_jobs._send_notification')
-    @patch('canvas_course_site_wizard.management.commands.finalize_bulk_create_jobs.BulkJob.objects.get_jobs_by_status')
+    @patch('canvas_course_site_wizard.management.commands.finalize_bulk_create_jobs.BulkJob.objects.get_jobs_ready_to_finalize')
     def test_finalize_bulk_create_jobs_save_fails_before_notification(self, m_queryset, m_send, m_logger, **kwargs):
         """ if we fail updating the job status before the send step, failure is logged and no notification is sent """
         m_bulk_job = get_mock_bulk_job()
@@ -85,7 +100,7 @@ class FinalizeBulkCanvasCourseCreationJobsCommandTests(TestCase):
 
     @patch('canvas_course_site_wizard.management.commands.finalize_bulk_create_jobs.logger.exception')
     @patch('canvas_course_site_wizard.management.commands.finalize_bulk_create_jobs._send_notification')
-    @patch('canvas_course_site_wizard.management.commands.finalize_bulk_create_jobs.BulkJob.objects.get_jobs_by_status')
+    @patch('canvas_course_site_wizard.management.commands.finalize_bulk_create_jobs.BulkJob.objects.get_jobs_ready_to_finalize')
     def test_finalize_bulk_create_jobs_save_fails_after_notification(self, m_queryset, m_send, m_logger, **kwargs):
         """ if we fail updating the job status after the notification is sent failure is still logged """
         m_bulk_job = get_mock_bulk_job()
@@ -106,8 +121,7 @@ class FinalizeBulkCanvasCourseCreationJobsCommandTests(TestCase):
         """ notification for finalized bulk jobs where all subjobs succeeded should reflect that fact """
         m_profile.return_value = {'primary_email': 'icommons-technical@g.harvard.edu'}
         m_bulk_job = get_mock_bulk_job()
-        m_bulk_job.get_completed_subjobs_count.return_value = 1
-        m_bulk_job.get_failed_subjobs_count.return_value = 0
+        m_bulk_job.get_subjob_state_counts.return_value = get_mock_subjob_state_counts(completed=1, failed=0)
         self.assertTrue(_send_notification(m_bulk_job))
         m_body.assert_called_once_with(ANY, ANY, 1, 0)
 
@@ -119,8 +133,7 @@ class FinalizeBulkCanvasCourseCreationJobsCommandTests(TestCase):
         """ notifications for finalized bulk jobs should represent the successes and failures of the subjobs """
         m_profile.return_value = {'primary_email': 'icommons-technical@g.harvard.edu'}
         m_bulk_job = get_mock_bulk_job()
-        m_bulk_job.get_completed_subjobs_count.return_value = 1
-        m_bulk_job.get_failed_subjobs_count.return_value = 2
+        m_bulk_job.get_subjob_state_counts.return_value = get_mock_subjob_state_counts(completed=1, failed=2)
         self.assertTrue(_send_notification(m_bulk_job))
         m_body.assert_called_once_with(ANY, ANY, 1, 2)
 
@@ -148,8 +161,7 @@ class FinalizeBulkCanvasCourseCreationJobsCommandTests(TestCase):
             'primary_email': 'icommons-technical@g.harvard.edu'
         }
         m_bulk_job = get_mock_bulk_job()
-        m_bulk_job.get_completed_subjobs_count.return_value = 1
-        m_bulk_job.get_failed_subjobs_count.return_value = 1
+        m_bulk_job.get_subjob_state_counts.return_value = get_mock_subjob_state_counts(completed=1, failed=1)
         m_term.side_effect = Exception('term lookup failed')
         self.assertTrue(_send_notification(m_bulk_job))
         m_subj.assert_called_with(m_bulk_job.school_id, m_bulk_job.sis_term_id)
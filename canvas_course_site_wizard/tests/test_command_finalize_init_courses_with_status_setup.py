@@ -1,4 +1,6 @@
+from django.conf import settings
 from django.test import TestCase
+from django.test.utils import override_settings
 from mock import patch, ANY, DEFAULT, Mock, MagicMock, call
 from canvas_course_site_wizard.management.commands.finalize_bulk_create_jobs import _init_courses_with_status_setup
 from canvas_course_site_wizard.models import CanvasCourseGenerationJob, BulkCanvasCourseCreationJob
@@ -23,8 +25,11 @@ class ContentMigrationJob:
         self.workflow_state = state
 
 
+# the subjobs are set up serially, so that list side effects and ordered call assertions line up with them
+@override_settings(BULK_COURSE_CREATION=dict(settings.BULK_COURSE_CREATION, setup_concurrency=1))
 @patch.multiple('canvas_course_site_wizard.management.commands.finalize_bulk_create_jobs',
-                get_course_data=DEFAULT, create_canvas_course=DEFAULT, start_course_template_copy=DEFAULT)
+                get_course_data_bulk=DEFAULT, get_course_data=DEFAULT, create_canvas_course=DEFAULT,
+                start_course_template_copy=DEFAULT)
 class FinalizeInitCoursesWithStatusSetupCommandTests(TestCase):
 
     def setUp(self):
@@ -56,7 +61,7 @@ class FinalizeInitCoursesWithStatusSetupCommandTests(TestCase):
     @patch('canvas_course_site_wizard.management.commands.finalize_bulk_create_jobs.'
            'CanvasCourseGenerationJob.objects.filter_setup_for_bulkjobs')
     def test_that_create_course_is_call_with_all_bulk_job_courses(self, mock_getjobs, mock_filter_bulk_jobs,
-                                                                  get_course_data, create_canvas_course,
+                                                                  get_course_data_bulk, get_course_data, create_canvas_course,
                                                                   start_course_template_copy):
         """
         test that create_canvas_course is called with all the courses that have a status of 'setup'
@@ -67,7 +72,7 @@ class FinalizeInitCoursesWithStatusSetupCommandTests(TestCase):
         template_copy_calls = []
         for index, course in enumerate(self.courses):
             create_course_calls.append(
-                call(course, self.user_id, bulk_job=BulkCanvasCourseCreationJob(id=self.bulk_job_id))
+                call(course, self.user_id, bulk_job=BulkCanvasCourseCreationJob(id=self.bulk_job_id), course_data=ANY)
             )
             create_course_calls.append(ANY)
             template_copy_calls.append(
@@ -84,7 +89,7 @@ class FinalizeInitCoursesWithStatusSetupCommandTests(TestCase):
     @patch('canvas_course_site_wizard.management.commands.finalize_bulk_create_jobs.'
            'CanvasCourseGenerationJob.objects.filter_setup_for_bulkjobs')
     def test_that_logger_is_called_when_course_already_exists(self, mock_getjobs, mock_logger, mock_filter_bulk_jobs,
-                                                              get_course_data, create_canvas_course,
+                                                              get_course_data_bulk, get_course_data, create_canvas_course,
                                                               start_course_template_copy):
         """
         test that logger is called when the course already exists in canvas
@@ -104,7 +109,7 @@ class FinalizeInitCoursesWithStatusSetupCommandTests(TestCase):
     @patch('canvas_course_site_wizard.management.commands.finalize_bulk_create_jobs.'
            'CanvasCourseGenerationJob.objects.filter_setup_for_bulkjobs')
     def test_that_logger_is_called_when_course_generation_fails(self, mock_getjobs, mock_logger, mock_filter_bulk_jobs,
-                                                                get_course_data, create_canvas_course,
+                                                                get_course_data_bulk, get_course_data, create_canvas_course,
                                                                 start_course_template_copy):
         """
         test that logger is called when the course generation fails
@@ -122,7 +127,7 @@ class FinalizeInitCoursesWithStatusSetupCommandTests(TestCase):
     @patch('canvas_course_site_wizard.management.commands.finalize_bulk_create_jobs.BulkJob.objects.filter')
     @patch('canvas_course_site_wizard.management.commands.finalize_bulk_create_jobs.'
            'CanvasCourseGenerationJob.objects.filter_setup_for_bulkjobs')
-    def test_that_workflow_state_is_properly_updated_when_no_template_exists(self, mock_getjobs, mock_filter_bulk_jobs, get_course_data, create_canvas_course, start_course_template_copy):
+    def test_that_workflow_state_is_properly_updated_when_no_template_exists(self, mock_getjobs, mock_filter_bulk_jobs, get_course_data_bulk, get_course_data, create_canvas_course, start_course_template_copy):
         """
         workflow state of CCG job should be updated to setup_failed
          template is expected but not found at run time
@@ -133,3 +138,44 @@ class FinalizeInitCoursesWithStatusSetupCommandTests(TestCase):
         _init_courses_with_status_setup()
         # make sure that the job's status is updated to STATUS_PENDING_FINALIZE
         self.assertEqual(self.cm_jobs[1].workflow_state, CanvasCourseGenerationJob.STATUS_SETUP_FAILED)
+
+    @patch('canvas_course_site_wizard.management.commands.finalize_bulk_create_jobs.BulkJob.objects.filter')
+    @patch('canvas_course_site_wizard.management.commands.finalize_bulk_create_jobs.'
+           'CanvasCourseGenerationJob.objects.filter_setup_for_bulkjobs')
+    def test_that_unexpected_error_only_fails_its_own_subjob(self, mock_getjobs, mock_filter_bulk_jobs,
+                                                             get_course_data_bulk, get_course_data, create_canvas_course,
+                                                             start_course_template_copy):
+        """
+        an unexpected exception while setting up one subjob should mark that subjob as setup_failed
+        and the remaining subjobs should still be processed
+        """
+        mock_getjobs.return_value = self.cm_jobs[:3]
+        mock_filter_bulk_jobs.return_value = self.bulk_jobs
+        create_canvas_course.side_effect = [{'id': 1}, Exception('unexpected'), {'id': 3}]
+        _init_courses_with_status_setup()
+        self.assertEqual(create_canvas_course.call_count, 3)
+        self.assertEqual(start_course_template_copy.call_count, 2)
+        self.assertEqual(self.cm_jobs[1].workflow_state, CanvasCourseGenerationJob.STATUS_SETUP_FAILED)
+
+    @patch('canvas_course_site_wizard.management.commands.finalize_bulk_create_jobs.BulkJob.objects.filter')
+    @patch('canvas_course_site_wizard.management.commands.finalize_bulk_create_jobs.'
+           'CanvasCourseGenerationJob.objects.filter_setup_for_bulkjobs')
+    def test_that_course_data_is_loaded_once_for_all_courses(self, mock_getjobs, mock_filter_bulk_jobs,
+                                                             get_course_data_bulk, get_course_data,
+                                                             create_canvas_course, start_course_template_copy):
+        """
+        the SIS course data for all the setup subjobs should be loaded in one batch and passed through to
+        create_canvas_course and start_course_template_copy, rather than fetched per course
+        """
+        mock_getjobs.return_value = self.cm_jobs[:2]
+        mock_filter_bulk_jobs.return_value = self.bulk_jobs
+        course_data = {str(course): Mock(name='course_data_%s' % course) for course in self.courses[:2]}
+        get_course_data_bulk.return_value = course_data
+        _init_courses_with_status_setup()
+        get_course_data_bulk.assert_called_once_with(self.courses[:2])
+        self.assertFalse(get_course_data.called)
+        create_canvas_course.assert_any_call(self.courses[0], self.user_id, bulk_job=ANY,
+                                             course_data=course_data[str(self.courses[0])])
+        start_course_template_copy.assert_any_call(course_data[str(self.courses[1])], ANY, self.user_id,
+                                                   course_job_id=1, bulk_job_id=self.bulk_job_id,
+                                                   template_id=self.template_id)
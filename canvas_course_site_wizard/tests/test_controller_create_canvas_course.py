@@ -645,7 +645,7 @@ class CreateCanvasCourseTest(TestCase):
             self.assertEqual(course_data.canvas_course_id, self.canvas_course_id)
             course_data.save.assert_called_with(update_fields=['canvas_course_id'])
 
-    @patch('canvas_course_site_wizard.controller.get_single_course_courses')
+    @patch('canvas_course_site_wizard.controller.get_template_course')
     @patch('canvas_course_site_wizard.controller.update_course_generation_workflow_state')
     @patch('canvas_course_site_wizard.controller.CanvasCourseGenerationJob.objects.create')
     @patch('canvas_course_site_wizard.controller.CanvasCourseGenerationJob.objects.filter')
@@ -666,11 +666,11 @@ class CreateCanvasCourseTest(TestCase):
         query_set = Mock(get=Mock(return_value=job))
         course_generation_job__objects__filter.return_value = query_set
         course_model_mock = self.get_mock_of_get_course_data()
-        get_template_course.return_value = Bunch(json=lambda: {
+        get_template_course.return_value = {
             'is_public': True,
             'public_syllabus': True,
             'is_public_to_auth_users': True
-        })
+        }
         get_course_data.return_value = course_model_mock
         sis_account_id_argument = 'sis_account_id:' + course_model_mock.sis_account_id
         course_code_argument = course_model_mock.course_code
@@ -731,7 +731,7 @@ class CreateCanvasCourseTest(TestCase):
             course_is_public_to_auth_users=False
         )
 
-    @patch('canvas_course_site_wizard.controller.get_single_course_courses')
+    @patch('canvas_course_site_wizard.controller.get_template_course')
     @patch('canvas_course_site_wizard.controller.update_course_generation_workflow_state')
     @patch('canvas_course_site_wizard.controller.CanvasCourseGenerationJob.objects.create')
     @patch('canvas_course_site_wizard.controller.CanvasCourseGenerationJob.objects.filter')
@@ -752,11 +752,11 @@ class CreateCanvasCourseTest(TestCase):
         query_set = Mock(get=Mock(return_value=job))
         course_generation_job__objects__filter.return_value = query_set
         course_model_mock = self.get_mock_of_get_course_data()
-        get_template_course.return_value = Bunch(json=lambda: {
+        get_template_course.return_value = {
             'is_public': True,
             'public_syllabus': True,
             'is_public_to_auth_users': True
-        })
+        }
         get_course_data.return_value = course_model_mock
         sis_account_id_argument = 'sis_account_id:' + course_model_mock.sis_account_id
         course_code_argument = course_model_mock.course_code
@@ -779,7 +779,7 @@ class CreateCanvasCourseTest(TestCase):
             course_public_syllabus=True
         )
 
-    @patch('canvas_course_site_wizard.controller.get_single_course_courses')
+    @patch('canvas_course_site_wizard.controller.get_template_course')
     @patch('canvas_course_site_wizard.controller.update_course_generation_workflow_state')
     @patch('canvas_course_site_wizard.controller.CanvasCourseGenerationJob.objects.create')
     @patch('canvas_course_site_wizard.controller.CanvasCourseGenerationJob.objects.filter')
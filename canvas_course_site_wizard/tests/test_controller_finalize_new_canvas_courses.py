@@ -0,0 +1,85 @@
+from unittest import TestCase
+from mock import patch, DEFAULT, Mock
+from canvas_course_site_wizard.models import SISCourseData
+from canvas_course_site_wizard.controller import finalize_new_canvas_courses
+from canvas_course_site_wizard.exceptions import CopySISEnrollmentsError, MarkOfficialError
+
+
+@patch.multiple('canvas_course_site_wizard.controller', logger=DEFAULT, get_course_data=DEFAULT,
+                set_sync_to_canvas_bulk=DEFAULT, set_official_course_site_urls_bulk=DEFAULT)
+class FinalizeNewCanvasCoursesTest(TestCase):
+    def setUp(self):
+        self.jobs = [Mock(pk=1, sis_course_id=111, canvas_course_id=11),
+                     Mock(pk=2, sis_course_id=222, canvas_course_id=22)]
+
+    def test_courses_finalized_in_one_batch(self, set_sync_to_canvas_bulk, set_official_course_site_urls_bulk,
+                                            get_course_data, **kwargs):
+        """
+        The sync flag and the official sites should be set for all the courses with one call each, and each job's
+        result should be its course URL
+        """
+        set_sync_to_canvas_bulk.return_value = set(['111', '222'])
+        results = finalize_new_canvas_courses(self.jobs)
+        self.assertEqual(set_sync_to_canvas_bulk.call_count, 1)
+        self.assertEqual(sorted(set_sync_to_canvas_bulk.call_args[0][0]), ['111', '222'])
+        self.assertEqual(set_sync_to_canvas_bulk.call_args[0][1], SISCourseData.TURN_ON_SYNC_TO_CANVAS)
+        self.assertEqual(set_official_course_site_urls_bulk.call_count, 1)
+        self.assertEqual(sorted(set_official_course_site_urls_bulk.call_args[0][0].keys()), ['111', '222'])
+        self.assertFalse(get_course_data.called)
+        self.assertTrue(results[1].endswith('/11'))
+        self.assertTrue(results[2].endswith('/22'))
+
+    def test_missing_course_fails_sync(self, set_sync_to_canvas_bulk, set_official_course_site_urls_bulk, **kwargs):
+        """
+        A course that could not be flagged for sync should fail with CopySISEnrollmentsError and not be marked
+        as official
+        """
+        set_sync_to_canvas_bulk.return_value = set(['222'])
+        results = finalize_new_canvas_courses(self.jobs)
+        self.assertIsInstance(results[1], CopySISEnrollmentsError)
+        self.assertEqual(list(set_official_course_site_urls_bulk.call_args[0][0].keys()), ['222'])
+
+    def test_failed_batch_retried_per_course(self, set_sync_to_canvas_bulk, set_official_course_site_urls_bulk,
+                                             **kwargs):
+        """
+        If marking the courses official in one batch fails, each course should be retried on its own so that
+        only the failing course gets a MarkOfficialError
+        """
+        set_sync_to_canvas_bulk.return_value = set(['111', '222'])
+
+        def mark_official(urls_by_course_sis_id):
+            if len(urls_by_course_sis_id) > 1 or '111' in urls_by_course_sis_id:
+                raise Exception
+        set_official_course_site_urls_bulk.side_effect = mark_official
+        results = finalize_new_canvas_courses(self.jobs)
+        self.assertEqual(set_official_course_site_urls_bulk.call_count, 3)
+        self.assertIsInstance(results[1], MarkOfficialError)
+        self.assertTrue(results[2].endswith('/22'))
+
+    def test_jobs_for_same_course_each_get_a_result(self, set_sync_to_canvas_bulk, set_official_course_site_urls_bulk,
+                                                    **kwargs):
+        """
+        Every job for a course with more than one ready job should get a result, and the Canvas course of each
+        should be marked official
+        """
+        self.jobs.append(Mock(pk=3, sis_course_id=111, canvas_course_id=33))
+        set_sync_to_canvas_bulk.return_value = set(['111', '222'])
+        results = finalize_new_canvas_courses(self.jobs)
+        self.assertEqual(sorted(set_sync_to_canvas_bulk.call_args[0][0]), ['111', '222'])
+        self.assertEqual(sorted(results), [1, 2, 3])
+        self.assertTrue(results[1].endswith('/11'))
+        self.assertTrue(results[2].endswith('/22'))
+        self.assertTrue(results[3].endswith('/33'))
+        marked = set()
+        for call in set_official_course_site_urls_bulk.call_args_list:
+            marked.update((sis_course_id, url[-3:]) for (sis_course_id, url) in call[0][0].items())
+        self.assertEqual(marked, set([('111', '/11'), ('111', '/33'), ('222', '/22')]))
+
+    def test_jobs_for_same_course_fail_together(self, set_sync_to_canvas_bulk, **kwargs):
+        """ Every job for a course that could not be flagged for sync should get a CopySISEnrollmentsError """
+        self.jobs.append(Mock(pk=3, sis_course_id=111, canvas_course_id=33))
+        set_sync_to_canvas_bulk.return_value = set(['222'])
+        results = finalize_new_canvas_courses(self.jobs)
+        self.assertIsInstance(results[1], CopySISEnrollmentsError)
+        self.assertIsInstance(results[3], CopySISEnrollmentsError)
+        self.assertTrue(results[2].endswith('/22'))
@@ -1,31 +1,87 @@
 from unittest import TestCase
 from mock import patch, DEFAULT, ANY
 from canvas_course_site_wizard.controller import get_canvas_user_profile
+from canvas_course_site_wizard.canvas_cache import USER_PROFILE_MISSING
+from canvas_sdk.exceptions import CanvasAPIError
 import logging
 import unittest
 
 # Get an instance of a logger
 logger = logging.getLogger(__name__)
 
-@patch.multiple('canvas_course_site_wizard.controller', SDK_CONTEXT=DEFAULT, get_user_profile=DEFAULT)
+@patch.multiple('canvas_course_site_wizard.controller', SDK_CONTEXT=DEFAULT, get_user_profile=DEFAULT,
+                get_cached_user_profile=DEFAULT, cache_user_profile=DEFAULT)
 
 class GetCanvasUserProfileTest(TestCase):
     longMessage = True
 
     def setUp(self):
         self.user_id = "12345678"
+        self.profile = {'primary_email': 'a@a.com'}
 
-    def test_get_canvas_user_profile_method_called_with_right_params(self, SDK_CONTEXT, get_user_profile):
+    def test_get_canvas_user_profile_method_called_with_right_params(self, SDK_CONTEXT, get_user_profile, get_cached_user_profile, **kwargs):
         """
         Test get_user_profile is called with expected args
         """
+        get_cached_user_profile.return_value = None
         get_user_profile.return_value = DEFAULT
         result = get_canvas_user_profile(self.user_id)
         get_user_profile.assert_called_with(request_ctx=SDK_CONTEXT, user_id='sis_user_id:%s' % self.user_id)
 
-    def test_when_get_user_profile_method_raises_exception(self, SDK_CONTEXT, get_user_profile):
+    def test_when_get_user_profile_method_raises_exception(self, SDK_CONTEXT, get_user_profile, get_cached_user_profile, **kwargs):
         """
         Test to assert that an exception is raised when the get_user_profile method throws an exception
         """
+        get_cached_user_profile.return_value = None
         get_user_profile.side_effect = Exception
         self.assertRaises(Exception, get_canvas_user_profile, self.user_id)
+
+    def test_cached_profile_returned_without_request(self, SDK_CONTEXT, get_user_profile, get_cached_user_profile,
+                                                     **kwargs):
+        """
+        Test that a cached profile is returned without calling get_user_profile
+        """
+        get_cached_user_profile.return_value = self.profile
+        self.assertEqual(get_canvas_user_profile(self.user_id), self.profile)
+        self.assertFalse(get_user_profile.called)
+
+    def test_fetched_profile_is_cached(self, SDK_CONTEXT, get_user_profile, get_cached_user_profile,
+                                       cache_user_profile, **kwargs):
+        """
+        Test that a profile fetched from Canvas is cached for the user
+        """
+        get_cached_user_profile.return_value = None
+        get_user_profile.return_value.json.return_value = self.profile
+        self.assertEqual(get_canvas_user_profile(self.user_id), self.profile)
+        cache_user_profile.assert_called_once_with(self.user_id, self.profile)
+
+    def test_missing_user_is_cached(self, SDK_CONTEXT, get_user_profile, get_cached_user_profile,
+                                    cache_user_profile, **kwargs):
+        """
+        Test that a user Canvas does not have is cached as missing, and the error is re-raised
+        """
+        get_cached_user_profile.return_value = None
+        get_user_profile.side_effect = CanvasAPIError(status_code=404)
+        self.assertRaises(CanvasAPIError, get_canvas_user_profile, self.user_id)
+        cache_user_profile.assert_called_once_with(self.user_id, USER_PROFILE_MISSING)
+
+    def test_cached_missing_user_raises_without_request(self, SDK_CONTEXT, get_user_profile,
+                                                        get_cached_user_profile, **kwargs):
+        """
+        Test that a user cached as missing raises a 404 CanvasAPIError without calling get_user_profile
+        """
+        get_cached_user_profile.return_value = USER_PROFILE_MISSING
+        with self.assertRaises(CanvasAPIError) as cm:
+            get_canvas_user_profile(self.user_id)
+        self.assertEqual(cm.exception.status_code, 404)
+        self.assertFalse(get_user_profile.called)
+
+    def test_other_api_errors_are_not_cached(self, SDK_CONTEXT, get_user_profile, get_cached_user_profile,
+                                             cache_user_profile, **kwargs):
+        """
+        Test that API errors other than a missing user (e.g. a server error) are not cached
+        """
+        get_cached_user_profile.return_value = None
+        get_user_profile.side_effect = CanvasAPIError(status_code=500)
+        self.assertRaises(CanvasAPIError, get_canvas_user_profile, self.user_id)
+        self.assertFalse(cache_user_profile.called)
@@ -1,5 +1,5 @@
 from unittest import TestCase
-from mock import patch, DEFAULT, ANY
+from mock import patch
 from canvas_course_site_wizard.controller import send_failure_msg_to_support
 from django.test.utils import override_settings
 
@@ -11,7 +11,7 @@ override_settings_dict = {
     'environment': 'test'
 }
 
-@patch.multiple('canvas_course_site_wizard.controller', send_mail=DEFAULT)
+@patch('canvas_course_site_wizard.controller.QueuedEmail.objects.enqueue')
 class SendMailHelperTest(TestCase):
 
     def setUp(self):
@@ -21,29 +21,28 @@ class SendMailHelperTest(TestCase):
 
     @override_settings(CANVAS_EMAIL_NOTIFICATION=override_settings_dict)
     def test_send_failure_msg_to_support_invoked_with_correct_args(self,
-                                                                   send_mail):
+                                                                   enqueue):
         """
-        Test that send_mail is called with expected
+        Test that the email is queued with expected
         args passed into send_failure_msg_to_support
         """
         result = send_failure_msg_to_support(self.sis_course_id, self.user,
                                              self.error_detail)
-        send_mail.assert_called_with(
+        enqueue.assert_called_with(
             override_settings_dict['support_email_subject_on_failure'],
             override_settings_dict['support_email_body_on_failure'],
             override_settings_dict['from_email_address'],
-            [override_settings_dict['support_email_address']],
-            fail_silently=ANY
+            [override_settings_dict['support_email_address']]
         )
 
     @override_settings(CANVAS_EMAIL_NOTIFICATION=override_settings_dict)
-    def test_handling_of_send_mail_exception(self, send_mail):
+    def test_handling_of_send_mail_exception(self, enqueue):
         """
         Test to assert that an exception is raised by
-        send_failure_msg_to_support, when the send_mail throws an exception
+        send_failure_msg_to_support, when queueing the email throws an exception
         """
         send_failure_msg_to_support(self.sis_course_id, self.user,
                                     self.error_detail)
-        send_mail.side_effect = Exception
+        enqueue.side_effect = Exception
         self.assertRaises(Exception, send_failure_msg_to_support,
                           self.sis_course_id, self.user, self.error_detail)
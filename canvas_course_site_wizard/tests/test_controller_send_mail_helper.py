@@ -1,5 +1,5 @@
 from unittest import TestCase
-from mock import patch, DEFAULT, ANY
+from mock import patch
 from canvas_course_site_wizard.controller import send_email_helper
 from django.test.utils import override_settings
 
@@ -8,7 +8,7 @@ override_settings_dict = {
 }
 
 
-@patch.multiple('canvas_course_site_wizard.controller', send_mail=DEFAULT)
+@patch('canvas_course_site_wizard.controller.QueuedEmail.objects.enqueue')
 class SendMailHelperTest(TestCase):
     longMessage = True
 
@@ -18,26 +18,25 @@ class SendMailHelperTest(TestCase):
         self.to_address = ['test@test.com']
 
     @override_settings(CANVAS_EMAIL_NOTIFICATION=override_settings_dict)
-    def test_send_mail_invoked_with_correct_args(self, send_mail):
+    def test_email_queued_with_correct_args(self, enqueue):
         """
-        Test that send_mail is called with expected
+        Test that the email is queued with the expected
         args passed into send_email_helper
         """
-        result = send_email_helper(self.subject, self.message, self.to_address)
-        send_mail.assert_called_with(
+        send_email_helper(self.subject, self.message, self.to_address)
+        enqueue.assert_called_with(
             self.subject,
             self.message,
             override_settings_dict['from_email_address'],
-            self.to_address,
-            fail_silently=ANY
+            self.to_address
         )
 
     @override_settings(CANVAS_EMAIL_NOTIFICATION=override_settings_dict)
-    def test_send_mail_on_exception(self, send_mail):
+    def test_send_mail_on_exception(self, enqueue):
         """
         Test to assert that an exception is raised
-        when the send_mail throws an exception
+        when queueing the email throws an exception
         """
-        send_mail.side_effect = Exception
+        enqueue.side_effect = Exception
         self.assertRaises(Exception, send_email_helper, self.subject,
                           self.message, self.to_address)
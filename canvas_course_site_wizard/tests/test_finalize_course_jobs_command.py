@@ -0,0 +1,266 @@
+from django.test import TestCase
+from mock import patch, ANY, DEFAULT
+from canvas_course_site_wizard.models import CanvasCourseGenerationJob
+from canvas_course_site_wizard.management.commands import finalize_course_jobs
+from canvas_course_site_wizard.exceptions import (CanvasCourseAlreadyExistsError, CopySISEnrollmentsError,
+                                                  MarkOfficialError)
+from django.test.utils import override_settings
+
+
+def start_job_with_noargs():
+    cmd = finalize_course_jobs.Command()
+    cmd.handle_noargs()
+
+
+def mock_user_profile(profile_mock, return_value='a@a.com'):
+    profile_mock.return_value = {
+        'primary_email': return_value,
+    }
+
+
+@override_settings(CANVAS_EMAIL_NOTIFICATION={'course_migration_success_subject': 'xyz',
+                                              'course_migration_success_body': 'abc'})
+@patch.multiple(
+    'canvas_course_site_wizard.management.commands.finalize_course_jobs',
+    send_failure_email=DEFAULT,
+    logger=DEFAULT,
+    update_syllabus_body=DEFAULT,
+    finalize_new_canvas_course=DEFAULT,
+    finalize_new_canvas_courses=DEFAULT,
+    send_email_helper=DEFAULT,
+    get_canvas_user_profile=DEFAULT,
+    tech_logger=DEFAULT
+)
+class FinalizeCourseJobsCommandTestCase(TestCase):
+    """
+    tests for the finalize_course_jobs management command.
+    """
+    def setUp(self):
+        self.canvas_course_id = 12345
+        self.sis_course_id = 6789
+        self.content_migration_id = 123
+        self.status_url = 'http://example.com/1234'
+        self.created_by_user_id = '123'
+        self.migration = self.create_migration_job(CanvasCourseGenerationJob.STATUS_COMPLETED)
+
+    def create_migration_job(self, workflow_state, **kwargs):
+        """ Create and return a new CanvasCourseGenerationJob using values in setUp and return """
+        return CanvasCourseGenerationJob.objects.create(
+            canvas_course_id=self.canvas_course_id,
+            sis_course_id=self.sis_course_id,
+            content_migration_id=self.content_migration_id,
+            status_url=self.status_url,
+            created_by_user_id=self.created_by_user_id,
+            workflow_state=workflow_state,
+            **kwargs
+        )
+
+    @patch('canvas_course_site_wizard.management.commands.finalize_course_jobs.CanvasCourseGenerationJob.objects.filter')
+    def test_finalize_course_jobs_filter_called_with(self, filter_mock, **kwargs):
+        """
+        test finalize_course_jobs called CanvasCourseGenerationJob.objects.filter with one argument
+        """
+        start_job_with_noargs()
+        filter_mock.assert_called_once_with(ANY)
+
+    def test_finalize_course_jobs_invokes_correct_methods_on_completed_status(self, get_canvas_user_profile,
+            send_email_helper, **kwargs):
+        """
+        test that the send_email_helper and get_canvas_user_profile helper method are called
+        with the right params when a job whose content migration has completed is finalized
+        """
+
+        mock_user_profile(get_canvas_user_profile)
+
+        start_job_with_noargs()
+        get_canvas_user_profile.assert_called_with(self.created_by_user_id)
+        send_email_helper.assert_called_once_with(ANY, ANY, ANY)
+
+    def test_finalize_course_jobs_sends_failure_email_when_error_in_finalize_method(self, get_canvas_user_profile, finalize_new_canvas_course, send_failure_email, **kwargs):
+        """
+        test that the finalize command sends a failure email notification on any exception raised by finalize_new_canvas_course
+        for a non-bulk created course
+        """
+
+        mock_user_profile(get_canvas_user_profile)
+
+        finalize_new_canvas_course.side_effect = Exception
+        start_job_with_noargs()
+        send_failure_email.assert_called_with(ANY, ANY)
+
+    def test_tech_logger_on_error(self, get_canvas_user_profile, finalize_new_canvas_course,
+            send_failure_email, tech_logger, **kwargs):
+        """ test that tech_logger is called on general error in process (e.g. in finalize method) """
+
+        mock_user_profile(get_canvas_user_profile)
+
+        finalize_new_canvas_course.side_effect = Exception
+        start_job_with_noargs()
+        self.assertEqual(tech_logger.exception.call_count, 1)
+
+    def test_tech_logger_on_renderableexception(self, get_canvas_user_profile, finalize_new_canvas_course,
+            send_failure_email, tech_logger, **kwargs):
+        """ test that tech_logger uses the display_text of a RenderableException when available """
+
+        mock_user_profile(get_canvas_user_profile)
+
+        e = CanvasCourseAlreadyExistsError(self.sis_course_id)
+        finalize_new_canvas_course.side_effect = e
+        start_job_with_noargs()
+        tech_logger.exception.assert_called_with('%s (HUID:%s)' % (e.display_text, self.created_by_user_id))
+
+    def test_finalize_course_jobs_logs_exception_thrown_by_send_email_helper(self, get_canvas_user_profile,
+            send_email_helper, finalize_new_canvas_course, logger, **kwargs):
+        """ Test that an exception is raised when send_email_helper method throws an exception """
+
+        mock_user_profile(get_canvas_user_profile)
+        send_email_helper.side_effect = Exception
+
+        start_job_with_noargs()
+        self.assertTrue(logger.exception.called)
+
+    def test_tech_logger_on_exception_thrown_by_send_email_helper(self, get_canvas_user_profile,
+              send_email_helper, finalize_new_canvas_course, logger, tech_logger, **kwargs):
+        """ Test that tech_logger is called when send_email_helper method throws an exception """
+
+        mock_user_profile(get_canvas_user_profile)
+        send_email_helper.side_effect = Exception
+
+        start_job_with_noargs()
+        self.assertEqual(tech_logger.exception.call_count, 1)
+
+    def test_finalize_course_jobs_logs_exception(self, get_canvas_user_profile, logger, **kwargs):
+        """ Test that an exception is properly logged by the async job """
+        get_canvas_user_profile.side_effect = Exception
+
+        start_job_with_noargs()
+        self.assertTrue(logger.exception.called)
+
+    def test_no_user_profile_when_handling_exception(self, get_canvas_user_profile, finalize_new_canvas_course,
+            logger, **kwargs):
+        """ When handling an exception, if there is not yet a canvas user profile then we should attempt to fetch it """
+        finalize_new_canvas_course.side_effect = Exception
+
+        start_job_with_noargs()
+        self.assertEqual(get_canvas_user_profile.call_count, 1)
+
+    def test_job_workflow_state_saved_when_status_complete_and_finalize_throws_exception(self, get_canvas_user_profile, send_email_helper, finalize_new_canvas_course, **kwargs):
+        """
+        Test that the  CanvasCourseGenerationJob's  workflow state is updated to STATUS_FINALIZE_FAILED
+        when there is an exception in finalizing
+        """
+        finalize_new_canvas_course.side_effect = Exception
+
+        start_job_with_noargs()
+        cm = CanvasCourseGenerationJob.objects.get(pk=self.migration.pk)
+        self.assertEqual(cm.workflow_state, CanvasCourseGenerationJob.STATUS_FINALIZE_FAILED)
+
+    def test_job_workflow_state_saved_after_finalize_success(self, get_canvas_user_profile, send_email_helper, finalize_new_canvas_course, **kwargs):
+        """
+        Test that the  CanvasCourseGenerationJob's  state is updated from 'complete' to
+         CanvasCourseGenerationJob.STATUS_FINALIZED after finalize is  successful
+        """
+
+        start_job_with_noargs()
+        cm = CanvasCourseGenerationJob.objects.get(pk=self.migration.pk)
+        self.assertEqual(cm.workflow_state, CanvasCourseGenerationJob.STATUS_FINALIZED)
+
+    def test_job_workflow_state_saved_when_finalize_fails_during_sync_to_canvas(self, get_canvas_user_profile, send_email_helper, finalize_new_canvas_course, **kwargs):
+        """
+        Test that the  CanvasCourseGenerationJob's workflow state is updated from
+        CanvasCourseGenerationJob.STATUS_COMPLETED to CanvasCourseGenerationJob.STATUS_FINALIZE_FAILED
+        when finalize fails due to CopySISEnrollmentsError Exception(set_sync_to_canvas fails)
+        """
+        finalize_new_canvas_course.side_effect = CopySISEnrollmentsError
+        start_job_with_noargs()
+        cm = CanvasCourseGenerationJob.objects.get(pk=self.migration.pk)
+        self.assertEqual(cm.workflow_state, CanvasCourseGenerationJob.STATUS_FINALIZE_FAILED)
+
+    def test_job_workflow_state_saved_when_finalize_fails_due_to_mark_official(self, get_canvas_user_profile, send_email_helper, finalize_new_canvas_course, **kwargs):
+        """
+        Test that the  CanvasCourseGenerationJob's workflow state is updated from CanvasCourseGenerationJob.STATUS_COMPLETED to
+         CanvasCourseGenerationJob.STATUS_FINALIZE_FAILED when finalize fails due to
+         MarkOfficialError Exception (mark official failure)
+        """
+        finalize_new_canvas_course.side_effect = MarkOfficialError
+        start_job_with_noargs()
+        cm = CanvasCourseGenerationJob.objects.get(pk=self.migration.pk)
+        self.assertEqual(cm.workflow_state, CanvasCourseGenerationJob.STATUS_FINALIZE_FAILED)
+
+    def test_pending_finalize_job_is_finalized(self, finalize_new_canvas_course, **kwargs):
+        """ Jobs that did not need a content migration (pending_finalize) should be finalized too """
+        job = self.create_migration_job(CanvasCourseGenerationJob.STATUS_PENDING_FINALIZE)
+        start_job_with_noargs()
+        self.assertEqual(finalize_new_canvas_course.call_count, 2)
+        cm = CanvasCourseGenerationJob.objects.get(pk=job.pk)
+        self.assertEqual(cm.workflow_state, CanvasCourseGenerationJob.STATUS_FINALIZED)
+
+    def test_running_job_is_not_finalized(self, finalize_new_canvas_course, **kwargs):
+        """ Jobs whose content migration is still running should be left alone """
+        self.migration.workflow_state = CanvasCourseGenerationJob.STATUS_RUNNING
+        self.migration.save()
+        start_job_with_noargs()
+        self.assertFalse(finalize_new_canvas_course.called)
+
+    @override_settings(FINALIZE_COURSE_JOBS={'finalize_concurrency': 4})
+    def test_jobs_finalized_once_each_with_concurrency(self, finalize_new_canvas_course, **kwargs):
+        """ Each job should be finalized exactly once when finalizing in parallel """
+        other_job = self.create_migration_job(CanvasCourseGenerationJob.STATUS_COMPLETED)
+        start_job_with_noargs()
+        self.assertEqual(finalize_new_canvas_course.call_count, 2)
+        cm = CanvasCourseGenerationJob.objects.get(pk=other_job.pk)
+        self.assertEqual(cm.workflow_state, CanvasCourseGenerationJob.STATUS_FINALIZED)
+
+    def test_bulk_subjobs_finalized_together(self, finalize_new_canvas_course, finalize_new_canvas_courses,
+                                             **kwargs):
+        """ Bulk job courses should be finalized with a single batch call rather than one by one """
+        bulk_jobs = [self.create_migration_job(CanvasCourseGenerationJob.STATUS_COMPLETED, bulk_job_id=1)
+                     for i in range(3)]
+        finalize_new_canvas_courses.side_effect = lambda jobs: dict((job.pk, 'url') for job in jobs)
+        start_job_with_noargs()
+        self.assertEqual(finalize_new_canvas_courses.call_count, 1)
+        self.assertEqual(finalize_new_canvas_course.call_count, 1)
+        for job in bulk_jobs:
+            cm = CanvasCourseGenerationJob.objects.get(pk=job.pk)
+            self.assertEqual(cm.workflow_state, CanvasCourseGenerationJob.STATUS_FINALIZED)
+
+    def test_bulk_subjob_failure_attributed_to_its_job(self, finalize_new_canvas_courses, tech_logger, **kwargs):
+        """ A bulk job course that fails in the batch should be the only one marked as failed """
+        failed_job = self.create_migration_job(CanvasCourseGenerationJob.STATUS_COMPLETED, bulk_job_id=1)
+        other_job = self.create_migration_job(CanvasCourseGenerationJob.STATUS_COMPLETED, bulk_job_id=1)
+        finalize_new_canvas_courses.return_value = {failed_job.pk: MarkOfficialError(failed_job.sis_course_id),
+                                                    other_job.pk: 'url'}
+        start_job_with_noargs()
+        cm = CanvasCourseGenerationJob.objects.get(pk=failed_job.pk)
+        self.assertEqual(cm.workflow_state, CanvasCourseGenerationJob.STATUS_FINALIZE_FAILED)
+        cm = CanvasCourseGenerationJob.objects.get(pk=other_job.pk)
+        self.assertEqual(cm.workflow_state, CanvasCourseGenerationJob.STATUS_FINALIZED)
+        self.assertEqual(tech_logger.error.call_count, 1)
+
+    @patch('canvas_course_site_wizard.management.commands.finalize_course_jobs.'
+           'CanvasCourseGenerationJob.objects.transition_many')
+    def test_bulk_subjob_failures_recorded_when_transition_fails(self, transition_many, finalize_new_canvas_courses,
+                                                                 logger, **kwargs):
+        """ If the finalized jobs cannot be moved on, they should be left to retry and failures still recorded """
+        failed_job = self.create_migration_job(CanvasCourseGenerationJob.STATUS_COMPLETED, bulk_job_id=1)
+        other_job = self.create_migration_job(CanvasCourseGenerationJob.STATUS_COMPLETED, bulk_job_id=1)
+        finalize_new_canvas_courses.return_value = {failed_job.pk: MarkOfficialError(failed_job.sis_course_id),
+                                                    other_job.pk: 'url'}
+        transition_many.side_effect = Exception
+        start_job_with_noargs()
+        self.assertEqual(logger.exception.call_count, 1)
+        cm = CanvasCourseGenerationJob.objects.get(pk=failed_job.pk)
+        self.assertEqual(cm.workflow_state, CanvasCourseGenerationJob.STATUS_FINALIZE_FAILED)
+        cm = CanvasCourseGenerationJob.objects.get(pk=other_job.pk)
+        self.assertEqual(cm.workflow_state, CanvasCourseGenerationJob.STATUS_COMPLETED)
+
+    def test_bulk_subjob_left_out_of_batch_when_syllabus_update_fails(self, update_syllabus_body,
+                                                                     finalize_new_canvas_courses, **kwargs):
+        """ A bulk job course whose syllabus could not be updated should fail without being finalized """
+        self.migration.delete()
+        job = self.create_migration_job(CanvasCourseGenerationJob.STATUS_COMPLETED, bulk_job_id=1)
+        update_syllabus_body.side_effect = Exception
+        start_job_with_noargs()
+        self.assertFalse(finalize_new_canvas_courses.called)
+        cm = CanvasCourseGenerationJob.objects.get(pk=job.pk)
+        self.assertEqual(cm.workflow_state, CanvasCourseGenerationJob.STATUS_FINALIZE_FAILED)
@@ -0,0 +1,62 @@
+from unittest import TestCase
+from mock import patch, Mock
+from canvas_course_site_wizard.job_status import publish_job_status, wait_for_job_status
+
+
+@patch('canvas_course_site_wizard.job_status.cache')
+@patch('canvas_course_site_wizard.job_status._get_redis')
+class PublishJobStatusTests(TestCase):
+    def test_state_cached_and_published(self, m_get_redis, m_cache):
+        """ the new state should be stored in the shared cache and published on the job's channel """
+        publish_job_status(42, 'completed')
+        m_cache.set.assert_called_once_with('course-job-status_42', 'completed', 300)
+        m_get_redis.return_value.publish.assert_called_once_with(
+            'canvas_course_creation:course-job-status_42', 'completed')
+
+    def test_redis_failure_not_raised(self, m_get_redis, m_cache):
+        """ a failure to publish should not stop the job being processed """
+        m_get_redis.return_value.publish.side_effect = Exception
+        publish_job_status(42, 'completed')
+
+
+@patch('canvas_course_site_wizard.job_status.cache')
+@patch('canvas_course_site_wizard.job_status._get_redis')
+class WaitForJobStatusTests(TestCase):
+    def setUp(self):
+        self.load_status = Mock(return_value='running')
+
+    def test_changed_state_returned_without_waiting(self, m_get_redis, m_cache):
+        """ a state other than the one the caller knows should be returned straight away """
+        m_cache.get.return_value = 'completed'
+        self.assertEqual(wait_for_job_status(42, 'running', self.load_status, timeout=10), 'completed')
+        pubsub = m_get_redis.return_value.pubsub.return_value
+        pubsub.subscribe.assert_called_once_with('canvas_course_creation:course-job-status_42')
+        self.assertFalse(pubsub.get_message.called)
+        self.assertFalse(self.load_status.called)
+        self.assertTrue(pubsub.close.called)
+
+    def test_uncached_state_loaded_and_cached(self, m_get_redis, m_cache):
+        """ the state should only be read from the database if it is not in the shared cache """
+        m_cache.get.return_value = None
+        self.assertEqual(wait_for_job_status(42, 'queued', self.load_status, timeout=10), 'running')
+        self.assertEqual(self.load_status.call_count, 1)
+        m_cache.add.assert_called_once_with('course-job-status_42', 'running', 300)
+        self.assertFalse(m_cache.set.called)
+
+    def test_published_state_returned(self, m_get_redis, m_cache):
+        """ a caller that knows the current state should be woken by the next published state """
+        m_cache.get.return_value = 'running'
+        pubsub = m_get_redis.return_value.pubsub.return_value
+        pubsub.get_message.side_effect = [None, {'type': 'message', 'data': 'completed'}]
+        self.assertEqual(wait_for_job_status(42, 'running', self.load_status, timeout=10), 'completed')
+        self.assertFalse(self.load_status.called)
+
+    @patch('canvas_course_site_wizard.job_status.time')
+    def test_known_state_returned_on_timeout(self, m_time, m_get_redis, m_cache):
+        """ the known state should be returned if nothing is published before the timeout """
+        m_time.time.side_effect = [0, 5, 11]
+        m_cache.get.return_value = 'running'
+        pubsub = m_get_redis.return_value.pubsub.return_value
+        pubsub.get_message.return_value = None
+        self.assertEqual(wait_for_job_status(42, 'running', self.load_status, timeout=10), 'running')
+        pubsub.get_message.assert_called_once_with(timeout=5)
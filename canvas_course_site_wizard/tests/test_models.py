@@ -1,7 +1,8 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 from itertools import count
 from unittest import TestCase, skip
 from mock import patch, Mock
+from django.utils import timezone
 from icommons_common.models import Course, CourseInstance, Term, School, TermCode
 from canvas_course_site_wizard.models import (
     BulkCanvasCourseCreationJob as BulkJob,
@@ -90,6 +91,13 @@ class BulkCanvasCourseCreationJobIntegrationTests(TestCase):
         self.assertEqual(len(job.get_failed_subjobs()), 3)
         self.assertEqual(job.get_failed_subjobs_count(), 3)
 
+    def test_get_subjob_state_counts_integration(self):
+        """ get_subjob_state_counts() should count the specified bulk job's subjobs in every workflow state """
+        job = BulkJob.objects.get(status=BulkJob.STATUS_FINALIZING)
+        counts = job.get_subjob_state_counts()
+        # Based on fixture data, one subjob in each workflow state
+        self.assertEqual(counts, {state: 1 for (state, _) in SubJob.WORKFLOW_STATUS_CHOICES})
+
     def test_ready_to_finalize_integration_not_ready(self):
         """ bulk jobs not in pending state or with non-terminal subjobs should not be designated as finalizable """
         job_not_pending = BulkJob.objects.get(status=BulkJob.STATUS_SETUP)
@@ -112,6 +120,24 @@ class BulkCanvasCourseCreationJobIntegrationTests(TestCase):
         subjob_finalize_failed.delete()
         subjob_setup_failed.delete()
 
+    def test_get_subjob_progress_counts_integration(self):
+        """ get_subjob_progress_counts() should count intermediate and terminal subjobs per bulk job """
+        job = BulkJob.objects.get(status=BulkJob.STATUS_PENDING)
+        counts = SubJob.objects.get_subjob_progress_counts([job.id])
+        # Based on fixture data, one subjob in each workflow state
+        self.assertEqual(counts, {job.id: {'intermediate': 5, 'terminal': 4}})
+
+    def test_get_jobs_ready_to_finalize_integration(self):
+        """ only pending bulk jobs without intermediate subjobs should be returned as ready to finalize """
+        self.assertEqual(BulkJob.objects.get_jobs_ready_to_finalize(), [])
+        job_pending_and_ready = _create_bulk_job(999, status=BulkJob.STATUS_PENDING)
+        subjob_finalized = _create_subjob(9999, workflow_state=SubJob.STATUS_FINALIZED,
+                                          bulk_job_id=job_pending_and_ready.id)
+        self.assertEqual(BulkJob.objects.get_jobs_ready_to_finalize(), [job_pending_and_ready])
+        # clean up
+        job_pending_and_ready.delete()
+        subjob_finalized.delete()
+
 
 class BulkCanvasCourseCreationJobTests(TestCase):
     @patch('canvas_course_site_wizard.models.BulkCanvasCourseCreationJob.save')
@@ -270,6 +296,95 @@ class CanvasCourseGenerationJobTests(TestCase):
         self.assertEqual(SubJob.objects.filter_failed(bulk_job_id=bulk_job.id).count(), 3)
 
 
+class CanvasCourseGenerationJobTransitionTests(TestCase):
+    def setUp(self):
+        SubJob.objects.all().delete()
+        self.long_ago = timezone.now() - timedelta(days=1)
+        self.queued = _create_subjob(1, workflow_state=SubJob.STATUS_QUEUED)
+        self.running = _create_subjob(2, workflow_state=SubJob.STATUS_RUNNING)
+        self.failed = _create_subjob(3, workflow_state=SubJob.STATUS_FAILED)
+
+    def tearDown(self):
+        SubJob.objects.all().delete()
+
+    def test_transition_many_moves_matching_jobs(self):
+        """ transition_many() should move only the jobs in one of the from_states, and report which moved """
+        moved = SubJob.objects.transition_many(
+            [self.queued.pk, self.running.pk, self.failed.pk],
+            (SubJob.STATUS_QUEUED, SubJob.STATUS_RUNNING),
+            SubJob.STATUS_COMPLETED
+        )
+        self.assertEqual(moved, set([self.queued.pk, self.running.pk]))
+        self.assertEqual(SubJob.objects.get(pk=self.queued.pk).workflow_state, SubJob.STATUS_COMPLETED)
+        self.assertEqual(SubJob.objects.get(pk=self.running.pk).workflow_state, SubJob.STATUS_COMPLETED)
+        self.assertEqual(SubJob.objects.get(pk=self.failed.pk).workflow_state, SubJob.STATUS_FAILED)
+
+    def test_transition_many_only_touches_given_ids(self):
+        """ jobs not in ids should be left alone, even if they are in one of the from_states """
+        moved = SubJob.objects.transition_many([self.queued.pk], (SubJob.STATUS_QUEUED, SubJob.STATUS_RUNNING),
+                                               SubJob.STATUS_COMPLETED)
+        self.assertEqual(moved, set([self.queued.pk]))
+        self.assertEqual(SubJob.objects.get(pk=self.running.pk).workflow_state, SubJob.STATUS_RUNNING)
+
+    def test_transition_many_in_chunks(self):
+        """ ids should be moved in chunks of chunk_size """
+        moved = SubJob.objects.transition_many(
+            [self.queued.pk, self.running.pk],
+            (SubJob.STATUS_QUEUED, SubJob.STATUS_RUNNING),
+            SubJob.STATUS_COMPLETED,
+            chunk_size=1
+        )
+        self.assertEqual(moved, set([self.queued.pk, self.running.pk]))
+
+    def test_transition_many_without_ids(self):
+        """ nothing should be moved when no ids are given """
+        self.assertEqual(SubJob.objects.transition_many([], (SubJob.STATUS_QUEUED,), SubJob.STATUS_COMPLETED), set())
+
+    def test_transition_many_moves_updated_at_on(self):
+        """ the jobs moved should have their updated_at set """
+        SubJob.objects.filter(pk=self.queued.pk).update(updated_at=self.long_ago)
+        SubJob.objects.transition_many([self.queued.pk], (SubJob.STATUS_QUEUED,), SubJob.STATUS_COMPLETED)
+        self.assertGreater(SubJob.objects.get(pk=self.queued.pk).updated_at, self.long_ago)
+
+
+class CanvasCourseGenerationJobUpdatedAtTests(TestCase):
+    def setUp(self):
+        SubJob.objects.all().delete()
+        self.long_ago = timezone.now() - timedelta(days=1)
+        self.job = _create_subjob(1, workflow_state=SubJob.STATUS_QUEUED)
+        SubJob.objects.filter(pk=self.job.pk).update(updated_at=self.long_ago)
+
+    def tearDown(self):
+        SubJob.objects.all().delete()
+
+    def test_saving_workflow_state_moves_updated_at_on(self):
+        """ saving just the workflow_state should also save updated_at """
+        self.job.workflow_state = SubJob.STATUS_RUNNING
+        self.job.save(update_fields=['workflow_state'])
+        self.assertGreater(SubJob.objects.get(pk=self.job.pk).updated_at, self.long_ago)
+
+    @patch('canvas_course_site_wizard.models.publish_job_status')
+    def test_saving_workflow_state_publishes_it(self, m_publish):
+        """ saving the workflow_state of a single course job should publish it to the job's status page """
+        self.job.bulk_job_id = None
+        self.job.workflow_state = SubJob.STATUS_RUNNING
+        self.job.save(update_fields=['workflow_state'])
+        m_publish.assert_called_once_with(self.job.pk, SubJob.STATUS_RUNNING)
+
+    @patch('canvas_course_site_wizard.models.publish_job_status')
+    def test_saving_bulk_subjob_workflow_state_does_not_publish(self, m_publish):
+        """ bulk job courses have no status page, so their workflow_state should not be published """
+        self.job.workflow_state = SubJob.STATUS_RUNNING
+        self.job.save(update_fields=['workflow_state'])
+        self.assertFalse(m_publish.called)
+
+    def test_saving_untracked_field_leaves_updated_at(self):
+        """ saving just fields that are not shown to users (e.g. next_poll_at) should leave updated_at alone """
+        self.job.next_poll_at = timezone.now()
+        self.job.save(update_fields=['next_poll_at'])
+        self.assertEqual(SubJob.objects.get(pk=self.job.pk).updated_at, self.long_ago)
+
+
 class BulkCanvasCourseCreationJobTests(TestCase):
 
     def setUp(self):
@@ -11,7 +11,7 @@ from canvas_course_site_wizard.models_api import (
     select_courses_for_bulk_create,
     get_course_generation_data_for_sis_course_id
 )
-from canvas_course_site_wizard.models import CanvasSchoolTemplate
+from canvas_course_site_wizard.models import CanvasSchoolTemplate, invalidate_school_templates
 from setup_bulk_jobs import create_jobs
 
 
@@ -26,6 +26,8 @@ class ModelsApiTest(TestCase):
         self.bulk_job_id = 215
         self.course_job_id = 1475
         create_jobs(self.school_id, self.term_id)
+        # template rows are rolled back between tests without the cache being invalidated
+        invalidate_school_templates(self.school_id)
 
     def test_single_template_exists_for_school(self):
         """ Data api method should return the template_id for a given school that has a matching row """
@@ -58,6 +60,55 @@ class ModelsApiTest(TestCase):
         with self.assertRaises(MultipleDefaultTemplatesExistForSchool):
             get_default_template_for_school(self.school_id)
 
+    def test_default_template_cache_invalidated_when_template_saved(self):
+        """
+        The cached templates for a school should be refreshed when a template for the school is saved or deleted
+        """
+        template = CanvasSchoolTemplate.objects.create(school_id=self.school_id, template_id=self.template_id)
+        self.assertEqual(get_default_template_for_school(self.school_id).template_id, self.template_id)
+
+        CanvasSchoolTemplate.objects.create(school_id=self.school_id, template_id=self.template_id + 1,
+                                            is_default=True)
+        self.assertEqual(get_default_template_for_school(self.school_id).template_id, self.template_id + 1)
+
+        CanvasSchoolTemplate.objects.filter(template_id=self.template_id + 1).delete()
+        self.assertEqual(get_default_template_for_school(self.school_id).pk, template.pk)
+
+    @patch('canvas_course_site_wizard.models.invalidate_template_course')
+    def test_template_course_cache_invalidated_when_template_saved(self, invalidate_template_course):
+        """
+        The cached Canvas data of a template course should be refreshed when its template is saved or deleted,
+        including the previous template course when the template is pointed at another one
+        """
+        template = CanvasSchoolTemplate.objects.create(school_id=self.school_id, template_id=self.template_id)
+        invalidate_template_course.assert_called_once_with(self.template_id)
+
+        invalidate_template_course.reset_mock()
+        template.template_id = self.template_id + 1
+        template.save()
+        self.assertEqual(sorted(c[0][0] for c in invalidate_template_course.call_args_list),
+                         [self.template_id, self.template_id + 1])
+
+        invalidate_template_course.reset_mock()
+        template.delete()
+        invalidate_template_course.assert_called_once_with(self.template_id + 1)
+
+    def test_default_template_cache_invalidated_for_previous_school(self):
+        """
+        The cached templates for a school should be refreshed when one of its templates is moved to another school
+        """
+        other_school_id = 'hls'
+        invalidate_school_templates(other_school_id)
+        template = CanvasSchoolTemplate.objects.create(school_id=self.school_id, template_id=self.template_id)
+        self.assertEqual(get_default_template_for_school(self.school_id).template_id, self.template_id)
+
+        template.school_id = other_school_id
+        template.save()
+        with self.assertRaises(NoTemplateExistsForSchool):
+            get_default_template_for_school(self.school_id)
+        self.assertEqual(get_default_template_for_school(other_school_id).template_id, self.template_id)
+        invalidate_school_templates(other_school_id)
+
     @patch('canvas_course_site_wizard.models_api.CanvasCourseGenerationJob.objects.get')
     def test_get_course_generation_data_for_sis_course_id_without_bulk_job_id(self, mock_ci):
         """
@@ -0,0 +1,83 @@
+import re
+from unittest import skipUnless
+
+from django.db import connection
+from django.db.models import Q
+from django.test import TestCase
+from django.utils import timezone
+from canvas_course_site_wizard.models import CanvasCourseGenerationJob as SubJob
+
+# a plan step reading the job table (SQLite before 3.36 writes "SCAN TABLE ..." / "SEARCH TABLE ...")
+JOB_TABLE_STEP = re.compile(r'\b(SCAN|SEARCH) (TABLE )?canvas_course_generation_job\b')
+# a step that looks the filtered rows up through an index; "SCAN ... USING INDEX" walks the whole index, so it is
+# no better than a full scan for a filtered query
+INDEX_SEARCH = re.compile(r'\bSEARCH (TABLE )?canvas_course_generation_job '
+                          r'USING (COVERING INDEX|INDEX|INTEGER PRIMARY KEY) .*\(.+\)')
+
+
+@skipUnless(connection.vendor == 'sqlite', 'query plans are checked with SQLite EXPLAIN QUERY PLAN')
+class CanvasCourseGenerationJobQueryPlanTests(TestCase):
+    """
+    Checks that the hot CanvasCourseGenerationJob queries are served by an index rather than a full scan, on a
+    fixture large enough (with statistics gathered by ANALYZE) for the planner to prefer an index when one fits.
+    """
+    def setUp(self):
+        # jobs in every state, but (as in production) most of them finalized
+        states = [state for (state, _) in SubJob.WORKFLOW_STATUS_CHOICES] + [SubJob.STATUS_FINALIZED] * 10
+        SubJob.objects.bulk_create([
+            SubJob(sis_course_id=str(i), bulk_job_id=(i % 200) or None, workflow_state=states[i % len(states)],
+                   created_by_user_id='123')
+            for i in range(5000)
+        ])
+        connection.cursor().execute('ANALYZE')
+
+    def get_query_plan(self, query_set):
+        sql, params = query_set.query.sql_with_params()
+        cursor = connection.cursor()
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+
+    def assertUsesIndex(self, query_set):
+        """ every step of the plan that reads the job table should be an index search on the query's filter """
+        plan = self.get_query_plan(query_set)
+        steps = [step for step in plan.splitlines() if JOB_TABLE_STEP.search(step)]
+        self.assertTrue(steps, 'canvas_course_generation_job not in plan:\n%s' % plan)
+        for step in steps:
+            self.assertIsNotNone(INDEX_SEARCH.search(step), 'canvas_course_generation_job not searched by index:\n%s'
+                                 % plan)
+        return plan
+
+    def test_subjobs_by_state_for_bulk_job(self):
+        """ the intermediate subjobs of a bulk job (ready_to_finalize()) """
+        self.assertUsesIndex(SubJob.objects.filter(workflow_state__in=SubJob.INTERMEDIATE_STATES, bulk_job_id=7))
+
+    def test_failed_subjobs_for_bulk_job(self):
+        """ filter_failed() for a bulk job """
+        self.assertUsesIndex(SubJob.objects.filter_failed(bulk_job_id=7))
+
+    def test_setup_subjobs(self):
+        """ filter_setup_for_bulkjobs() """
+        self.assertUsesIndex(SubJob.objects.filter_setup_for_bulkjobs())
+
+    def test_jobs_due_for_progress_check(self):
+        """ the queued/running jobs selected by process_async_jobs """
+        self.assertUsesIndex(SubJob.objects.filter(
+            (Q(workflow_state=SubJob.STATUS_QUEUED) | Q(workflow_state=SubJob.STATUS_RUNNING)) &
+            (Q(next_poll_at__isnull=True) | Q(next_poll_at__lte=timezone.now()))))
+
+    def test_job_for_course_in_bulk_job(self):
+        """ get_course_generation_data_for_sis_course_id() """
+        self.assertUsesIndex(SubJob.objects.filter(sis_course_id='7', bulk_job_id=7))
+        self.assertUsesIndex(SubJob.objects.filter(sis_course_id='7', bulk_job_id__isnull=True))
+
+    def test_subjobs_for_bulk_job_in_creation_order(self):
+        """ the course_jobs API's default ordering, which should not need a separate sort """
+        plan = self.assertUsesIndex(SubJob.objects.filter(bulk_job_id=7).order_by('created_at'))
+        # the ordered walk should be bounded by the bulk job, not a walk of the whole index
+        self.assertIn('(bulk_job_id=?', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_changed_subjobs_for_bulk_job(self):
+        """ the bulk job subjobs changed since a watermark (bulk_site_creation.api.course_job_changes) """
+        self.assertUsesIndex(SubJob.objects.filter(bulk_job_id=7, updated_at__gt=timezone.now()).values_list(
+            'id', 'workflow_state', 'canvas_course_id'))
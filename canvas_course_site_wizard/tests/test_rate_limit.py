@@ -0,0 +1,65 @@
+from unittest import TestCase
+from mock import patch, Mock
+from canvas_course_site_wizard.rate_limit import RateLimitGovernor
+
+
+def _response(remaining=None, status_code=200, text='{}'):
+    headers = {}
+    if remaining is not None:
+        headers['X-Rate-Limit-Remaining'] = str(remaining)
+    return Mock(status_code=status_code, text=text, headers=headers)
+
+
+class RateLimitGovernorTests(TestCase):
+
+    def setUp(self):
+        self.governor = RateLimitGovernor(low_watermark=200.0, high_watermark=500.0, refill_per_sec=10.0,
+                                          max_in_flight=8, min_in_flight=1, max_wait_secs=30.0)
+
+    @patch('canvas_course_site_wizard.rate_limit.time.sleep')
+    def test_no_delay_while_budget_is_healthy(self, m_sleep):
+        """ requests should not be delayed while the remaining budget is above the low watermark """
+        self.governor.acquire()
+        self.governor.release(_response(remaining=650))
+        self.governor.acquire()
+        self.assertFalse(m_sleep.called)
+        self.assertEqual(self.governor.get_stats()['in_flight_limit'], 8)
+
+    @patch('canvas_course_site_wizard.rate_limit.time.time')
+    @patch('canvas_course_site_wizard.rate_limit.time.sleep')
+    def test_delay_and_limit_reduced_when_budget_is_low(self, m_sleep, m_time):
+        """ a low budget should reduce the in-flight limit and delay the next request until it has refilled """
+        m_time.return_value = 1000.0
+        self.governor.acquire()
+        self.governor.release(_response(remaining=100))
+        self.governor.acquire()
+        m_sleep.assert_called_once_with(10.0)
+        stats = self.governor.get_stats()
+        self.assertEqual(stats['in_flight_limit'], 7)
+        self.assertEqual(stats['delayed'], 1)
+
+    @patch('canvas_course_site_wizard.rate_limit.time.sleep')
+    def test_throttled_response_halves_limit(self, m_sleep):
+        """ a throttled response should halve the in-flight limit and empty the budget estimate """
+        self.governor.acquire()
+        self.governor.release(_response(status_code=403, text='403 Forbidden (Rate Limit Exceeded)'))
+        stats = self.governor.get_stats()
+        self.assertEqual(stats['in_flight_limit'], 4)
+        self.assertEqual(stats['throttled'], 1)
+
+    @patch('canvas_course_site_wizard.rate_limit.time.sleep')
+    def test_limit_recovers_when_budget_is_high(self, m_sleep):
+        """ the in-flight limit should grow back, up to max_in_flight, while the budget is above the high watermark """
+        self.governor.acquire()
+        self.governor.release(_response(status_code=403, text='403 Forbidden (Rate Limit Exceeded)'))
+        for i in range(10):
+            self.governor.acquire()
+            self.governor.release(_response(remaining=650))
+        self.assertEqual(self.governor.get_stats()['in_flight_limit'], 8)
+
+    def test_response_without_header_leaves_limit_unchanged(self):
+        self.governor.acquire()
+        self.governor.release(None)
+        self.governor.acquire()
+        self.governor.release(_response())
+        self.assertEqual(self.governor.get_stats()['in_flight_limit'], 8)
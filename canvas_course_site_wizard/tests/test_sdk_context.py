@@ -0,0 +1,66 @@
+from unittest import TestCase
+
+from mock import patch, Mock
+
+from canvas_course_site_wizard import sdk_context
+from canvas_course_site_wizard.sdk_context import GovernedSession, PooledRequestContext, get_sdk_context
+from canvas_course_site_wizard.worker_pool import map_concurrently
+
+
+class PooledRequestContextTest(TestCase):
+    def setUp(self):
+        self.context = PooledRequestContext(
+            pool_connections=2,
+            pool_maxsize=5,
+            auth_token='token',
+            base_api_url='https://canvas.example.edu/api',
+            session_inactivity_expiration_time_secs=50
+        )
+
+    def test_session_created_once_and_shared_between_threads(self):
+        """ Every thread should get the same session, with the configured pool size mounted for https """
+        sessions = map_concurrently(lambda i: self.context.session, range(10), concurrency=5)
+        self.assertEqual(len(set(id(s) for s in sessions)), 1)
+        adapter = sessions[0].get_adapter('https://canvas.example.edu/api')
+        self.assertEqual(adapter._pool_maxsize, 5)
+        self.assertTrue(adapter._pool_block)
+        self.assertEqual(sessions[0].headers['Authorization'], 'Bearer token')
+
+    def test_connection_stats_before_any_request(self):
+        self.assertEqual(self.context.get_connection_stats()['requests'], 0)
+
+    def test_connection_stats_counts_reused_connections(self):
+        self.context.session
+        pool = Mock(num_requests=10, num_connections=3)
+        with patch.object(self.context._adapter.poolmanager, 'pools', {'canvas': pool}):
+            stats = self.context.get_connection_stats()
+        self.assertEqual(stats, {'hosts': 1, 'requests': 10, 'connections_opened': 3, 'connections_reused': 7})
+
+
+class GetSdkContextTest(TestCase):
+    @patch.object(sdk_context, '_sdk_context', None)
+    def test_context_shared_across_calls(self):
+        self.assertIs(get_sdk_context(), get_sdk_context())
+
+
+class GovernedSessionTest(TestCase):
+    @patch('canvas_course_site_wizard.sdk_context.requests.Session.request')
+    def test_throttled_request_is_retried(self, mock_request):
+        """ A request throttled by Canvas should be sent again, and the governor told about each response """
+        throttled = Mock(status_code=403, text='403 Forbidden (Rate Limit Exceeded)', headers={})
+        ok = Mock(status_code=200, text='{}', headers={'X-Rate-Limit-Remaining': '650.0'})
+        mock_request.side_effect = [throttled, ok]
+        governor = Mock()
+        session = GovernedSession(governor, throttle_retries=3)
+        self.assertIs(session.request('GET', 'https://canvas.example.edu/api/v1/courses/1'), ok)
+        self.assertEqual(governor.acquire.call_count, 2)
+        governor.release.assert_any_call(throttled)
+        governor.release.assert_any_call(ok)
+
+    @patch('canvas_course_site_wizard.sdk_context.requests.Session.request')
+    def test_throttled_response_returned_once_retries_used_up(self, mock_request):
+        throttled = Mock(status_code=403, text='403 Forbidden (Rate Limit Exceeded)', headers={})
+        mock_request.return_value = throttled
+        session = GovernedSession(Mock(), throttle_retries=2)
+        self.assertIs(session.request('GET', 'https://canvas.example.edu/api/v1/courses/1'), throttled)
+        self.assertEqual(mock_request.call_count, 3)
@@ -0,0 +1,95 @@
+import smtplib
+
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+from mock import patch, DEFAULT
+from datetime import timedelta
+from canvas_course_site_wizard.models import QueuedEmail
+from canvas_course_site_wizard.management.commands import send_queued_emails
+
+
+def start_job_with_noargs():
+    cmd = send_queued_emails.Command()
+    cmd.handle_noargs()
+
+
+@override_settings(EMAIL_OUTBOX={'batch_size': 10, 'max_attempts': 3, 'retry_min_interval_secs': 60,
+                                 'retry_max_interval_secs': 3600})
+@patch.multiple(
+    'canvas_course_site_wizard.management.commands.send_queued_emails',
+    get_connection=DEFAULT,
+    EmailMessage=DEFAULT,
+    logger=DEFAULT,
+    tech_logger=DEFAULT
+)
+class SendQueuedEmailsCommandTestCase(TestCase):
+    """
+    tests for the send_queued_emails management command.
+    """
+    def setUp(self):
+        self.email = QueuedEmail.objects.enqueue('subject', 'message', 'from@test.com', ['a@test.com', 'b@test.com'])
+
+    def test_queued_emails_sent_over_one_connection(self, get_connection, EmailMessage, **kwargs):
+        """ All due emails should be sent using a single connection and marked as sent """
+        other_email = QueuedEmail.objects.enqueue('subject 2', 'message 2', 'from@test.com', ['c@test.com'])
+        start_job_with_noargs()
+        self.assertEqual(get_connection.call_count, 1)
+        self.assertEqual(get_connection.return_value.open.call_count, 1)
+        EmailMessage.assert_any_call('subject', 'message', 'from@test.com', ['a@test.com', 'b@test.com'],
+                                     connection=get_connection.return_value)
+        self.assertEqual(EmailMessage.return_value.send.call_count, 2)
+        for email in (self.email, other_email):
+            self.assertEqual(QueuedEmail.objects.get(pk=email.pk).workflow_state, QueuedEmail.STATUS_SENT)
+
+    def test_email_not_sent_before_send_after(self, EmailMessage, **kwargs):
+        """ Emails waiting to be retried should not be sent before they are due """
+        self.email.send_after = timezone.now() + timedelta(minutes=5)
+        self.email.save()
+        start_job_with_noargs()
+        self.assertFalse(EmailMessage.called)
+
+    def test_transient_failure_is_retried_later(self, EmailMessage, **kwargs):
+        """ An email that fails with a transient error should stay queued and be retried after a delay """
+        EmailMessage.return_value.send.side_effect = smtplib.SMTPServerDisconnected
+        start_job_with_noargs()
+        email = QueuedEmail.objects.get(pk=self.email.pk)
+        self.assertEqual(email.workflow_state, QueuedEmail.STATUS_QUEUED)
+        self.assertEqual(email.attempts, 1)
+        self.assertGreater(email.send_after, timezone.now())
+
+    def test_connection_failure_is_retried_later(self, get_connection, EmailMessage, **kwargs):
+        """ If the mail server cannot be reached, the batch should stay queued """
+        get_connection.return_value.open.side_effect = smtplib.SMTPConnectError(421, 'unavailable')
+        start_job_with_noargs()
+        self.assertFalse(EmailMessage.called)
+        email = QueuedEmail.objects.get(pk=self.email.pk)
+        self.assertEqual(email.workflow_state, QueuedEmail.STATUS_QUEUED)
+        self.assertEqual(email.attempts, 1)
+
+    def test_permanent_failure_is_not_retried(self, EmailMessage, tech_logger, **kwargs):
+        """ An email the mail server refuses outright should be marked as failed """
+        EmailMessage.return_value.send.side_effect = smtplib.SMTPRecipientsRefused({})
+        start_job_with_noargs()
+        email = QueuedEmail.objects.get(pk=self.email.pk)
+        self.assertEqual(email.workflow_state, QueuedEmail.STATUS_FAILED)
+        self.assertEqual(tech_logger.error.call_count, 1)
+
+    def test_email_failed_after_max_attempts(self, EmailMessage, tech_logger, **kwargs):
+        """ An email should be marked as failed once it has used up its attempts """
+        self.email.attempts = 2
+        self.email.save()
+        EmailMessage.return_value.send.side_effect = smtplib.SMTPServerDisconnected
+        start_job_with_noargs()
+        email = QueuedEmail.objects.get(pk=self.email.pk)
+        self.assertEqual(email.workflow_state, QueuedEmail.STATUS_FAILED)
+        self.assertEqual(email.attempts, 3)
+        self.assertEqual(tech_logger.error.call_count, 1)
+
+    def test_retry_delay_doubles_up_to_max(self, **kwargs):
+        """ The delay between attempts should double with each attempt, up to the configured maximum """
+        self.assertEqual(send_queued_emails._get_retry_delay(1), 60)
+        self.assertEqual(send_queued_emails._get_retry_delay(2), 120)
+        with self.settings(EMAIL_OUTBOX={'max_attempts': 20, 'retry_min_interval_secs': 60,
+                                         'retry_max_interval_secs': 3600}):
+            self.assertEqual(send_queued_emails._get_retry_delay(10), 3600)
@@ -88,6 +88,35 @@ class SISCourseDataMixinTest(TestCase):
         result = self.course_data.sis_account_id
         self.assertEqual(result, 'school:%s' % school_id)
 
+    def test_resolve_derived_fields_uses_lowest_course_group_pk_without_counting(self):
+        """
+        Test that resolve_derived_fields derives sis_account_id from the (prefetched) course groups
+        without issuing count()/first() queries, and stores the other derived fields.
+        """
+        self.course_data.course = MagicMock(school_id='fas')
+        self.course_data.course.course_groups.all.return_value = [Mock(pk=67890), Mock(pk=12345)]
+        self.course_data.course.departments.all.return_value = [Mock(pk=54321)]
+        self.course_data.short_title = 'A short course title'
+        self.course_data.title = 'A course title'
+        result = self.course_data.resolve_derived_fields()
+        self.assertEqual(result.sis_account_id, 'coursegroup:12345')
+        self.assertEqual(result.course_name, 'A course title')
+        self.assertFalse(self.course_data.course.course_groups.count.called)
+        self.assertFalse(self.course_data.course.course_groups.first.called)
+
+    def test_resolve_derived_fields_returns_school_key_if_no_departments_and_no_course_groups(self):
+        """
+        Test that resolve_derived_fields derives the school sis_account_id when there are no course
+        groups or departments.
+        """
+        self.course_data.course = MagicMock(school_id='fas')
+        self.course_data.course.course_groups.all.return_value = []
+        self.course_data.course.departments.all.return_value = []
+        self.course_data.short_title = 'A short course title'
+        self.course_data.title = None
+        result = self.course_data.resolve_derived_fields()
+        self.assertEqual(result.sis_account_id, 'school:fas')
+
     def test_course_code_returns_short_title_if_exists(self):
         """ Test that result of the course code is the short_title field of the course data object """
         short_title = 'A short course title'
@@ -0,0 +1,27 @@
+import json
+
+from django.test import TestCase, RequestFactory
+from mock import patch, Mock
+from canvas_course_site_wizard.views import CanvasCourseSiteStatusUpdateView
+
+
+@patch('canvas_course_site_wizard.views.wait_for_job_status')
+class CanvasCourseSiteStatusUpdateViewTests(TestCase):
+    def get(self, pk):
+        request = RequestFactory().get('/status/%s/updates' % pk, {'status': 'running'})
+        request.user = Mock(is_authenticated=Mock(return_value=True))
+        return CanvasCourseSiteStatusUpdateView.as_view()(request, pk=str(pk))
+
+    def test_status_returned(self, m_wait):
+        m_wait.return_value = 'finalized'
+        response = self.get(42)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), {'status': 'finalized', 'done': True})
+
+    def test_unknown_job_not_found(self, m_wait):
+        """ an unknown job should be a 404, whether or not Redis could be reached """
+        m_wait.side_effect = lambda job_id, known_status, load_status: load_status()
+        self.assertEqual(self.get(424242).status_code, 404)
+
+        m_wait.side_effect = Exception('redis is down')
+        self.assertEqual(self.get(424242).status_code, 404)
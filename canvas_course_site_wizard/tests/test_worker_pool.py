@@ -0,0 +1,32 @@
+from unittest import TestCase
+from mock import patch, Mock
+from canvas_course_site_wizard.worker_pool import map_concurrently
+
+
+class MapConcurrentlyTests(TestCase):
+
+    def test_results_preserve_item_order(self):
+        """ results should be returned in the same order as the items, whatever the concurrency """
+        items = range(20)
+        self.assertEqual(map_concurrently(lambda x: x * 2, items, concurrency=4), [x * 2 for x in items])
+
+    @patch('canvas_course_site_wizard.worker_pool.ThreadPool')
+    def test_serial_when_concurrency_is_one(self, m_pool):
+        """ no thread pool should be created when concurrency is 1 """
+        func = Mock(return_value='done')
+        self.assertEqual(map_concurrently(func, [1, 2, 3], concurrency=1), ['done'] * 3)
+        self.assertEqual(m_pool.call_count, 0)
+
+    @patch('canvas_course_site_wizard.worker_pool.ThreadPool')
+    def test_pool_size_bounded_by_item_count(self, m_pool):
+        """ the pool should never be larger than the number of items to process """
+        map_concurrently(Mock(), [1, 2], concurrency=10)
+        m_pool.assert_called_once_with(processes=2)
+
+    @patch('canvas_course_site_wizard.worker_pool.connections')
+    def test_worker_connections_closed(self, m_connections):
+        """ database connections opened by worker threads should be closed after each item """
+        m_conn = Mock()
+        m_connections.all.return_value = [m_conn]
+        map_concurrently(lambda x: x, [1, 2, 3], concurrency=3)
+        self.assertEqual(m_conn.close.call_count, 3)
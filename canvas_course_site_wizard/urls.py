@@ -1,9 +1,10 @@
 from django.conf.urls import patterns, url
 
-from .views import (CanvasCourseSiteCreateView, CanvasCourseSiteStatusView)
+from .views import (CanvasCourseSiteCreateView, CanvasCourseSiteStatusView, CanvasCourseSiteStatusUpdateView)
 
 urlpatterns = patterns(
     '',
     url(r'^courses/(?P<pk>\d+)/create$', CanvasCourseSiteCreateView.as_view(), name='ccsw-create'),
-    url(r'^status/(?P<pk>\d+)$', CanvasCourseSiteStatusView.as_view(), name='ccsw-status')
+    url(r'^status/(?P<pk>\d+)$', CanvasCourseSiteStatusView.as_view(), name='ccsw-status'),
+    url(r'^status/(?P<pk>\d+)/updates$', CanvasCourseSiteStatusUpdateView.as_view(), name='ccsw-status-updates')
 )
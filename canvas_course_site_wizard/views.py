@@ -1,5 +1,6 @@
 import logging
-from django.views.generic.base import TemplateView
+from django.http import JsonResponse
+from django.views.generic.base import TemplateView, View
 from django.views.generic.detail import DetailView
 from django.shortcuts import redirect
 from .controller import (
@@ -12,6 +13,7 @@ from canvas_course_site_wizard.mixins import CourseSiteCreationAllowedMixin
 from icommons_ui.mixins import CustomErrorPageMixin
 from canvas_course_site_wizard.exceptions import NoTemplateExistsForSchool
 from canvas_course_site_wizard.models import CanvasCourseGenerationJob
+from canvas_course_site_wizard.job_status import wait_for_job_status
 from braces.views import LoginRequiredMixin
 from django.core.urlresolvers import reverse_lazy
 
@@ -72,3 +74,38 @@ class CanvasCourseSiteStatusView(LoginRequiredMixin, DetailView):
         ]
         context['job_succeeded'] = self.object.workflow_state in [CanvasCourseGenerationJob.STATUS_FINALIZED]
         return context
+
+
+class CanvasCourseSiteStatusUpdateView(LoginRequiredMixin, View):
+    """
+    Long-poll endpoint for the status page: answers with the job's workflow_state as soon as it moves on from
+    the state the page last saw (the status GET parameter), or when JOB_STATUS_UPDATES['wait_timeout_secs']
+    have passed. Waiting requests are woken through Redis pub/sub (see job_status), not by polling the database.
+    If Redis cannot be reached, the state is read from the database and returned straight away.
+    """
+    login_url = reverse_lazy('pin:login')
+
+    def get(self, request, *args, **kwargs):
+        job_id = int(kwargs['pk'])
+
+        def load_status():
+            return CanvasCourseGenerationJob.objects.values_list('workflow_state', flat=True).get(pk=job_id)
+
+        def job_not_found():
+            return JsonResponse({'error': 'Course generation job %s does not exist' % job_id}, status=404)
+
+        try:
+            workflow_state = wait_for_job_status(job_id, request.GET.get('status'), load_status)
+        except CanvasCourseGenerationJob.DoesNotExist:
+            return job_not_found()
+        except Exception:
+            logger.exception("Failed to wait for a status update of course generation job %s", job_id)
+            try:
+                workflow_state = load_status()
+            except CanvasCourseGenerationJob.DoesNotExist:
+                return job_not_found()
+
+        return JsonResponse({
+            'status': workflow_state,
+            'done': workflow_state in CanvasCourseGenerationJob.TERMINAL_STATES
+        })
@@ -0,0 +1,49 @@
+import logging
+
+from multiprocessing.pool import ThreadPool
+
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+
+def _run_with_own_connections(func):
+    """
+    Wraps func so that any database connections opened by the worker thread while running it are closed
+    afterwards. Django keeps one connection per thread, so each task gets its own connection and does not
+    leave it open once the pool is torn down.
+    """
+    def wrapper(item):
+        try:
+            return func(item)
+        finally:
+            for conn in connections.all():
+                conn.close()
+    return wrapper
+
+
+def map_concurrently(func, items, concurrency=1):
+    """
+    Applies func to every item in items using a bounded pool of worker threads and returns the results
+    in the same order as items. If concurrency is 1 or less, items are processed serially in the calling
+    thread (no pool is created and the caller's database connection is reused).
+    Callers are expected to handle per-item failures inside func; an exception raised by func will be
+    re-raised here once the pool has finished.
+    :param func: callable taking a single item
+    :param items: iterable of items to process
+    :param concurrency: maximum number of worker threads
+    :return: list of results
+    """
+    items = list(items)
+    if concurrency <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+
+    pool_size = min(concurrency, len(items))
+    logger.debug("Processing %d items with %d worker threads", len(items), pool_size)
+    pool = ThreadPool(processes=pool_size)
+    try:
+        return pool.map(_run_with_own_connections(func), items, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()